@@ -0,0 +1,550 @@
+"""
+Замеры горячих путей редактора без вывода на экран (QT_QPA_PLATFORM=offscreen).
+
+    python benchmark.py -o results.json
+    python benchmark.py --baseline baseline.json --only open_file
+
+Входные файлы генерируются в `.cache/benchmark` при первом запуске и потом
+переиспользуются. Свой кэш (журналы восстановления, индексы) редактор в замерах ведет
+в подпапке `cache` входных данных, а не в кэше пользователя.
+
+Результат - JSON с минимумом и медианой каждого замера. При сравнении с базовым
+результатом замеры, медиана которых выросла больше чем на `--tolerance`, считаются
+регрессиями, и скрипт завершается с кодом 1.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime
+
+# Модули редактора, включая globals.py, импортируются только внутри функций: папка кэша
+# читается из этой переменной окружения при первом импорте globals, и main успевает ее задать
+CACHE_ENVIRONMENT_VARIABLE = 'EDITOR_CACHE_DIRECTORY'
+FIXTURES_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'benchmark')
+RESULTS_VERSION = 1
+# Сколько секунд ждать окончания одной операции, прежде чем считать замер неудачным.
+WAIT_TIMEOUT_S = 600
+# Допустимое замедление медианы относительно базового результата.
+DEFAULT_TOLERANCE = 0.2
+# Сколько страниц таблицы подгружается в замере прокрутки базы данных.
+DATABASE_SCROLL_PAGES = 50
+# Сколько папок в сгенерированном дереве файлов.
+TREE_DIRECTORIES = 100
+
+STARTUP_CHILD_FLAG = '--startup-child'
+
+# name - имя в результатах; repeats - число повторов по умолчанию;
+# prepare - функция без аргументов, которая готовит входные данные и возвращает
+# функцию одного замера, а та возвращает время в секундах
+Benchmark = namedtuple('Benchmark', ['name', 'repeats', 'prepare'])
+
+
+# Входные данные
+
+def _generate(path, write):
+    """
+    Создает файл или папку `path` функцией `write(временный путь)`, если их еще нет.
+    Данные пишутся рядом и переименовываются, поэтому прерванная генерация не
+    оставляет неполных входных данных.
+    """
+    if os.path.exists(path):
+        return path
+    tmp_path = path + '.tmp'
+    if os.path.isdir(tmp_path):
+        shutil.rmtree(tmp_path)
+    elif os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    print(f"Генерация {os.path.basename(path)}...", file=sys.stderr)
+    write(tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def text_fixture(directory, megabytes) -> str:
+    """
+    Файл Python размером около `megabytes` МБ из однотипных функций.
+    """
+    def write(path):
+        size = megabytes * 1024 * 1024
+        with open(path, 'w', encoding='utf8', newline='\n') as f:
+            number = written = 0
+            while written < size:
+                chunk = ''.join(
+                    f"def function_{i}(argument, value={i}):\n"
+                    f"    # Комментарий к функции {i}\n"
+                    f"    return {{'name': \"function_{i}\", 'result': argument * value + {i % 97}}}\n\n"
+                    for i in range(number, number + 1000))
+                number += 1000
+                written += len(chunk.encode('utf8'))
+                f.write(chunk)
+
+    return _generate(os.path.join(directory, f'text-{megabytes}mb.py'), write)
+
+
+def database_fixture(directory, rows) -> str:
+    """
+    База данных SQLite с одной таблицей из `rows` строк.
+    """
+    def write(path):
+        connection = sqlite3.connect(path)
+        try:
+            connection.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT, value INTEGER, note TEXT)")
+            batch = 10000
+            for start in range(0, rows, batch):
+                connection.executemany("INSERT INTO items VALUES (?, ?, ?, ?)", (
+                    (i, f'item {i}', i * 7 % 1000, f'Заметка к строке {i}')
+                    for i in range(start + 1, min(start + batch, rows) + 1)))
+            connection.commit()
+        finally:
+            connection.close()
+
+    return _generate(os.path.join(directory, f'rows-{rows}.db'), write)
+
+
+def tree_fixture(directory, files) -> str:
+    """
+    Папка из `TREE_DIRECTORIES` подпапок с пустыми файлами, всего `files` файлов.
+    """
+    def write(path):
+        per_directory = max(1, files // TREE_DIRECTORIES)
+        for number in range(TREE_DIRECTORIES):
+            subdirectory = os.path.join(path, f'package_{number:03}')
+            os.makedirs(subdirectory)
+            for i in range(per_directory):
+                open(os.path.join(subdirectory, f'module_{i:05}.py'), 'w').close()
+
+    return _generate(os.path.join(directory, f'tree-{files}'), write)
+
+
+def settings_fixture(directory) -> str:
+    """
+    Копия settings.json без сохраненной сессии, чтобы замеры не открывали файлы
+    пользователя и не меняли его настройки.
+    """
+    from globals import SETTINGS_PATH
+
+    with open(SETTINGS_PATH, 'r', encoding='utf8') as f:
+        settings = json.load(f)
+    settings.pop('Сессия', None)
+    path = os.path.join(directory, 'settings.json')
+    with open(path, 'w', encoding='utf8') as f:
+        json.dump(settings, f, ensure_ascii=False, indent=2)
+    return path
+
+
+# Замеры
+
+def wait_until(condition, timeout=WAIT_TIMEOUT_S):
+    """
+    Обрабатывает события Qt, пока `condition()` не станет истинным.
+    """
+    from PyQt6.QtCore import QCoreApplication, QEventLoop, QTimer
+
+    deadline = time.perf_counter() + timeout
+    # Таймер будит цикл, даже если событий нет
+    timer = QTimer()
+    timer.start(50)
+    try:
+        while not condition():
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"операция не завершилась за {timeout} с")
+            QCoreApplication.processEvents(QEventLoop.ProcessEventsFlag.WaitForMoreEvents)
+    finally:
+        timer.stop()
+
+
+def delete_later_now():
+    """
+    Удаляет объекты, отложенные через `deleteLater`, чтобы память освобождалась между повторами.
+    """
+    from PyQt6.QtCore import QCoreApplication, QEvent
+
+    QCoreApplication.sendPostedEvents(None, QEvent.Type.DeferredDelete.value)
+
+
+class Context:
+    """
+    Общие для замеров объекты: настройки из копии settings.json и панель вкладок.
+    """
+
+    def __init__(self, fixtures):
+        self.fixtures = fixtures
+        self.settings_path = settings_fixture(fixtures)
+        self._settings = None
+        self._tab_manager = None
+
+    @property
+    def settings(self):
+        if self._settings is None:
+            from utils import SettingsInstance
+            self._settings = SettingsInstance(self.settings_path)
+        return self._settings
+
+    @property
+    def tab_manager(self):
+        if self._tab_manager is None:
+            from lexer_registry import lexer_registry
+            from tabmanager import TabManager
+            lexer_registry.configure(self.settings.languages)
+            self._tab_manager = TabManager(theme=self.settings.default_theme,
+                                           large_file_threshold=self.settings.large_file_threshold,
+                                           memory_budget=self.settings.tab_memory_budget)
+        return self._tab_manager
+
+    def close(self):
+        if self._tab_manager is not None:
+            self._tab_manager.recovery.close()
+        if self._settings is not None:
+            self._settings.flush(wait=True)
+
+
+def startup_benchmark(context) -> Benchmark:
+    def prepare():
+        def measure():
+            started = time.perf_counter()
+            process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), STARTUP_CHILD_FLAG, context.settings_path],
+                stdout=subprocess.PIPE, text=True,
+                env=dict(os.environ, QT_QPA_PLATFORM=os.environ.get('QT_QPA_PLATFORM', 'offscreen')))
+            line = process.stdout.readline()
+            elapsed = time.perf_counter() - started
+            process.stdout.close()
+            if process.wait() != 0 or line.strip() != 'ready':
+                raise RuntimeError(f"запуск редактора завершился с кодом {process.returncode}")
+            return elapsed
+        return measure
+    return Benchmark('startup', 5, prepare)
+
+
+def startup_child(settings_path):
+    """
+    Запускается в отдельном процессе: создает окно, дожидается первой отрисовки и сообщает
+    об этом родителю строкой `ready`.
+    """
+    from PyQt6.QtWidgets import QApplication
+
+    from utils import SettingsInstance
+    from window import CustomMainWindow
+
+    app = QApplication(sys.argv[:1])
+    settings = SettingsInstance(settings_path)
+    window = CustomMainWindow(settings)
+    app.processEvents()
+    print('ready', flush=True)
+    window.close()
+    settings.flush(wait=True)
+
+
+def open_file_benchmarks(context, sizes) -> list:
+    """
+    Открытие файла во вкладке: до показа вкладки с началом файла (`_visible`)
+    и до окончания загрузки всего файла.
+    """
+    benchmarks = []
+    for megabytes in sizes:
+        repeats = 5 if megabytes < 100 else 2
+
+        def prepare(megabytes=megabytes, visible=False):
+            path = text_fixture(context.fixtures, megabytes)
+            tab_manager = context.tab_manager
+
+            def measure():
+                started = time.perf_counter()
+                if not tab_manager.show_file(path):
+                    raise RuntimeError(f"не удалось открыть {path}")
+                shown = time.perf_counter() - started
+                widget = tab_manager.currentWidget()
+                wait_until(lambda: not getattr(widget, 'is_loading', False))
+                loaded = time.perf_counter() - started
+                tab_manager.removeTab(tab_manager.indexOf(widget))
+                delete_later_now()
+                return shown if visible else loaded
+            return measure
+
+        benchmarks.append(Benchmark(f'open_file_{megabytes}mb', repeats, prepare))
+        benchmarks.append(Benchmark(f'open_file_{megabytes}mb_visible', repeats,
+                                    lambda prepare=prepare: prepare(visible=True)))
+    return benchmarks
+
+
+def lexer_benchmarks(context) -> list:
+    """
+    Смена лексера и раскраска всего текста из 1 МБ для каждого языка из настроек.
+    """
+    from lexer_registry import DEFAULT_LANGUAGES
+
+    benchmarks = []
+    languages = {}
+    for extension, language in (context.settings.languages or DEFAULT_LANGUAGES).items():
+        languages.setdefault(language, extension)
+    for language, extension in languages.items():
+        def prepare(extension=extension):
+            from PyQt6.Qsci import QsciScintilla
+
+            from editor import CustomEditor
+            from lexer_registry import lexer_registry
+
+            lexer_registry.configure(context.settings.languages)
+            with open(text_fixture(context.fixtures, 1), 'r', encoding='utf8') as f:
+                text = f.read()
+            editor = CustomEditor(context.settings.default_theme)
+            editor.setText(text)
+
+            def measure():
+                editor.setLexer(None)
+                started = time.perf_counter()
+                editor.reload_lexer(f'.{extension}')
+                editor.SendScintilla(QsciScintilla.SCI_COLOURISE, 0, -1)
+                return time.perf_counter() - started
+            return measure
+        benchmarks.append(Benchmark(f'lexer_{language.lower()}', 5, prepare))
+    return benchmarks
+
+
+def database_benchmarks(context, row_counts) -> list:
+    """
+    Открытие таблицы до показа первой страницы и подгрузка следующих
+    `DATABASE_SCROLL_PAGES` страниц.
+    """
+    benchmarks = []
+    for rows in row_counts:
+        def prepare(rows=rows, scroll=False):
+            from db_view import PAGE_SIZE, Database, DatabaseEditor
+
+            path = database_fixture(context.fixtures, rows)
+
+            def measure():
+                started = time.perf_counter()
+                view = DatabaseEditor(Database(path))
+                if view.error_while_reading:
+                    raise RuntimeError(f"не удалось открыть {path}")
+                wait_until(lambda: view.model is not None and view.model.rowCount() > 0)
+                opened = time.perf_counter() - started
+                target = min(rows, (DATABASE_SCROLL_PAGES + 1) * PAGE_SIZE)
+
+                def fetched():
+                    if view.model.rowCount() >= target or not view.model.canFetchMore():
+                        return True
+                    view.model.fetchMore()
+                    return False
+
+                started = time.perf_counter()
+                if scroll:
+                    wait_until(fetched)
+                scrolled = time.perf_counter() - started
+                view.release()
+                view.deleteLater()
+                delete_later_now()
+                return scrolled if scroll else opened
+            return measure
+
+        benchmarks.append(Benchmark(f'database_{rows}_open', 5, prepare))
+        benchmarks.append(Benchmark(f'database_{rows}_scroll', 5,
+                                    lambda prepare=prepare: prepare(scroll=True)))
+    return benchmarks
+
+
+def tree_benchmarks(context, files) -> list:
+    """
+    Открытие папки в дереве файлов и просмотр всех её подпапок по очереди: подпапка
+    раскрывается, читается до конца и сворачивается перед следующей. Раскрытыми все сразу
+    их не оставляют: тогда время уходит на раскладку строк в самом QTreeView.
+    """
+    def prepare(browse=False):
+        from PyQt6.QtCore import QCoreApplication
+
+        from tree import FileTree
+
+        path = tree_fixture(context.fixtures, files)
+
+        def measure():
+            started = time.perf_counter()
+            tree = FileTree()
+            tree.resize(300, 800)
+            tree.set_root(path)
+            tree.show()
+            model = tree.model()
+            root = model.root_index()
+            tree.expand(root)
+            while model.canFetchMore(root):
+                model.fetchMore(root)
+            wait_until(lambda: tree.isVisible())
+            opened = time.perf_counter() - started
+
+            started = time.perf_counter()
+            if browse:
+                for row in range(model.rowCount(root)):
+                    index = model.index(row, 0, root)
+                    tree.expand(index)
+                    while model.canFetchMore(index):
+                        model.fetchMore(index)
+                    QCoreApplication.processEvents()
+                    tree.collapse(index)
+            browsed = time.perf_counter() - started
+            tree.close()
+            tree.deleteLater()
+            delete_later_now()
+            return browsed if browse else opened
+        return measure
+
+    return [
+        Benchmark(f'tree_{files}_open', 5, prepare),
+        Benchmark(f'tree_{files}_browse', 3, lambda: prepare(browse=True)),
+    ]
+
+
+def settings_benchmark(context) -> Benchmark:
+    """
+    Изменение настройки и её запись на диск.
+    """
+    def prepare():
+        settings = context.settings
+        recent = settings.recent_files or []
+        runs = [0]
+
+        def measure():
+            runs[0] += 1
+            started = time.perf_counter()
+            settings.set('Последние файлы', recent[-9:] + [f'benchmark-{runs[0]}.py'])
+            settings.flush(wait=True)
+            return time.perf_counter() - started
+        return measure
+    return Benchmark('settings_save', 20, prepare)
+
+
+def all_benchmarks(context, arguments) -> list:
+    return [
+        startup_benchmark(context),
+        *open_file_benchmarks(context, arguments.sizes),
+        *lexer_benchmarks(context),
+        *database_benchmarks(context, arguments.rows),
+        *tree_benchmarks(context, arguments.tree_files),
+        settings_benchmark(context),
+    ]
+
+
+def run_benchmark(benchmark, repeats) -> dict:
+    try:
+        measure = benchmark.prepare()
+        runs = [measure() for _ in range(repeats)]
+    except Exception as e:
+        print(f"{benchmark.name}: ошибка: {e}", file=sys.stderr)
+        return {'error': str(e)}
+    result = {
+        'repeats': len(runs),
+        'min': min(runs),
+        'median': statistics.median(runs),
+        'max': max(runs),
+        'runs': runs,
+    }
+    print(f"{benchmark.name}: медиана {result['median'] * 1000:.1f} мс, "
+          f"минимум {result['min'] * 1000:.1f} мс", file=sys.stderr)
+    return result
+
+
+# Сравнение с базовым результатом
+
+def compare(results, baseline, tolerance) -> list:
+    """
+    Сравнивает медианы замеров, которые есть в обоих результатах, и печатает таблицу.
+    Возвращает имена замеров, ставших медленнее больше чем на `tolerance`.
+    """
+    regressions = []
+    base = baseline.get('benchmarks', {})
+    print(f"\n{'Замер':<32}{'База, мс':>12}{'Сейчас, мс':>12}{'Изменение':>12}", file=sys.stderr)
+    for name, result in results['benchmarks'].items():
+        before = base.get(name)
+        if not before or 'median' not in before or 'median' not in result:
+            continue
+        ratio = result['median'] / before['median'] if before['median'] else 1
+        mark = ''
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            mark = '  регрессия'
+        print(f"{name:<32}{before['median'] * 1000:>12.1f}{result['median'] * 1000:>12.1f}"
+              f"{(ratio - 1) * 100:>+11.0f}%{mark}", file=sys.stderr)
+    return regressions
+
+
+def parse_numbers(text) -> list:
+    return [int(number) for number in text.split(',') if number.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры горячих путей редактора.")
+    parser.add_argument('-o', '--output', help="куда записать результат в JSON (по умолчанию - стандартный вывод)")
+    parser.add_argument('--baseline', help="базовый результат для сравнения")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="допустимое замедление медианы, доля (по умолчанию %(default)s)")
+    parser.add_argument('--only', action='append', default=[],
+                        help="запускать только замеры, в имени которых есть эта строка")
+    parser.add_argument('--repeat', type=int, help="число повторов каждого замера")
+    parser.add_argument('--list', action='store_true', help="показать имена замеров и выйти")
+    parser.add_argument('--fixtures', default=FIXTURES_DIRECTORY, help="папка для входных данных")
+    parser.add_argument('--sizes', type=parse_numbers, default=[1, 50, 500],
+                        help="размеры открываемых файлов в МБ через запятую")
+    parser.add_argument('--rows', type=parse_numbers, default=[10000, 1000000],
+                        help="число строк таблиц через запятую")
+    parser.add_argument('--tree-files', type=int, default=100000, help="число файлов в дереве")
+    parser.add_argument(STARTUP_CHILD_FLAG, help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    if arguments.startup_child:
+        # Папку кэша процесс получил от родителя в окружении
+        startup_child(arguments.startup_child)
+        return 0
+    os.environ[CACHE_ENVIRONMENT_VARIABLE] = os.path.abspath(os.path.join(arguments.fixtures, 'cache'))
+
+    from PyQt6.QtCore import QT_VERSION_STR
+    from PyQt6.QtWidgets import QApplication
+
+    app = QApplication(sys.argv[:1])
+    os.makedirs(arguments.fixtures, exist_ok=True)
+    context = Context(arguments.fixtures)
+    benchmarks = [benchmark for benchmark in all_benchmarks(context, arguments)
+                  if not arguments.only or any(part in benchmark.name for part in arguments.only)]
+    if arguments.list:
+        print('\n'.join(benchmark.name for benchmark in benchmarks))
+        return 0
+
+    results = {
+        'version': RESULTS_VERSION,
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'qt': QT_VERSION_STR,
+        'platform': platform.platform(),
+        'benchmarks': {},
+    }
+    try:
+        for benchmark in benchmarks:
+            results['benchmarks'][benchmark.name] = run_benchmark(benchmark, arguments.repeat or benchmark.repeats)
+    finally:
+        context.close()
+
+    text = json.dumps(results, ensure_ascii=False, indent=1)
+    if arguments.output:
+        with open(arguments.output, 'w', encoding='utf8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if arguments.baseline:
+        with open(arguments.baseline, 'r', encoding='utf8') as f:
+            regressions = compare(results, json.load(f), arguments.tolerance)
+        if regressions:
+            print(f"\nРегрессии: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
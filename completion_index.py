@@ -0,0 +1,249 @@
+import bisect
+import logging
+import re
+from collections import Counter
+
+from PyQt6.QtCore import QTimer
+
+from globals import LOGGING_LEVEL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOGGING_LEVEL)
+
+# Слова короче трех символов не предлагаются: их быстрее дописать самому.
+WORD_PATTERN = re.compile(r'[^\W\d]\w{2,}')
+# Сколько строк документа индексируется за один шаг первоначального построения.
+BUILD_LINES_PER_STEP = 2000
+# Изменение, затронувшее больше строк, переиндексируется в фоне, а не сразу.
+SYNC_SPLICE_LIMIT = 200
+# Сколько подходящих по префиксу слов просматривается при ранжировании.
+MAX_SCANNED_CANDIDATES = 2000
+# Сколько новых слов копится в отдельном списке, прежде чем он сливается с основным.
+ADDED_WORDS_LIMIT = 4096
+# Сколько строк вокруг курсора считается ближним контекстом.
+PROXIMITY_LINES = 50
+# Веса ранжирования: частота в текущем документе важнее частоты во всех вкладках,
+# а слова рядом с курсором важнее всего.
+DOCUMENT_WEIGHT = 4
+PROXIMITY_WEIGHT = 100
+
+
+def line_words(text) -> list:
+    return WORD_PATTERN.findall(text)
+
+
+class DocumentWords:
+    """
+    Слова одного документа, разложенные по строкам.
+
+    При правке переиндексируются только затронутые строки, а их слова добавляются
+    в общий `CompletionIndex` и убираются из него. Первоначальное построение идет
+    порциями по `BUILD_LINES_PER_STEP` строк в цикле событий, поэтому открытие
+    большого файла не останавливает интерфейс.
+    """
+
+    def __init__(self, index, line_text, line_count):
+        self.index = index
+        # Функция, возвращающая текст строки документа по её номеру
+        self.line_text = line_text
+        self.line_count = line_count
+        self.counts = Counter()
+        # Слова каждой строки; None - строка еще не проиндексирована
+        self.lines = []
+        # Все строки до этой уже проиндексированы
+        self._built_until = 0
+        self._timer = QTimer()
+        self._timer.setInterval(0)
+        self._timer.timeout.connect(self._build_step)
+
+    def reset(self):
+        """
+        Забывает все слова документа и заново индексирует его в фоне.
+        """
+        self._remove_words(self.counts)
+        self.counts = Counter()
+        self.lines = [None] * self.line_count()
+        self._built_until = 0
+        self._timer.start()
+
+    def splice(self, start, old_count, new_count):
+        """
+        Заменяет слова строк [start, start + old_count) словами новых строк
+        [start, start + new_count) документа.
+        """
+        removed = Counter()
+        for words in self.lines[start:start + old_count]:
+            if words:
+                removed.update(words)
+        self._subtract(removed)
+
+        deferred = new_count > SYNC_SPLICE_LIMIT
+        if deferred:
+            fresh = [None] * new_count
+            self._timer.start()
+        else:
+            fresh = [line_words(self.line_text(line)) for line in range(start, start + new_count)]
+            added = Counter()
+            for words in fresh:
+                added.update(words)
+            self._add(added)
+        self.lines[start:start + old_count] = fresh
+
+        # Граница проиндексированной части сдвигается вместе со строками
+        if deferred:
+            self._built_until = min(self._built_until, start)
+        elif self._built_until >= start + old_count:
+            self._built_until += new_count - old_count
+        elif self._built_until > start:
+            self._built_until = start + new_count
+
+    def _build_step(self):
+        end = min(len(self.lines), self._built_until + BUILD_LINES_PER_STEP)
+        added = Counter()
+        for line in range(self._built_until, end):
+            if self.lines[line] is None:
+                words = line_words(self.line_text(line))
+                self.lines[line] = words
+                added.update(words)
+        self._add(added)
+        self._built_until = end
+        if end >= len(self.lines):
+            self._timer.stop()
+
+    def _add(self, words: Counter):
+        self.counts.update(words)
+        self.index.add(words)
+
+    def _subtract(self, words: Counter):
+        self.counts.subtract(words)
+        self.index.remove(words)
+
+    def _remove_words(self, words: Counter):
+        self.index.remove(+words)
+
+    def nearby(self, line) -> dict:
+        """
+        Возвращает слова строк вокруг `line` с расстоянием до ближайшей из них.
+        """
+        distances = {}
+        first = max(0, line - PROXIMITY_LINES)
+        for number, words in enumerate(self.lines[first:line + PROXIMITY_LINES + 1], first):
+            if not words:
+                continue
+            distance = abs(number - line)
+            for word in words:
+                if distances.get(word, distance + 1) > distance:
+                    distances[word] = distance
+        return distances
+
+    def close(self):
+        """
+        Убирает слова документа из общего индекса. Вызывается при закрытии вкладки.
+        """
+        self._timer.stop()
+        self._remove_words(self.counts)
+        self.counts = Counter()
+        self.lines = []
+
+
+class CompletionIndex:
+    """
+    Общий для всех вкладок индекс слов для автодополнения.
+
+    Слова хранятся в отсортированном списке, поэтому поиск по префиксу - это двоичный
+    поиск и просмотр соседних элементов, а не перебор текста. Для каждого слова
+    хранится, сколько раз оно встречается во всех открытых документах.
+
+    Вставка в середину большого списка стоит O(n), поэтому новые слова попадают
+    в небольшой отсортированный список `_added`, который сливается с основным, только
+    когда вырастет до `ADDED_WORDS_LIMIT`. Исчезнувшие слова остаются в списках, пока
+    их не уберет следующее слияние, и при поиске пропускаются по `counts`.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.words = []
+        self._added = []
+        # Сколько слов в списках уже исчезли из документов
+        self._stale = 0
+
+    def document(self, line_text, line_count) -> DocumentWords:
+        return DocumentWords(self, line_text, line_count)
+
+    def add(self, words: Counter):
+        new = []
+        for word, count in words.items():
+            if count <= 0:
+                continue
+            if self.counts[word] <= 0:
+                if self._listed(word):
+                    self._stale -= 1
+                else:
+                    new.append(word)
+            self.counts[word] += count
+        if len(self._added) + len(new) > ADDED_WORDS_LIMIT:
+            self._merge(new)
+        else:
+            for word in new:
+                bisect.insort(self._added, word)
+
+    def remove(self, words: Counter):
+        for word, count in words.items():
+            if count <= 0 or word not in self.counts:
+                continue
+            self.counts[word] -= count
+            if self.counts[word] <= 0:
+                del self.counts[word]
+                self._stale += 1
+        if self._stale > len(self.words) // 2 + ADDED_WORDS_LIMIT:
+            self._merge([])
+
+    @staticmethod
+    def _contains(words, word) -> bool:
+        position = bisect.bisect_left(words, word)
+        return position < len(words) and words[position] == word
+
+    def _listed(self, word) -> bool:
+        return self._contains(self.words, word) or self._contains(self._added, word)
+
+    def _merge(self, new):
+        words = self.words + self._added + new
+        # Timsort находит готовые отсортированные части и только сливает их
+        words.sort()
+        if self._stale:
+            counts = self.counts
+            words = [word for word in words if word in counts]
+        self.words = words
+        self._added = []
+        self._stale = 0
+
+    def complete(self, prefix, document=None, line=0, limit=50) -> list:
+        """
+        Возвращает до `limit` слов, начинающихся с `prefix`, лучшие первыми.
+        Учитываются частота во всех вкладках, частота в `document` и близость
+        к строке `line` этого документа.
+        """
+        if not prefix:
+            return []
+        candidates = []
+        for words in (self.words, self._added):
+            start = bisect.bisect_left(words, prefix)
+            for word in words[start:start + MAX_SCANNED_CANDIDATES]:
+                if not word.startswith(prefix):
+                    break
+                if word != prefix and word in self.counts:
+                    candidates.append(word)
+        if not candidates:
+            return []
+
+        near = document.nearby(line) if document else {}
+        own = document.counts if document else {}
+
+        def score(word):
+            proximity = PROXIMITY_WEIGHT / (1 + near[word]) if word in near else 0
+            return proximity + DOCUMENT_WEIGHT * own.get(word, 0) + self.counts[word]
+
+        return sorted(candidates, key=score, reverse=True)[:limit]
+
+
+completion_index = CompletionIndex()
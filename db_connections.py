@@ -0,0 +1,126 @@
+import fnmatch
+import logging
+import os
+import re
+import threading
+
+from globals import LOGGING_LEVEL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOGGING_LEVEL)
+
+# Профиль, который применяется, если в settings.json нет своего.
+DEFAULT_PROFILE = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -65536,
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+}
+# PRAGMA, которые разрешено задавать в профиле.
+ALLOWED_PRAGMAS = ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store', 'busy_timeout')
+_PRAGMA_VALUE = re.compile(r'^-?[A-Za-z0-9_]+$')
+
+
+def resolve_path(path) -> str:
+    """
+    Приводит путь к виду, по которому один и тот же файл всегда узнается одинаково.
+    """
+    return os.path.normcase(os.path.realpath(path))
+
+
+class ConnectionRegistry:
+    """
+    Общий на весь процесс реестр подключений к файлам баз данных.
+
+    На каждый файл открывается одно подключение, которое раздается всем вкладкам
+    со счетчиком ссылок и закрывается, когда его освобождает последняя из них.
+    К каждому подключению применяется профиль PRAGMA из настроек: профиль с ключом
+    `*` действует для всех файлов, остальные ключи - это шаблоны пути к файлу.
+    """
+
+    def __init__(self):
+        self._connections = {}
+        self._profiles = {'*': DEFAULT_PROFILE}
+        self._lock = threading.Lock()
+
+    def configure(self, profiles: dict | None):
+        """
+        Задает профили PRAGMA. Уже открытые подключения не перенастраиваются.
+        """
+        self._profiles = {'*': DEFAULT_PROFILE}
+        if profiles:
+            self._profiles.update(profiles)
+
+    def profile_for(self, path) -> dict:
+        """
+        Собирает профиль для файла: сначала общий, поверх него все подходящие по шаблону.
+        """
+        resolved = resolve_path(path)
+        profile = dict(self._profiles.get('*', {}))
+        for pattern, pragmas in self._profiles.items():
+            if pattern != '*' and fnmatch.fnmatch(resolved, os.path.normcase(pattern)):
+                profile.update(pragmas)
+        return profile
+
+    def open(self, path, **kwargs):
+        """
+        Открывает новое подключение с профилем файла, не регистрируя его.
+        Используется там, где нужно собственное подключение, например в рабочих потоках.
+        """
+        # sqlite3 загружается только при открытии первой базы данных
+        import sqlite3
+        connection = sqlite3.connect(path, **kwargs)
+        self.apply_profile(connection, path)
+        return connection
+
+    def apply_profile(self, connection, path):
+        import sqlite3
+        for name, value in self.profile_for(path).items():
+            if name not in ALLOWED_PRAGMAS or not _PRAGMA_VALUE.match(str(value)):
+                logger.warning(f"Пропущена недопустимая настройка PRAGMA {name} = {value}")
+                continue
+            try:
+                connection.execute(f"PRAGMA {name} = {value}")
+            except sqlite3.Error as e:
+                logger.warning(f"Не удалось применить PRAGMA {name} = {value}: {e}")
+
+    def acquire(self, path):
+        """
+        Возвращает общее подключение к файлу и увеличивает счетчик его использований.
+        """
+        key = resolve_path(path)
+        with self._lock:
+            entry = self._connections.get(key)
+            if entry is None:
+                entry = [self.open(path), 0]
+                self._connections[key] = entry
+                logger.debug(f"Открыто общее подключение к {key}")
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, path):
+        """
+        Уменьшает счетчик использований подключения и закрывает его, когда он доходит до нуля.
+        """
+        key = resolve_path(path)
+        with self._lock:
+            entry = self._connections.get(key)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self._connections[key]
+        entry[0].close()
+        logger.debug(f"Закрыто общее подключение к {key}")
+
+    def close_all(self):
+        with self._lock:
+            entries = list(self._connections.values())
+            self._connections.clear()
+        for connection, _ in entries:
+            connection.close()
+
+
+registry = ConnectionRegistry()
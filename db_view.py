@@ -1,68 +1,398 @@
 import logging
+from collections import OrderedDict
+from functools import partial
+
 from globals import LOGGING_LEVEL
 
-from PyQt6.Qsci import *
-from PyQt6.QtCore import *
-from PyQt6.QtGui import *
-from PyQt6.QtWidgets import *
-from PyQt6.QtSql import *
+from PyQt6.QtCore import (QAbstractTableModel, QModelIndex, QObject, Qt,
+                          QTimer, pyqtSignal)
+from PyQt6.QtGui import QAction, QContextMenuEvent, QKeyEvent
+from PyQt6.QtWidgets import (QAbstractItemView, QHeaderView, QMenu,
+                             QMessageBox, QTableView)
 
 import sqlite3
 
 from editor import File
+from db_connections import registry
+from query_executor import QueryExecutor
+from tracing import traced
 
 logger = logging.getLogger(__name__)
 logger.setLevel(LOGGING_LEVEL)
 logger.debug("Creating database connection")
 
-class Database:
+# Количество строк, которое подгружается за один запрос к базе данных.
+PAGE_SIZE = 256
+# Сколько страниц строк держится в памяти одновременно.
+MAX_CACHED_PAGES = 64
+# Пауза в редактировании (мс), после которой накопленные изменения записываются в базу.
+FLUSH_DELAY_MS = 2000
+
+
+def quote_identifier(name: str) -> str:
+    """
+    Экранирует имя таблицы или столбца для подстановки в SQL запрос.
+    """
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class Database(QObject):
+    """
+    Подключение к файлу базы данных.
+    
+    Изменения ячеек не записываются сразу, а копятся в буфере (по одному значению на
+    каждую тройку таблица, rowid, столбец) и сбрасываются одной транзакцией: по таймеру
+    после паузы в редактировании или явным вызовом `flush`.
+    """
+    # Количество изменений, которые еще не записаны в базу данных
+    pendingChanged = pyqtSignal(int)
+
     def __init__(self, file: File | str):
+        super(Database, self).__init__()
         self.error_while_reading = False
         self.file = file if isinstance(file, File) else File(file)
+        self._pending_edits = {}
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(FLUSH_DELAY_MS)
+        self._flush_timer.timeout.connect(self.flush)
+        self.connection = None
         try:
-            self.connection = sqlite3.connect(self.file.path)
+            self.connection = registry.acquire(self.file.path)
             logger.debug(f"Подключение к базе данных {self.file.path} успешно")
-        except sqlite3.OperationalError as e:
+        except sqlite3.Error as e:
             logger.error(f"Не удалось открыть базу данных: {e}")
             QMessageBox.critical(None, "Ошибка", f"Не удалось открыть базу данных: {e}")
             self.error_while_reading = True
             return
         self.cursor = self.connection.cursor()
-        self.current_table = self.get_tables()[0][0]
-        # select current table
-        self.cursor.execute(f"SELECT * FROM {self.current_table}")
-        
-        self.tables = self.get_tables()
+        # Заполняются редактором после асинхронного чтения схемы
+        self.tables = []
+        self.current_table = None
         
     def get_tables(self) -> list:
         self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
         return self.cursor.fetchall()
     
     def get_columns(self, table):
-        self.cursor.execute(f"PRAGMA table_info({table})")
+        self.cursor.execute(f"PRAGMA table_info({quote_identifier(table)})")
         return self.cursor.fetchall()
     
     def execute(self, query) -> list:
         self.cursor.execute(query)
         return self.cursor.fetchall()
+
+    @staticmethod
+    def page_query(table) -> str:
+        """
+        Возвращает запрос страницы таблицы с параметрами (rowid, limit): до `limit` строк,
+        у которых rowid больше переданного. Первым элементом каждой строки идет её rowid.
+        
+        Выборка идет по индексу rowid, поэтому стоимость запроса не зависит от того,
+        насколько далеко от начала таблицы находится страница.
+        """
+        return f"SELECT rowid, * FROM {quote_identifier(table)} WHERE rowid > ? ORDER BY rowid LIMIT ?"
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending_edits)
+
+    def pending_value(self, table, rowid, column, default=None):
+        """
+        Возвращает еще не записанное значение ячейки или `default`, если ячейка не менялась.
+        """
+        return self._pending_edits.get((table, rowid, column), default)
     
     def edit_element(self, column, value, table, identifier):
-        table = table if table else self.table
-        command = f"UPDATE {table} SET {column} = '{value}' WHERE id = {identifier}"
-        logger.debug(command)
-        self.cursor.execute(command)
-        self.connection.commit()
+        """
+        Ставит изменение ячейки в очередь на запись. Повторные изменения той же ячейки
+        заменяют предыдущее значение.
+        """
+        table = table if table else self.current_table
+        self._pending_edits[(table, identifier, column)] = value
+        self.file.saved = False
+        self._flush_timer.start()
+        self.pendingChanged.emit(self.pending_count)
+
+    @traced
+    def flush(self) -> bool:
+        """
+        Записывает все накопленные изменения одной транзакцией.
+        
+        :return: True, если изменения записаны, False, если транзакция была отменена
+        """
+        self._flush_timer.stop()
+        if not self._pending_edits:
+            return True
+
+        grouped = {}
+        for (table, identifier, column), value in self._pending_edits.items():
+            grouped.setdefault((table, column), []).append((value, identifier))
+
+        try:
+            with self.connection:
+                for (table, column), params in grouped.items():
+                    command = f"UPDATE {quote_identifier(table)} SET {quote_identifier(column)} = ? WHERE rowid = ?"
+                    logger.debug(f"{command} x{len(params)}")
+                    self.connection.executemany(command, params)
+        except sqlite3.Error as e:
+            logger.error(f"Не удалось записать изменения: {e}")
+            QMessageBox.critical(None, "Ошибка", f"Не удалось записать изменения: {e}")
+            return False
+
+        self._pending_edits.clear()
+        self.file.saved = True
+        self.pendingChanged.emit(0)
+        return True
         
-    def delete_element(self, table, row_id):
-        self.cursor.execute(f"DELETE FROM {table} WHERE id = {row_id}")
-        self.connection.commit()
+    def discard(self):
+        """
+        Отбрасывает накопленные изменения, не записывая их.
+        """
+        self._flush_timer.stop()
+        self._pending_edits.clear()
+        self.file.saved = True
+        self.pendingChanged.emit(0)
+
+    def close(self, discard=False) -> bool:
+        """
+        Записывает накопленные изменения (или отбрасывает их, если `discard`)
+        и освобождает общее подключение к файлу.
+
+        :return: False, если изменения записать не удалось: тогда подключение
+            не освобождается, а изменения остаются в буфере
+        """
+        if self.error_while_reading or self.connection is None:
+            return True
+        if discard:
+            self.discard()
+        elif not self.flush():
+            return False
+        self.cursor.close()
+        self.connection = None
+        registry.release(self.file.path)
+        return True
         
-    def add_element(self, table, values):
-        self.cursor.execute(f"INSERT INTO {table} VALUES ({values})")
-        self.connection.commit()
+    def delete_element(self, table, row_id) -> bool:
+        """
+        Удаляет строку, предварительно записав накопленные изменения.
+
+        :return: False, если накопленные изменения записать не удалось и строка не удалена
+        """
+        if not self.flush():
+            return False
+        with self.connection:
+            self.connection.execute(f"DELETE FROM {quote_identifier(table)} WHERE rowid = ?", (row_id,))
+        return True
+
+    def add_element(self, table, values) -> bool:
+        """
+        Добавляет строку, предварительно записав накопленные изменения.
+
+        :return: False, если накопленные изменения записать не удалось и строка не добавлена
+        """
+        if not self.flush():
+            return False
+        placeholders = ",".join("?" for _ in values)
+        with self.connection:
+            self.connection.execute(f"INSERT INTO {quote_identifier(table)} VALUES ({placeholders})", tuple(values))
+        return True
+
+
+class LazyTableModel(QAbstractTableModel):
+    """
+    Модель таблицы базы данных, которая подгружает строки страницами по мере прокрутки.
+    
+    Страницы выбираются по ключу rowid (`WHERE rowid > ? LIMIT ?`), а в памяти хранится
+    не более `max_pages` последних использованных страниц. Для вытесненных страниц
+    запоминается только rowid, с которого они начинаются, поэтому при возврате к ним
+    страница перечитывается одним запросом.
+    
+    Все запросы выполняются через `QueryExecutor`, так что пока страница не пришла,
+    её ячейки остаются пустыми, а интерфейс не блокируется.
+    """
+
+    def __init__(self, database: Database, executor: QueryExecutor, table: str, columns: list,
+                 page_size=PAGE_SIZE, max_pages=MAX_CACHED_PAGES, parent=None):
+        super(LazyTableModel, self).__init__(parent)
+        self.database = database
+        self.executor = executor
+        self.table = table
+        self.columns = columns
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self._query = Database.page_query(table)
+        self._fetch_job = None
+        self._loading = {}
+        self._reset_state()
+
+    def _reset_state(self):
+        if self._fetch_job:
+            self._fetch_job.cancel()
+        for job in self._loading.values():
+            job.cancel()
+        # rowid, после которого начинается i-я страница
+        self._page_keys = []
+        self._pages = OrderedDict()
+        self._last_key = -1 << 63
+        self._row_count = 0
+        self._exhausted = False
+        self._fetch_job = None
+        self._loading = {}
+
+    def refresh(self):
+        """
+        Сбрасывает все загруженные страницы, строки будут подгружены заново.
+        """
+        self.beginResetModel()
+        self._reset_state()
+        self.endResetModel()
+
+    def _cache_page(self, page, rows):
+        self._pages[page] = rows
+        self._pages.move_to_end(page)
+        while len(self._pages) > self.max_pages:
+            self._pages.popitem(last=False)
+
+    def _page(self, page):
+        rows = self._pages.get(page)
+        if rows is None:
+            self._request_page(page)
+        else:
+            self._pages.move_to_end(page)
+        return rows
+
+    def _request_page(self, page):
+        if page in self._loading:
+            return
+        job = self.executor.submit(self._query, (self._page_keys[page], self.page_size), self.page_size)
+        job.signals.batch.connect(partial(self._on_page_loaded, job, page))
+        for signal in (job.signals.finished, job.signals.failed, job.signals.cancelled):
+            signal.connect(partial(self._on_page_done, job, page))
+        self._loading[page] = job
+
+    def _on_page_loaded(self, job, page, rows):
+        if self._loading.get(page) is not job:
+            return
+        self._cache_page(page, rows)
+        first = page * self.page_size
+        last = min(first + self.page_size, self._row_count) - 1
+        self.dataChanged.emit(self.index(first, 0), self.index(last, len(self.columns) - 1))
+
+    def _on_page_done(self, job, page, *args):
+        if self._loading.get(page) is job:
+            del self._loading[page]
+
+    def _row(self, row):
+        rows = self._page(row // self.page_size)
+        offset = row % self.page_size
+        # Строки могли быть удалены в обход модели
+        return rows[offset] if rows is not None and offset < len(rows) else None
+
+    def rowid(self, row):
+        """
+        Возвращает rowid строки модели с номером `row` или None, если строка еще не загружена.
+        """
+        record = self._row(row)
+        return record[0] if record else None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._row_count
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted or self._fetch_job:
+            return
+        job = self.executor.submit(self._query, (self._last_key, self.page_size), self.page_size)
+        job.signals.batch.connect(partial(self._on_fetched, job))
+        job.signals.finished.connect(partial(self._on_fetch_finished, job))
+        job.signals.failed.connect(partial(self._on_fetch_failed, job))
+        job.signals.cancelled.connect(partial(self._on_fetch_cancelled, job))
+        self._fetch_job = job
+
+    def _on_fetched(self, job, rows):
+        if job is not self._fetch_job:
+            return
+        page = len(self._page_keys)
+        self.beginInsertRows(QModelIndex(), self._row_count, self._row_count + len(rows) - 1)
+        self._page_keys.append(self._last_key)
+        self._cache_page(page, rows)
+        self._last_key = rows[-1][0]
+        self._row_count += len(rows)
+        self.endInsertRows()
+
+    def _on_fetch_finished(self, job, total):
+        if job is not self._fetch_job:
+            return
+        self._fetch_job = None
+        if total < self.page_size:
+            self._exhausted = True
+
+    def _on_fetch_failed(self, job, *args):
+        if job is not self._fetch_job:
+            return
+        self._fetch_job = None
+        # Повторять упавший запрос при каждой прокрутке бессмысленно
+        self._exhausted = True
+
+    def _on_fetch_cancelled(self, job):
+        # Отмененную подгрузку можно повторить при следующей прокрутке
+        if job is self._fetch_job:
+            self._fetch_job = None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role not in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            return None
+        record = self._row(index.row())
+        if record is None:
+            return None
+        value = record[index.column() + 1]
+        if self.database.pending_count:
+            value = self.database.pending_value(self.table, record[0], self.columns[index.column()], value)
+        if role == Qt.ItemDataRole.DisplayRole and value is None:
+            return 'NULL'
+        return value if isinstance(value, (int, float, str)) or value is None else str(value)
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        if not index.isValid() or role != Qt.ItemDataRole.EditRole:
+            return False
+        record = self._row(index.row())
+        if record is None:
+            return False
+        # Пока изменение не записано, data() берет значение из буфера базы данных,
+        # а после записи - из загруженной страницы, поэтому она обновляется сразу
+        self.database.edit_element(self.columns[index.column()], value, self.table, record[0])
+        page, offset = divmod(index.row(), self.page_size)
+        rows = self._pages.get(page)
+        if rows is not None and offset < len(rows):
+            updated = list(rows[offset])
+            updated[index.column() + 1] = value
+            rows[offset] = tuple(updated)
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemFlag.NoItemFlags
+        return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable | Qt.ItemFlag.ItemIsEditable
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return self.columns[section] if section < len(self.columns) else None
+        return section + 1
 
 
 class DatabaseEditor(QTableView):
+    # Запрошено открытие SQL консоли для файла базы данных
+    sqlConsoleRequested = pyqtSignal(str)
+
     def __init__(self, database: Database, *args, **kwargs):
         super(DatabaseEditor, self).__init__(*args, **kwargs)
         
@@ -72,50 +402,102 @@ class DatabaseEditor(QTableView):
         if database.error_while_reading:
             self.error_while_reading = True
             return
-        self.model = QStandardItemModel()
-        self.setModel(self.model)
+        self.model = None
+        self.executor = QueryExecutor(database.file.path, parent=self)
         
         self.setEditTriggers(QAbstractItemView.EditTrigger.AllEditTriggers)
+        # Подгонка размеров под содержимое заставила бы модель прочитать все строки
+        self.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
         
-        self.update()
+        self.load_schema()
+
+    def load_schema(self):
+        """
+        Асинхронно читает список таблиц и столбцы первой из них, после чего создает модель.
+        """
+        tables = []
+        job = self.executor.submit("SELECT name FROM sqlite_master WHERE type='table';")
+        job.signals.batch.connect(tables.extend)
+        job.signals.finished.connect(lambda _: self._on_tables_loaded(tables))
+        job.signals.failed.connect(self._on_query_failed)
+
+    def _on_tables_loaded(self, tables):
+        self.database.tables = tables
+        self.database.current_table = tables[0][0] if tables else None
+        if not self.database.current_table:
+            return
+        columns = []
+        job = self.executor.submit(f"PRAGMA table_info({quote_identifier(self.database.current_table)})")
+        job.signals.batch.connect(columns.extend)
+        job.signals.finished.connect(lambda _: self._on_columns_loaded([column[1] for column in columns]))
+        job.signals.failed.connect(self._on_query_failed)
+
+    def _on_columns_loaded(self, columns):
+        self.model = LazyTableModel(self.database, self.executor, self.database.current_table, columns, parent=self)
+        self.model.rowsInserted.connect(self._resize_columns_once)
+        self.setModel(self.model)
+        self.model.fetchMore()
+
+    def _resize_columns_once(self):
+        # Ширина столбцов считается только по первой загруженной странице
+        self.model.rowsInserted.disconnect(self._resize_columns_once)
+        self.resizeColumnsToContents()
+
+    def _on_query_failed(self, message):
+        QMessageBox.critical(self, "Ошибка", f"Не удалось прочитать базу данных: {message}")
         
+    @traced
     def update(self):
-        self.model.clear()
-        self.model.setHorizontalHeaderLabels([column[1] for column in self.database.get_columns(self.database.tables[0][0])])
-        for row in self.database.execute(f"SELECT * FROM {self.database.tables[0][0]}"):
-            items = [QStandardItem(str(item)) for item in row]
-            self.model.appendRow(items)
-        self.resizeColumnsToContents()
-        self.resizeRowsToContents()
+        if not self.model:
+            return
+        self.model.refresh()
         
     def contextMenuEvent(self, event: QContextMenuEvent):
         menu = QMenu(self)
         add_element_action = QAction("Добавить элемент", self)
         add_element_action.triggered.connect(self.add_element)
         menu.addAction(add_element_action)
+        apply_action = QAction(f"Применить изменения ({self.database.pending_count})", self)
+        apply_action.setEnabled(self.database.pending_count > 0)
+        apply_action.triggered.connect(self.apply)
+        menu.addAction(apply_action)
+        menu.addSeparator()
+        console_action = QAction("Открыть SQL консоль", self)
+        console_action.triggered.connect(lambda: self.sqlConsoleRequested.emit(self.file.path))
+        menu.addAction(console_action)
         menu.exec(event.globalPos())
         
         super(DatabaseEditor, self).contextMenuEvent(event)
         
     def add_element(self):
-        self.model.appendRow([QStandardItem() for _ in range(self.model.columnCount())])
-        self.database.add_element(self.database.tables[0][0], ",".join(["NULL" for _ in range(self.model.columnCount())]))
-        self.update()
-        
+        if not self.model:
+            return
+        if self.database.add_element(self.model.table, [None] * self.model.columnCount()):
+            self.update()
+
+    def apply(self):
+        """
+        Записывает в базу данных все накопленные изменения.
+        """
+        self.database.flush()
+
+    def release(self):
+        """
+        Останавливает запросы и освобождает подключения. Вызывается при закрытии вкладки.
+        """
+        if self.error_while_reading:
+            return
+        self.executor.close()
+        self.database.close()
         
     def keyPressEvent(self, event: QKeyEvent):
-        if event.key() == Qt.Key.Key_Delete:
-            self.database.delete_element(self.model.item(self.currentIndex().row(), 0).text(), self.currentIndex().row())
-            self.update()
+        if event.key() == Qt.Key.Key_Escape:
+            # Прерывает запросы, которые еще выполняются
+            self.executor.cancel_all()
+        if event.key() == Qt.Key.Key_Delete and self.model and self.currentIndex().isValid():
+            rowid = self.model.rowid(self.currentIndex().row())
+            if rowid is not None:
+                if self.database.delete_element(self.model.table, rowid):
+                    self.update()
             
         super(DatabaseEditor, self).keyPressEvent(event)
-        
-    def dataChanged(self, topLeft: QModelIndex, bottomRight: QModelIndex, roles: list[int]):
-        element = self.model.item(topLeft.row(), topLeft.column()).text()
-        column = self.model.horizontalHeaderItem(topLeft.column()).text()
-        table = self.database.current_table
-        identifier = topLeft.row() + 1
-        self.database.edit_element(column, element, table, identifier)
-
-        
-    
\ No newline at end of file
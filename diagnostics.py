@@ -0,0 +1,267 @@
+import bisect
+import logging
+import multiprocessing
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from functools import partial
+
+from PyQt6.Qsci import QsciScintilla
+from PyQt6.QtCore import QObject, QPoint, QTimer, pyqtSignal
+from PyQt6.QtGui import QColor
+from PyQt6.QtWidgets import QToolTip
+
+from diagnostics_worker import ERROR, check
+from globals import LOGGING_LEVEL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOGGING_LEVEL)
+
+# Через сколько миллисекунд после последней правки файл проверяется.
+DIAGNOSTICS_DELAY_MS = 600
+# Сколько строк выше и ниже видимой части получают отметки, чтобы при прокрутке
+# на несколько экранов их не приходилось перерисовывать.
+VISIBLE_MARGIN_LINES = 200
+# Файлы больше этого (в символах) не проверяются: текст передается в процесс пула целиком.
+MAX_CHECKED_LENGTH = 2 * 1024 * 1024
+# Процессов проверки немного: задачи маленькие, а пул поиска по файлам занят своими.
+DIAGNOSTICS_WORKERS = 2
+
+LANGUAGES = {'.py': 'python', '.pyw': 'python', '.json': 'json'}
+
+ERROR_MARKER = 20
+WARNING_MARKER = 21
+DIAGNOSTICS_MARGIN = 0
+
+
+class EditorDiagnostics(QObject):
+    """
+    Результаты проверки одной вкладки и их отметки в редакторе: подчеркивание
+    индикаторами и значки на полях.
+
+    Отметки ставятся только для видимых строк с запасом `VISIBLE_MARGIN_LINES`
+    и переставляются при прокрутке за пределы отмеченного участка, поэтому файл
+    с тысячами предупреждений прокручивается так же, как без них.
+    """
+
+    def __init__(self, editor, parent=None):
+        super(EditorDiagnostics, self).__init__(parent)
+        self.editor = editor
+        self.version = 0
+        self.future = None
+        self.diagnostics = []
+        self._lines = []
+        # Есть ли в редакторе отметки
+        self._painted = False
+        self._painted_range = None
+
+        self.error_indicator = editor.indicatorDefine(QsciScintilla.IndicatorStyle.SquiggleIndicator)
+        editor.setIndicatorForegroundColor(QColor('#e53935'), self.error_indicator)
+        self.warning_indicator = editor.indicatorDefine(QsciScintilla.IndicatorStyle.SquiggleIndicator)
+        editor.setIndicatorForegroundColor(QColor('#f9a825'), self.warning_indicator)
+
+        editor.markerDefine(QsciScintilla.MarkerSymbol.Circle, ERROR_MARKER)
+        editor.setMarkerBackgroundColor(QColor('#e53935'), ERROR_MARKER)
+        editor.markerDefine(QsciScintilla.MarkerSymbol.Circle, WARNING_MARKER)
+        editor.setMarkerBackgroundColor(QColor('#f9a825'), WARNING_MARKER)
+        mask = (1 << ERROR_MARKER) | (1 << WARNING_MARKER)
+        editor.setMarginType(DIAGNOSTICS_MARGIN, QsciScintilla.MarginType.SymbolMargin)
+        editor.setMarginWidth(DIAGNOSTICS_MARGIN, 12)
+        editor.setMarginMarkerMask(DIAGNOSTICS_MARGIN, mask)
+        # Иначе значки рисуются и поверх номеров строк
+        editor.setMarginMarkerMask(1, 0)
+
+        editor.SendScintilla(QsciScintilla.SCI_SETMOUSEDWELLTIME, 500)
+        editor.SCN_DWELLSTART.connect(self._on_dwell_start)
+        editor.SCN_DWELLEND.connect(lambda *args: QToolTip.hideText())
+        editor.verticalScrollBar().valueChanged.connect(self.paint)
+
+    def set_diagnostics(self, diagnostics):
+        self.diagnostics = diagnostics
+        self._lines = [diagnostic[0] for diagnostic in diagnostics]
+        self._clear()
+        self.paint()
+
+    def _visible_range(self):
+        editor = self.editor
+        first = editor.SendScintilla(QsciScintilla.SCI_DOCLINEFROMVISIBLE,
+                                     editor.SendScintilla(QsciScintilla.SCI_GETFIRSTVISIBLELINE))
+        count = editor.SendScintilla(QsciScintilla.SCI_LINESONSCREEN)
+        return first, first + count
+
+    def paint(self, *args):
+        """
+        Отмечает проблемы около видимой части, если она вышла за уже отмеченный участок.
+        """
+        if not self.diagnostics and not self._painted:
+            return
+        first, last = self._visible_range()
+        if self._painted_range and self._painted_range[0] <= first and last <= self._painted_range[1]:
+            return
+        self._clear()
+        start = max(0, first - VISIBLE_MARGIN_LINES)
+        end = last + VISIBLE_MARGIN_LINES
+        self._painted_range = (start, end)
+
+        editor = self.editor
+        line_count = editor.lines()
+        for i in range(bisect.bisect_left(self._lines, start), bisect.bisect_right(self._lines, end)):
+            line, column, end_column, severity, message = self.diagnostics[i]
+            if line >= line_count:
+                break
+            text_end = len(editor.text(line).rstrip('\r\n'))
+            column = min(column, text_end)
+            if end_column <= column:
+                # Без точного конца подчеркивается слово, а в начале строки - вся строка
+                word_end = editor.SendScintilla(QsciScintilla.SCI_WORDENDPOSITION,
+                                                editor.positionFromLineIndex(line, column), True)
+                _, end_column = editor.lineIndexFromPosition(word_end)
+                if column == 0 or end_column <= column:
+                    end_column = text_end
+            indicator = self.error_indicator if severity == ERROR else self.warning_indicator
+            end_column = max(min(end_column, text_end), column)
+            if end_column > column:
+                editor.fillIndicatorRange(line, column, line, end_column, indicator)
+            marker = ERROR_MARKER if severity == ERROR else WARNING_MARKER
+            editor.markerAdd(line, marker)
+            self._painted = True
+
+    def _clear(self):
+        # Scintilla сдвигает отметки вместе с текстом, поэтому они снимаются по типу,
+        # а не по строкам, на которых были поставлены
+        editor = self.editor
+        if self._painted:
+            editor.markerDeleteAll(ERROR_MARKER)
+            editor.markerDeleteAll(WARNING_MARKER)
+            length = editor.SendScintilla(QsciScintilla.SCI_GETLENGTH)
+            for indicator in (self.error_indicator, self.warning_indicator):
+                editor.SendScintilla(QsciScintilla.SCI_SETINDICATORCURRENT, indicator)
+                editor.SendScintilla(QsciScintilla.SCI_INDICATORCLEARRANGE, 0, length)
+        self._painted = False
+        self._painted_range = None
+
+    def messages_at(self, line) -> list:
+        start = bisect.bisect_left(self._lines, line)
+        end = bisect.bisect_right(self._lines, line)
+        return [diagnostic[4] for diagnostic in self.diagnostics[start:end]]
+
+    def _on_dwell_start(self, position, x, y):
+        if position < 0:
+            return
+        line, _ = self.editor.lineIndexFromPosition(position)
+        messages = self.messages_at(line)
+        if messages:
+            QToolTip.showText(self.editor.viewport().mapToGlobal(QPoint(x, y)), '\n'.join(messages), self.editor)
+
+
+class DiagnosticsEngine(QObject):
+    """
+    Проверяет текст текущей вкладки в пуле процессов, когда правки затихают.
+
+    Каждая отправка текста получает номер версии. Новая правка отменяет еще не начатую
+    проверку, а результат уже начатой проверки устаревшей версии отбрасывается.
+    """
+    # Результат проверки из потока пула: отметки вкладки, версия текста и результат
+    _checked = pyqtSignal(object, int, object)
+
+    def __init__(self, parent=None):
+        super(DiagnosticsEngine, self).__init__(parent)
+        self._pool = None
+        self._documents = {}
+        self.current = None
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(DIAGNOSTICS_DELAY_MS)
+        self._timer.timeout.connect(self.submit)
+        self._checked.connect(self._on_checked)
+
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # fork копировал бы процесс с потоками Qt и их захваченными блокировками
+            self._pool = ProcessPoolExecutor(max_workers=DIAGNOSTICS_WORKERS,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def attach(self, editor):
+        """
+        Начинает проверять `editor` (CustomEditor или None) вместо предыдущей текущей вкладки.
+        """
+        if self.current is not None:
+            self.current.editor.textChanged.disconnect(self.schedule)
+            self.current = None
+        self._timer.stop()
+        if editor is None or self.language(editor) is None:
+            return
+        key = id(editor)
+        document = self._documents.get(key)
+        if document is None:
+            document = self._documents[key] = EditorDiagnostics(editor, self)
+            editor.destroyed.connect(partial(self._forget, key))
+        self.current = document
+        editor.textChanged.connect(self.schedule)
+        self.schedule()
+
+    @staticmethod
+    def language(editor):
+        return LANGUAGES.get((editor.file.extention or '').lower())
+
+    def _forget(self, key, *args):
+        document = self._documents.pop(key, None)
+        if document is None:
+            return
+        if document is self.current:
+            self.current = None
+        if document.future:
+            document.future.cancel()
+        document.deleteLater()
+
+    def schedule(self):
+        document = self.current
+        document.version += 1
+        if document.future:
+            # Еще не начатая проверка устаревшего текста снимается из очереди
+            document.future.cancel()
+            document.future = None
+        self._timer.start()
+
+    def submit(self):
+        document = self.current
+        if document is None:
+            return
+        editor = document.editor
+        if editor.is_loading:
+            self._timer.start()
+            return
+        if editor.length() > MAX_CHECKED_LENGTH:
+            document.set_diagnostics([])
+            return
+        future = self.pool().submit(check, editor.text(), self.language(editor))
+        document.future = future
+        future.add_done_callback(partial(self._on_done, document, document.version))
+
+    def _on_done(self, document, version, future):
+        # Вызывается в потоке пула, результат передается в GUI поток сигналом
+        if self._pool is None:
+            # Окно уже закрыто
+            return
+        try:
+            diagnostics = future.result()
+        except CancelledError:
+            return
+        except Exception as e:
+            logger.warning(f"Ошибка проверки: {e}")
+            return
+        self._checked.emit(document, version, diagnostics)
+
+    def _on_checked(self, document, version, diagnostics):
+        if version != document.version or document not in self._documents.values():
+            return
+        document.future = None
+        document.set_diagnostics(diagnostics)
+
+    def release(self):
+        """
+        Завершает процессы пула. Вызывается при закрытии окна.
+        """
+        self._timer.stop()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,81 @@
+"""
+Проверка текста открытого файла в процессах пула. Модуль не зависит от Qt, чтобы
+дочерние процессы запускались быстро.
+"""
+import ast
+import json
+import warnings
+
+try:
+    from pyflakes import checker as pyflakes_checker
+except ImportError:
+    # Без pyflakes находятся только синтаксические ошибки и предупреждения компилятора
+    pyflakes_checker = None
+
+ERROR = 'error'
+WARNING = 'warning'
+
+# Сообщения pyflakes, которые почти наверняка приведут к ошибке при запуске
+PYFLAKES_ERRORS = ('UndefinedName', 'UndefinedLocal', 'UndefinedExport')
+
+
+def _character_column(lines, line, column) -> int:
+    # Столбцы узлов AST - смещения в байтах UTF-8, а редактор считает символы
+    if line >= len(lines):
+        return column
+    return len(lines[line].encode('utf8')[:column].decode('utf8', errors='ignore'))
+
+
+def check_python(text) -> list:
+    diagnostics = []
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        try:
+            tree = compile(text, '<buffer>', 'exec', flags=ast.PyCF_ONLY_AST, dont_inherit=True)
+            # Часть ошибок (например, return вне функции) и предупреждений находит только компилятор
+            compile(tree, '<buffer>', 'exec', dont_inherit=True)
+        except SyntaxError as e:
+            line = max((e.lineno or 1) - 1, 0)
+            column = max((e.offset or 1) - 1, 0)
+            end_offset = getattr(e, 'end_offset', None)
+            end_column = end_offset - 1 if end_offset and end_offset > 0 and e.end_lineno == e.lineno else -1
+            return [(line, column, end_column, ERROR, e.msg)]
+        except ValueError as e:
+            return [(0, 0, -1, ERROR, str(e))]
+    for warning in caught:
+        if issubclass(warning.category, SyntaxWarning):
+            diagnostics.append((max(warning.lineno - 1, 0), 0, -1, WARNING, str(warning.message)))
+
+    if pyflakes_checker is not None:
+        # Строки считаются так же, как их считает компилятор: splitlines делит и по \f
+        lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+        for message in pyflakes_checker.Checker(tree, filename='<buffer>').messages:
+            severity = ERROR if type(message).__name__ in PYFLAKES_ERRORS else WARNING
+            diagnostics.append((message.lineno - 1, _character_column(lines, message.lineno - 1, message.col),
+                                -1, severity, message.message % message.message_args))
+    return diagnostics
+
+
+def check_json(text) -> list:
+    try:
+        json.loads(text)
+    except json.JSONDecodeError as e:
+        return [(e.lineno - 1, e.colno - 1, -1, ERROR, e.msg)]
+    return []
+
+
+CHECKERS = {
+    'python': check_python,
+    'json': check_json,
+}
+
+
+def check(text, language) -> list:
+    """
+    Проверяет текст и возвращает отсортированный по строкам список
+    (строка, столбец, конечный столбец или -1, важность, сообщение). Строки и столбцы с нуля.
+    """
+    checker = CHECKERS.get(language)
+    if checker is None:
+        return []
+    return sorted(checker(text))
@@ -0,0 +1,216 @@
+import hashlib
+import logging
+import os
+from collections import namedtuple
+from functools import partial
+
+from PyQt6.QtCore import QFileSystemWatcher, QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+from PyQt6.QtWidgets import QMessageBox
+
+from globals import LOGGING_LEVEL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOGGING_LEVEL)
+
+# Размер блока, которым файл читается при подсчете хеша.
+HASH_BLOCK_SIZE = 1024 * 1024
+# Через сколько миллисекунд проверить файл еще раз, если в момент изменения его не было:
+# многие программы сохраняют файл, удаляя старый и переименовывая на его место новый.
+RECHECK_DELAY_MS = 200
+
+# Состояние файла на диске: время изменения и размер для быстрой проверки и хеш содержимого
+Snapshot = namedtuple('Snapshot', ('mtime', 'size', 'digest'))
+
+
+def content_digest(data: bytes) -> bytes:
+    return hashlib.sha1(data).digest()
+
+
+def file_snapshot(path, with_digest=True) -> Snapshot:
+    stat = os.stat(path)
+    digest = None
+    if with_digest:
+        hasher = hashlib.sha1()
+        with open(path, 'rb') as f:
+            while block := f.read(HASH_BLOCK_SIZE):
+                hasher.update(block)
+        digest = hasher.digest()
+    return Snapshot(stat.st_mtime_ns, stat.st_size, digest)
+
+
+class HashJobSignals(QObject):
+    # Путь и его состояние на диске
+    finished = pyqtSignal(str, object)
+    failed = pyqtSignal(str, str)
+
+
+class HashJob(QRunnable):
+    """
+    Считает хеш файла в фоновом потоке, чтобы не читать большие файлы в GUI потоке.
+    """
+
+    def __init__(self, path):
+        super(HashJob, self).__init__()
+        self.path = path
+        self.signals = HashJobSignals()
+
+    def run(self):
+        try:
+            snapshot = file_snapshot(self.path)
+        except OSError as e:
+            self.signals.failed.emit(self.path, str(e))
+            return
+        self.signals.finished.emit(self.path, snapshot)
+
+
+class DocumentTracker(QObject):
+    """
+    Следит за файлами открытых редакторов и замечает, когда их меняют на диске.
+
+    Для каждого файла хранится состояние последней загрузки или записи. При сигнале
+    `QFileSystemWatcher` сначала сравниваются время изменения и размер, и только если
+    они отличаются, в фоне считается хеш: так касание файла или собственная запись
+    редактора не считаются изменением. Неизмененные вкладки перечитываются сразу,
+    а для вкладок с несохраненными правками спрашивается, какую версию оставить.
+    """
+    # Файл изменен на диске другой программой
+    externallyChanged = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super(DocumentTracker, self).__init__(parent)
+        self._editors = {}
+        self._snapshots = {}
+        self._jobs = set()
+        self._prompting = set()
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self._on_file_changed)
+
+    def track(self, editor):
+        """
+        Начинает следить за файлом редактора. Повторный вызов ничего не делает.
+        """
+        path = editor.file.path
+        if not path or editor in self._editors.get(path, ()):
+            return
+        editors = self._editors.setdefault(path, [])
+        editors.append(editor)
+        if len(editors) > 1:
+            return
+        self.watcher.addPath(path)
+        try:
+            self._snapshots[path] = file_snapshot(path, with_digest=False)
+        except OSError:
+            return
+        self._hash(path, self._remember)
+
+    def untrack(self, editor):
+        for path, editors in list(self._editors.items()):
+            if editor not in editors:
+                continue
+            editors.remove(editor)
+            if not editors:
+                del self._editors[path]
+                self._snapshots.pop(path, None)
+                self.watcher.removePath(path)
+
+    def expect(self, path, data: str):
+        """
+        Запоминает текст, который редактор сейчас запишет в файл, чтобы собственная
+        запись не была принята за изменение извне.
+        """
+        snapshot = self._snapshots.get(path)
+        if snapshot is not None:
+            self._snapshots[path] = snapshot._replace(mtime=None, digest=content_digest(data.encode('utf8')))
+
+    def _hash(self, path, callback):
+        job = HashJob(path)
+        job.signals.finished.connect(callback)
+        job.signals.failed.connect(self._on_hash_failed)
+        for signal in (job.signals.finished, job.signals.failed):
+            signal.connect(partial(self._forget, job))
+        self._jobs.add(job)
+        QThreadPool.globalInstance().start(job)
+
+    def _forget(self, job, *args):
+        # Как и в `QueryExecutor`, задачу отпускаем после остальных слотов сигнала
+        QTimer.singleShot(0, lambda: self._jobs.discard(job))
+
+    def _on_hash_failed(self, path, message):
+        logger.warning(f"Не удалось прочитать {path}: {message}")
+
+    def _remember(self, path, snapshot):
+        if path in self._editors:
+            self._snapshots[path] = snapshot
+
+    def _on_file_changed(self, path):
+        if path not in self._editors:
+            return
+        if not os.path.exists(path):
+            QTimer.singleShot(RECHECK_DELAY_MS, partial(self._recheck, path))
+            return
+        # После замены файла переименованием наблюдатель теряет его
+        if path not in self.watcher.files():
+            self.watcher.addPath(path)
+
+        try:
+            current = file_snapshot(path, with_digest=False)
+        except OSError:
+            return
+        known = self._snapshots.get(path)
+        if known and (known.mtime, known.size) == (current.mtime, current.size):
+            return
+        self._hash(path, self._compare)
+
+    def _recheck(self, path):
+        if path not in self._editors:
+            return
+        if os.path.exists(path):
+            self._on_file_changed(path)
+        else:
+            logger.info(f"Файл {path} удален с диска")
+            for editor in self._editors[path]:
+                editor.file.saved = False
+
+    def _compare(self, path, snapshot):
+        if path not in self._editors:
+            return
+        known = self._snapshots.get(path)
+        self._snapshots[path] = snapshot
+        if known is not None and known.digest == snapshot.digest:
+            return
+        logger.debug(f"Файл {path} изменен на диске")
+        self.externallyChanged.emit(path)
+        for editor in list(self._editors[path]):
+            self._resolve(editor)
+
+    def _resolve(self, editor):
+        """
+        Перечитывает неизмененный редактор или спрашивает, что делать с измененным.
+        """
+        if editor.is_loading or editor in self._prompting:
+            return
+        if not editor.isModified():
+            self._reload(editor)
+            return
+
+        self._prompting.add(editor)
+        try:
+            reply = QMessageBox.question(
+                editor, "Файл изменен",
+                f"Файл {editor.file.name} изменен другой программой.\n"
+                "Загрузить версию с диска? Несохраненные изменения будут потеряны.",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                QMessageBox.StandardButton.No)
+        finally:
+            self._prompting.discard(editor)
+        if reply == QMessageBox.StandardButton.Yes:
+            self._reload(editor)
+        else:
+            # Версия в редакторе остается, и при сохранении она перезапишет файл
+            editor.file.saved = False
+
+    def _reload(self, editor):
+        try:
+            editor.reload_file()
+        except (OSError, UnicodeDecodeError) as e:
+            logger.error(f"Не удалось перечитать {editor.file.path}: {e}")
@@ -1,12 +1,40 @@
+import codecs
+import io
 import ntpath
+import os
+import threading
 
-import PyQt6.Qsci as lexers
 from PyQt6.Qsci import QsciScintilla
-from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QColor, QFont, QKeyEvent
+from PyQt6.QtCore import QObject, QRunnable, Qt, QThreadPool, QTimer, pyqtSignal
+from PyQt6.QtGui import QColor, QKeyEvent
 from PyQt6.QtWidgets import QMessageBox
 
+from completion_index import completion_index
+from lexer_registry import lexer_registry
 from palettes import Theme
+from tracing import traced
+from utils import atomic_write
+
+# Файлы до этого размера (в байтах) читаются целиком сразу при открытии.
+SYNC_LOAD_LIMIT = 1024 * 1024
+# Размер порции, которой дочитываются большие файлы.
+LOAD_CHUNK_SIZE = 1024 * 1024
+# Со скольких набранных символов слова список дополнений показывается сам.
+COMPLETION_THRESHOLD = 2
+# Сколько вариантов показывается в списке дополнений.
+COMPLETION_LIMIT = 50
+
+# Сколько байт памяти в среднем занимает символ документа: сам текст, байт стиля
+# на символ, разметка строк и история отмены.
+EDITOR_BYTES_PER_CHAR = 3
+
+
+def make_decoder():
+    """
+    Возвращает инкрементальный декодер UTF-8, который, как и `open` в текстовом режиме,
+    приводит переводы строк Windows к `\\n`, даже если они разрезаны между порциями.
+    """
+    return io.IncrementalNewlineDecoder(codecs.getincrementaldecoder('utf8')(), translate=True)
 
 
 class File:
@@ -34,13 +62,19 @@ class File:
         self.name = ntpath.basename(file_path)
         self.extention = ntpath.splitext(file_path)[1]
     
+    @traced
     def save(self, data: str) -> None:
         """
-        Метод `save` сохраняет изменения в файл.
+        Метод `save` атомарно сохраняет изменения в файл в текущем потоке.
+        Для сохранения из интерфейса используется `SaveService`.
+        """
+        atomic_write(self.path, data)
+        self.mark_saved()
+
+    def mark_saved(self):
+        """
+        Метод `mark_saved` отмечает файл сохраненным после успешной записи.
         """
-        with open(self.path, 'w', encoding='utf8') as f:
-            f.write(data)
-        
         self.saved = True
         if self.new:
             self.new = False
@@ -48,20 +82,79 @@ class File:
     def __repr__(self) -> str:
         return f"File({self.path}, {self.saved})"
 
+
+class FileLoaderSignals(QObject):
+    # Очередная декодированная порция текста
+    chunk = pyqtSignal(str)
+    # Процент прочитанного файла
+    progress = pyqtSignal(int)
+    # Файл прочитан до конца
+    finished = pyqtSignal()
+    # Файл не удалось прочитать или декодировать
+    failed = pyqtSignal(str)
+    # Чтение было отменено
+    cancelled = pyqtSignal()
+
+
+class FileLoader(QRunnable):
+    """
+    Дочитывает файл в фоновом потоке порциями по `LOAD_CHUNK_SIZE` байт, начиная
+    с `offset`, и декодирует их тем же декодером, которым было прочитано начало файла.
+    """
+
+    def __init__(self, path, offset, size, decoder):
+        super(FileLoader, self).__init__()
+        self.path = path
+        self.offset = offset
+        self.size = size
+        self.decoder = decoder
+        self.signals = FileLoaderSignals()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def run(self):
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                read = self.offset
+                while not self._cancelled.is_set():
+                    data = f.read(LOAD_CHUNK_SIZE)
+                    text = self.decoder.decode(data, final=not data)
+                    if text:
+                        self.signals.chunk.emit(text)
+                    if not data:
+                        self.signals.finished.emit()
+                        return
+                    read += len(data)
+                    self.signals.progress.emit(min(99, read * 100 // max(self.size, 1)))
+        except (OSError, UnicodeDecodeError) as e:
+            self.signals.failed.emit(str(e))
+            return
+        self.signals.cancelled.emit()
+
 class CustomEditor(QsciScintilla):
+    # Процент загруженного файла
+    loadProgress = pyqtSignal(int)
+    # Загрузка завершена; False, если она была отменена и текст загружен не полностью
+    loadFinished = pyqtSignal(bool)
+    # Файл не удалось дочитать
+    loadFailed = pyqtSignal(str)
 
     def __init__(self, theme, file_path=None, file_object=None, *args, key_press_handler=None, **kwargs):
         super(CustomEditor, self).__init__(*args, **kwargs)
         
         self.key_press_handler = key_press_handler
         self.theme = theme
+        self.loader = None
+        # Позиция просмотра, которую нужно восстановить после окончания загрузки
+        self._view_state = None
         
         if file_path or file_object:
             try:
                 self.file = file_object if file_object else File(file_path)
-                with open(self.file.path, "r", encoding='utf8') as f:
-                    text = f.read()
-                self.setText(text)
+                self.load_file()
                 self.reload_lexer(self.file.extention)
             except UnicodeDecodeError:
                 msgBox = QMessageBox()
@@ -79,6 +172,9 @@ class CustomEditor(QsciScintilla):
             self.file = File()
             
         self.error_while_reading = False
+        # Файл считается сохраненным, пока текст совпадает с точкой сохранения документа,
+        # так что отмена правок до сохраненного состояния снова делает его сохраненным
+        self.modificationChanged.connect(self._on_modification_changed)
 
         self.setUtf8(True)
 
@@ -95,12 +191,18 @@ class CustomEditor(QsciScintilla):
         self.setMarginLineNumbers(1, True)
         self.setMarginWidth(1, 50)
 
-        self.setAutoCompletionSource(QsciScintilla.AutoCompletionSource.AcsAll)
+        # Варианты дополнения берутся из общего индекса слов всех вкладок, а не из
+        # повторного просмотра документа на каждое нажатие клавиши
+        self.setAutoCompletionSource(QsciScintilla.AutoCompletionSource.AcsNone)
         self.setAutoCompletionCaseSensitivity(True)
         self.setAutoCompletionReplaceWord(True)
         self.setAutoCompletionUseSingle(
             QsciScintilla.AutoCompletionUseSingle.AcusAlways)
         self.setAutoCompletionThreshold(0)
+        self.SendScintilla(QsciScintilla.SCI_AUTOCSETORDER, QsciScintilla.SC_ORDER_CUSTOM)
+        self.words = completion_index.document(self.text, self.lines)
+        self.words.reset()
+        self.SCN_MODIFIED.connect(self._on_text_modified)
 
         self.setFolding(QsciScintilla.FoldStyle.BoxedTreeFoldStyle)
 
@@ -123,79 +225,197 @@ class CustomEditor(QsciScintilla):
             
 
         
+    @traced
+    def load_file(self):
+        """
+        Читает начало файла сразу, а остаток, если файл больше `SYNC_LOAD_LIMIT`,
+        дочитывает в фоновом потоке. Пока файл загружается, редактор доступен только
+        для чтения, а загрузку можно отменить клавишей Escape.
+        
+        Ошибка декодирования начала файла выбрасывается как `UnicodeDecodeError`,
+        поэтому двоичные файлы отсекаются до создания вкладки.
+        """
+        size = os.path.getsize(self.file.path)
+        decoder = make_decoder()
+        with open(self.file.path, 'rb') as f:
+            head = f.read(SYNC_LOAD_LIMIT)
+        self.setText(decoder.decode(head, final=len(head) >= size))
+        self.setModified(False)
+        if len(head) >= size:
+            return
+
+        self.setReadOnly(True)
+        self.SendScintilla(QsciScintilla.SCI_SETUNDOCOLLECTION, False)
+        # Обработка уведомлений об изменении текста стоит O(позиции вставки), поэтому
+        # на время дозагрузки они отключаются, иначе каждая порция дорожала бы с ростом файла
+        self._mod_event_mask = self.SendScintilla(QsciScintilla.SCI_GETMODEVENTMASK)
+        self.SendScintilla(QsciScintilla.SCI_SETMODEVENTMASK, 0)
+        self.loader = FileLoader(self.file.path, len(head), size, decoder)
+        self.loader.signals.chunk.connect(self._append_chunk)
+        self.loader.signals.progress.connect(self.loadProgress)
+        self.loader.signals.finished.connect(self._on_load_complete)
+        self.loader.signals.cancelled.connect(self._on_load_cancelled)
+        self.loader.signals.failed.connect(self._on_load_failed)
+        # Запуск откладывается, чтобы вкладка успела подключиться к сигналам загрузки
+        QTimer.singleShot(0, self._start_loading)
+
+    def _start_loading(self):
+        if self.loader:
+            QThreadPool.globalInstance().start(self.loader)
+
+    @property
+    def is_loading(self) -> bool:
+        return self.loader is not None
+
+    def cancel_loading(self):
+        """
+        Останавливает фоновую загрузку. Частично загруженный текст остается только для
+        чтения, чтобы его нельзя было случайно сохранить поверх файла.
+        """
+        if self.loader:
+            self.loader.cancel()
+
+    def _append_chunk(self, text):
+        self.append(text)
+
+    def _on_load_complete(self):
+        self._on_load_finished(True)
+
+    def _on_load_cancelled(self):
+        self._on_load_finished(False)
+
+    def _on_load_finished(self, complete):
+        self.loader = None
+        self.SendScintilla(QsciScintilla.SCI_SETMODEVENTMASK, self._mod_event_mask)
+        self.SendScintilla(QsciScintilla.SCI_SETUNDOCOLLECTION, True)
+        self.SendScintilla(QsciScintilla.SCI_EMPTYUNDOBUFFER)
+        self.setModified(False)
+        # Пока уведомления были отключены, индекс слов не обновлялся
+        self.words.reset()
+        if complete:
+            self.setReadOnly(False)
+        if self._view_state:
+            self.restore_view_state(self._view_state)
+        self.loadFinished.emit(complete)
+
+    def _on_load_failed(self, message):
+        self.loader = None
+        self.SendScintilla(QsciScintilla.SCI_SETMODEVENTMASK, self._mod_event_mask)
+        self.error_while_reading = True
+        self.loadFailed.emit(message)
+
+    def view_state(self) -> dict:
+        """
+        Возвращает позицию курсора и прокрутки, чтобы восстановить их при повторном открытии.
+        """
+        line, index = self.getCursorPosition()
+        return {'Курсор': [line, index], 'Первая строка': self.firstVisibleLine()}
+
+    def _on_text_modified(self, position, modification_type, text, length, lines_added, *args):
+        if not modification_type & (QsciScintilla.SC_MOD_INSERTTEXT | QsciScintilla.SC_MOD_DELETETEXT):
+            return
+        # Вставка заменяет одну строку на 1 + lines_added, удаление - наоборот
+        line = self.SendScintilla(QsciScintilla.SCI_LINEFROMPOSITION, position)
+        self.words.splice(line, 1 + max(0, -lines_added), 1 + max(0, lines_added))
+
+    def show_completions(self, automatic=False):
+        """
+        Показывает список дополнений для слова перед курсором. При автоматическом
+        вызове список появляется, только если набрано не меньше `COMPLETION_THRESHOLD` символов.
+        """
+        position = self.SendScintilla(QsciScintilla.SCI_GETCURRENTPOS)
+        start = self.SendScintilla(QsciScintilla.SCI_WORDSTARTPOSITION, position, True)
+        prefix = bytes(self.bytes(start, position)).rstrip(b'\0').decode('utf8', errors='ignore')
+        if automatic and len(prefix) < COMPLETION_THRESHOLD:
+            return
+        line = self.SendScintilla(QsciScintilla.SCI_LINEFROMPOSITION, position)
+        words = completion_index.complete(prefix, self.words, line, COMPLETION_LIMIT)
+        if not words:
+            self.SendScintilla(QsciScintilla.SCI_AUTOCCANCEL)
+            return
+        self.SendScintilla(QsciScintilla.SCI_AUTOCSHOW, position - start, ' '.join(words).encode('utf8'))
+
+    def _on_modification_changed(self, modified):
+        self.file.saved = not modified
+
+    @traced
+    def reload_file(self):
+        """
+        Перечитывает файл с диска, сохраняя позицию просмотра. Несохраненные правки
+        и история отмены теряются.
+        """
+        state = self.view_state()
+        self.load_file()
+        self.SendScintilla(QsciScintilla.SCI_EMPTYUNDOBUFFER)
+        self.setModified(False)
+        self.restore_view_state(state)
+
+    def memory_usage(self) -> int:
+        """
+        Примерная оценка памяти, которую занимает документ, в байтах.
+        """
+        return self.SendScintilla(QsciScintilla.SCI_GETLENGTH) * EDITOR_BYTES_PER_CHAR
+
+    def setModified(self, modified):
+        """
+        QsciScintilla.setModified(True) ничего не делает: признак изменения снимает только
+        точка сохранения. Поэтому документ помечается измененным пустой правкой -
+        вставкой и удалением символа одним действием.
+        """
+        if not modified:
+            super(CustomEditor, self).setModified(False)
+        elif not self.isModified():
+            self.beginUndoAction()
+            self.SendScintilla(QsciScintilla.SCI_INSERTTEXT, 0, b' ')
+            self.SendScintilla(QsciScintilla.SCI_DELETERANGE, 0, 1)
+            self.endUndoAction()
+
+    def replace_text(self, text):
+        """
+        Заменяет весь текст одной правкой, которую можно отменить. В отличие от `setText`
+        история правок не очищается.
+        """
+        self.SendScintilla(QsciScintilla.SCI_SETTEXT, text.encode('utf8'))
+
+    @property
+    def can_unload(self) -> bool:
+        """
+        Редактор можно выгрузить, если его текст полностью загружен и не изменен.
+        """
+        return not self.file.new and not self.is_loading and not self.isReadOnly() and not self.isModified()
+
+    def restore_view_state(self, state: dict):
+        if self.is_loading:
+            # Позиция может оказаться в еще не загруженной части файла
+            self._view_state = state
+            return
+        self._view_state = None
+        line, index = state.get('Курсор', (0, 0))
+        self.setCursorPosition(line, index)
+        self.setFirstVisibleLine(state.get('Первая строка', line))
+
+    def release(self):
+        """
+        Останавливает фоновую загрузку. Вызывается при закрытии вкладки.
+        """
+        if self.loader:
+            self.loader.cancel()
+            self.loader = None
+        self.words.close()
+
+    @traced
     def reload_lexer(self, file_extention):
         """
         Метод для перезагрузки лексера в зависимости от расширения файла.
+        Лексеры общие для всех редакторов и берутся из `lexer_registry`.
         """
-        match file_extention[1:]:
-            case 'json':
-                lexer = lexers.QsciLexerJSON()
-            case 'py':
-                lexer = lexers.QsciLexerPython()
-            case 'html':
-                lexer = lexers.QsciLexerHTML()
-            case 'cs':
-                lexer = lexers.QsciLexerCSharp()
-            case 'cpp':
-                lexer = lexers.QsciLexerCPP()
-            case 'java':
-                lexer = lexers.QsciLexerJava()
-            case 'css':
-                lexer = lexers.QsciLexerCSS()
-            case 'js':
-                lexer = lexers.QsciLexerJavaScript()
-            case _:
-                lexer = None
-            
+        lexer = lexer_registry.lexer_for((file_extention or '')[1:], self.theme)
         if not lexer:
             return
         
-        font = QFont('Fira Code')
-        font.setPointSize(10)
-        lexer.setFont(font)
-        
-        if self.theme == Theme.DARK:
-            blue = QColor('#9ecbf2')
-            magenta = QColor('#b389c9')
-            
-            lexer.setColor(QColor('white'), lexers.QsciLexerPython.Default)
-            lexer.setColor(QColor('white'), lexers.QsciLexerPython.Identifier)
-            lexer.setColor(QColor('white'), lexers.QsciLexerPython.Operator)
-            
-            lexer.setColor(QColor(blue), lexers.QsciLexerPython.Number)
-            
-            lexer.setColor(QColor('#f97578'), lexers.QsciLexerPython.Keyword)
-            
-            lexer.setColor(QColor('#4c6a7d'), lexers.QsciLexerPython.Comment)
-            lexer.setColor(QColor(blue), lexers.QsciLexerPython.CommentBlock)
-            
-            lexer.setColor(QColor(blue), lexers.QsciLexerPython.SingleQuotedString)
-            lexer.setColor(QColor(blue), lexers.QsciLexerPython.SingleQuotedFString)
-            lexer.setColor(QColor(blue), lexers.QsciLexerPython.DoubleQuotedString)
-            lexer.setColor(QColor(blue), lexers.QsciLexerPython.DoubleQuotedFString)
-            
-            lexer.setColor(QColor(blue), lexers.QsciLexerPython.TripleSingleQuotedFString)
-            lexer.setColor(QColor(blue), lexers.QsciLexerPython.TripleSingleQuotedString)
-            lexer.setColor(QColor(blue), lexers.QsciLexerPython.TripleDoubleQuotedFString)
-            lexer.setColor(QColor(blue), lexers.QsciLexerPython.TripleDoubleQuotedString)
-
-            lexer.setColor(QColor(magenta), lexers.QsciLexerPython.ClassName)            
-            lexer.setColor(QColor(magenta), lexers.QsciLexerPython.FunctionMethodName)
-            lexer.setColor(QColor(magenta), lexers.QsciLexerPython.Decorator)
-            
-            lexer.setPaper(QColor("#353535"))
-            
-        
         self.setLexer(lexer)
 
-    def changeEvent(self, event):
-        """
-        The changeEvent function is called whenever the user changes a text in the editor. 
-        It is used to track whether there are unsaved changes in the code.
-        """
-        self.file.saved = False
-        print(self.file)
-
+    @traced
     def keyPressEvent(self, e: QKeyEvent) -> None:
         """
         The keyPressEvent function is called whenever the user presses a key. 
@@ -207,9 +427,16 @@ class CustomEditor(QsciScintilla):
         if self.key_press_handler:
             self.key_press_handler()
 
+        if e.key() == Qt.Key.Key_Escape and self.is_loading:
+            self.cancel_loading()
+            return
+
         if e.modifiers() == Qt.KeyboardModifier.ControlModifier and e.key(
         ) == Qt.Key.Key_Space:
-            self.autoCompleteFromAll()
+            self.show_completions()
             return
 
         super().keyPressEvent(e)
+
+        if e.text() and (e.text().isalnum() or e.text() == '_'):
+            self.show_completions(automatic=True)
@@ -4,4 +4,7 @@ import logging
 PROJECT_DIRECTORY = os.path.dirname(__file__).replace('\\', '/').replace('c:/', 'C:/')
 SETTINGS_PATH = os.path.join(PROJECT_DIRECTORY, 'settings.json')
 WINDOW_ICON = os.path.join(PROJECT_DIRECTORY, 'logo.png')
+# Папка для индексов и других данных, которые можно в любой момент построить заново.
+# Переменная окружения EDITOR_CACHE_DIRECTORY задает другую папку, например для замеров
+CACHE_DIRECTORY = os.environ.get('EDITOR_CACHE_DIRECTORY') or os.path.join(PROJECT_DIRECTORY, '.cache')
 LOGGING_LEVEL = logging.NOTSET
\ No newline at end of file
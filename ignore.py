@@ -0,0 +1,98 @@
+import logging
+import os
+import re
+
+from globals import LOGGING_LEVEL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOGGING_LEVEL)
+
+# Что пропускается в любом проекте, даже без собственных файлов исключений.
+DEFAULT_PATTERNS = (
+    '.git/', '.hg/', '.svn/', '.idea/', '.vscode/',
+    '__pycache__/', '*.pyc', '.mypy_cache/', '.pytest_cache/', '.ruff_cache/', '.tox/', '.nox/',
+    'node_modules/', '.venv/', 'venv/', '.cache/',
+)
+# Файлы с шаблонами исключений в корне проекта, в синтаксисе .gitignore.
+IGNORE_FILES = ('.gitignore', '.ignore')
+
+
+def _translate(pattern) -> str:
+    """
+    Переводит шаблон в синтаксисе .gitignore в регулярное выражение.
+    """
+    result = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            result.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i):
+            result.append('.*')
+            i += 2
+        elif pattern[i] == '*':
+            result.append('[^/]*')
+            i += 1
+        elif pattern[i] == '?':
+            result.append('[^/]')
+            i += 1
+        else:
+            result.append(re.escape(pattern[i]))
+            i += 1
+    return ''.join(result)
+
+
+class IgnoreRules:
+    """
+    Правила исключения файлов проекта: стандартные и из .gitignore/.ignore в его корне.
+
+    Как и в git, шаблон без `/` сравнивается с именем файла на любой глубине, шаблон
+    с `/` - с путем от корня, `/` в конце означает только папки, `!` отменяет
+    исключение, а из нескольких подходящих правил действует последнее.
+    """
+
+    def __init__(self, root=None, patterns=DEFAULT_PATTERNS):
+        self._rules = []
+        for pattern in patterns:
+            self.add(pattern)
+        if root:
+            for name in IGNORE_FILES:
+                self.load(os.path.join(root, name))
+
+    def load(self, path):
+        try:
+            with open(path, 'r', encoding='utf8', errors='replace') as f:
+                for line in f:
+                    self.add(line)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Не удалось прочитать {path}: {e}")
+
+    def add(self, pattern):
+        pattern = pattern.rstrip('\r\n')
+        if not pattern.strip() or pattern.startswith('#'):
+            return
+        negated = pattern.startswith('!')
+        if negated:
+            pattern = pattern[1:]
+        directory_only = pattern.endswith('/')
+        # Как и в git, `/` в начале или середине шаблона привязывает его к корню
+        anchored = '/' in pattern.rstrip('/')
+        pattern = pattern.strip('/')
+        regex = re.compile(_translate(pattern) + '$')
+        self._rules.append((regex, negated, directory_only, anchored))
+
+    def is_ignored(self, relative_path, is_dir=False) -> bool:
+        """
+        Проверяет путь относительно корня проекта (с `/` в качестве разделителя).
+        Родительские папки не проверяются: обходчики и так не заходят в исключенные папки.
+        """
+        name = relative_path.rsplit('/', 1)[-1]
+        ignored = False
+        for regex, negated, directory_only, anchored in self._rules:
+            if directory_only and not is_dir:
+                continue
+            if regex.match(relative_path if anchored else name):
+                ignored = not negated
+        return ignored
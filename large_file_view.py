@@ -0,0 +1,403 @@
+import bisect
+import logging
+import mmap
+import re
+import threading
+from array import array
+from functools import partial
+
+from PyQt6.QtCore import QObject, QRunnable, Qt, QThreadPool, pyqtSignal
+from PyQt6.QtGui import QFont, QFontMetrics, QKeyEvent, QKeySequence, QPainter
+from PyQt6.QtWidgets import QAbstractScrollArea, QInputDialog, QMessageBox
+
+from editor import File
+from globals import LOGGING_LEVEL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOGGING_LEVEL)
+
+# Сколько байт индексатор просматривает между проверками отмены и сообщениями о прогрессе.
+INDEX_CHUNK = 4 << 20
+# Сколько байт строки максимум отрисовывается, остальное обрезается.
+MAX_RENDERED_LINE = 4096
+# Сколько байт поиск просматривает между проверками отмены.
+SEARCH_CHUNK = 16 << 20
+
+_NEWLINE = re.compile(b'\n')
+
+
+class MappedFile:
+    """
+    Файл, отображенный в память только для чтения.
+
+    Буфер нужен просмотрщику и его фоновым задачам, поэтому у него считаются
+    пользователи: каждый вызывает `acquire`, а по окончании работы - `release`.
+    Файл закрывается, когда его отпустит последний из них, и закрытие вкладки
+    не ждет окончания индексации или поиска.
+    """
+
+    def __init__(self, path):
+        self._handle = open(path, 'rb')
+        try:
+            self.buffer = mmap.mmap(self._handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Пустой файл нельзя отобразить в память
+            self.buffer = b''
+        except OSError:
+            self._handle.close()
+            raise
+        self._users = 1
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            self._users += 1
+        return self.buffer
+
+    def release(self):
+        with self._lock:
+            self._users -= 1
+            if self._users:
+                return
+        try:
+            if isinstance(self.buffer, mmap.mmap):
+                self.buffer.close()
+        except BufferError as e:
+            # На буфер еще ссылается чей-то срез, он закроется вместе с ним
+            logger.warning(f"Не удалось закрыть отображение файла: {e}")
+        self._handle.close()
+
+
+class LineIndexerSignals(QObject):
+    # Проиндексировано очередное количество строк
+    progress = pyqtSignal(int)
+    finished = pyqtSignal(int)
+
+
+class LineIndexer(QRunnable):
+    """
+    Строит в фоновом потоке индекс смещений начала строк отображенного в память файла.
+
+    Поиск переводов строк идет регулярным выражением прямо по `mmap`, так что файл
+    не копируется в память процесса. Буфер просматривается кусками по `INDEX_CHUNK`
+    байт: между ними проверяется отмена, и ни один шаг не держит GIL долго, даже если
+    строки в файле очень длинные. Индекс заполняется по ходу работы, и уже найденные
+    строки можно показывать до окончания индексации.
+    """
+
+    def __init__(self, mapped: MappedFile, offsets: array):
+        super(LineIndexer, self).__init__()
+        self.mapped = mapped
+        self.buffer = mapped.acquire()
+        self.offsets = offsets
+        self.signals = LineIndexerSignals()
+        self.done = threading.Event()
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def _index(self) -> bool:
+        append = self.offsets.append
+        size = len(self.buffer)
+        for start in range(0, size, INDEX_CHUNK):
+            if self._cancelled:
+                return False
+            for match in _NEWLINE.finditer(self.buffer, start, min(start + INDEX_CHUNK, size)):
+                append(match.end())
+            self.signals.progress.emit(len(self.offsets))
+        return True
+
+    def run(self):
+        try:
+            if not self._index():
+                return
+            # Последняя строка без перевода строки в конце или пустая строка после него
+            if self.offsets[-1] == len(self.buffer) and len(self.offsets) > 1:
+                self.offsets.pop()
+            self.signals.finished.emit(len(self.offsets))
+        finally:
+            self.buffer = None
+            self.done.set()
+            self.mapped.release()
+
+
+class BufferSearchSignals(QObject):
+    # Смещение найденного совпадения или -1, если совпадений нет
+    found = pyqtSignal(int)
+
+
+class BufferSearch(QRunnable):
+    """
+    Ищет `pattern` в отображенном файле в фоновом потоке начиная со смещения `start`,
+    а если до конца файла совпадений нет - с начала. Буфер просматривается кусками
+    по `SEARCH_CHUNK` байт, между которыми проверяется отмена.
+    """
+
+    def __init__(self, mapped: MappedFile, pattern: bytes, start: int):
+        super(BufferSearch, self).__init__()
+        self.mapped = mapped
+        self.buffer = mapped.acquire()
+        self.pattern = pattern
+        self.start = start
+        self.signals = BufferSearchSignals()
+        self.done = threading.Event()
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def _find(self, start, end) -> int:
+        # Куски перекрываются, чтобы не пропустить совпадение на их границе
+        overlap = len(self.pattern) - 1
+        while start < end and not self._cancelled:
+            position = self.buffer.find(self.pattern, start, min(start + SEARCH_CHUNK + overlap, end))
+            if position != -1:
+                return position
+            start += SEARCH_CHUNK
+        return -1
+
+    def run(self):
+        try:
+            position = self._find(self.start, len(self.buffer))
+            if position == -1 and self.start:
+                position = self._find(0, min(self.start + len(self.pattern) - 1, len(self.buffer)))
+            if not self._cancelled:
+                self.signals.found.emit(position)
+        finally:
+            self.buffer = None
+            self.done.set()
+            self.mapped.release()
+
+
+class LargeFileView(QAbstractScrollArea):
+    """
+    Просмотрщик файлов, которые слишком велики для загрузки в редактор.
+
+    Файл отображается в память через `mmap`, индекс строк строится в фоне, а при
+    отрисовке декодируются только видимые строки. Поддерживаются переход к строке
+    (Ctrl+G), к смещению в байтах (Ctrl+Shift+G) и поиск (Ctrl+F, F3), который
+    ищет прямо в отображенном буфере.
+    """
+
+    def __init__(self, file: File, *args, **kwargs):
+        super(LargeFileView, self).__init__(*args, **kwargs)
+
+        self.file = file
+        self.error_while_reading = False
+        self.offsets = array('q', [0])
+        self.indexed = False
+        self._match = None
+        self._search = None
+        # Запущенные поиски, включая отмененные, которые еще могут читать буфер
+        self._searches = []
+        self._last_search = b''
+        self._view_state = None
+        self.mapped = None
+        self.buffer = b''
+
+        try:
+            self.mapped = MappedFile(file.path)
+            self.buffer = self.mapped.buffer
+        except OSError as e:
+            logger.error(f"Не удалось открыть файл {file.path}: {e}")
+            QMessageBox.critical(None, "Ошибка", f"Не удалось открыть файл: {e}")
+            self.error_while_reading = True
+            return
+
+        font = QFont('Fira Code')
+        font.setPointSize(10)
+        font.setStyleHint(QFont.StyleHint.Monospace)
+        self.viewport().setFont(font)
+        self._metrics = QFontMetrics(font)
+        self._gutter_width = self._metrics.horizontalAdvance('0' * 12)
+
+        self.indexer = LineIndexer(self.mapped, self.offsets)
+        self.indexer.signals.progress.connect(self._on_indexed)
+        self.indexer.signals.finished.connect(self._on_index_finished)
+        QThreadPool.globalInstance().start(self.indexer)
+        self._update_scrollbars()
+
+    @property
+    def line_count(self) -> int:
+        return len(self.offsets)
+
+    @property
+    def top_line(self) -> int:
+        return self.verticalScrollBar().value()
+
+    def _line_height(self):
+        return self._metrics.height()
+
+    def _visible_lines(self):
+        return max(1, self.viewport().height() // self._line_height())
+
+    def _update_scrollbars(self):
+        self.verticalScrollBar().setRange(0, max(0, self.line_count - self._visible_lines()))
+        self.verticalScrollBar().setPageStep(self._visible_lines())
+
+    def _on_indexed(self, count):
+        self._update_scrollbars()
+        self.viewport().update()
+
+    def _on_index_finished(self, count):
+        self.indexed = True
+        self._update_scrollbars()
+        if self._view_state:
+            self.restore_view_state(self._view_state)
+        self.viewport().update()
+
+    def line_range(self, line):
+        """
+        Возвращает смещения начала и конца строки `line` без перевода строки.
+        """
+        start = self.offsets[line]
+        end = self.offsets[line + 1] - 1 if line + 1 < len(self.offsets) else len(self.buffer)
+        if end > start and self.buffer[end - 1:end] == b'\r':
+            end -= 1
+        return start, max(start, end)
+
+    def line_of_offset(self, offset) -> int:
+        return max(0, bisect.bisect_right(self.offsets, offset) - 1)
+
+    def resizeEvent(self, event):
+        super(LargeFileView, self).resizeEvent(event)
+        self._update_scrollbars()
+
+    def paintEvent(self, event):
+        painter = QPainter(self.viewport())
+        palette = self.palette()
+        painter.fillRect(self.viewport().rect(), palette.base())
+
+        height = self._line_height()
+        ascent = self._metrics.ascent()
+        first = self.verticalScrollBar().value()
+        last = min(self.line_count, first + self._visible_lines() + 1)
+        shift = self.horizontalScrollBar().value()
+        widest = 0
+
+        painter.fillRect(0, 0, self._gutter_width, self.viewport().height(), palette.alternateBase())
+        for number, line in enumerate(range(first, last)):
+            y = number * height
+            start, end = self.line_range(line)
+            text = self.buffer[start:min(end, start + MAX_RENDERED_LINE)].decode('utf8', errors='replace')
+            x = self._gutter_width + 4 - shift
+
+            if self._match and start <= self._match[0] < end + 1:
+                prefix = self.buffer[start:self._match[0]].decode('utf8', errors='replace')
+                found = self.buffer[self._match[0]:self._match[0] + self._match[1]].decode('utf8', errors='replace')
+                painter.fillRect(x + self._metrics.horizontalAdvance(prefix), y,
+                                 self._metrics.horizontalAdvance(found), height, palette.highlight())
+
+            painter.setPen(palette.text().color())
+            painter.drawText(x, y + ascent, text)
+            widest = max(widest, self._metrics.horizontalAdvance(text))
+
+            painter.fillRect(0, y, self._gutter_width, height, palette.alternateBase())
+            painter.setPen(palette.placeholderText().color())
+            painter.drawText(4, y + ascent, str(line + 1))
+
+        self.horizontalScrollBar().setRange(0, max(self.horizontalScrollBar().maximum(),
+                                                   widest + self._gutter_width - self.viewport().width()))
+        self.horizontalScrollBar().setPageStep(self.viewport().width())
+
+    def go_to_line(self, line):
+        """
+        Прокручивает просмотрщик так, чтобы строка `line` (с нуля) была сверху.
+        """
+        self.verticalScrollBar().setValue(max(0, min(line, self.line_count - 1)))
+        self.viewport().update()
+
+    def go_to_offset(self, offset):
+        self.go_to_line(self.line_of_offset(max(0, min(offset, len(self.buffer)))))
+
+    def find(self, pattern: bytes, start=None, report_missing=False):
+        """
+        Запускает поиск `pattern` в отображенном буфере начиная с `start`; когда
+        совпадение найдется, просмотрщик перейдет к нему. Если до конца файла совпадений
+        нет, поиск продолжается с начала. Предыдущий незаконченный поиск отменяется.
+        """
+        if not pattern:
+            return
+        if start is None:
+            start = self._match[0] + 1 if self._match else self.offsets[self.top_line]
+        if self._search is not None:
+            self._search.cancel()
+        self._searches = [search for search in self._searches if not search.done.is_set()]
+        self._search = BufferSearch(self.mapped, pattern, start)
+        self._search.signals.found.connect(partial(self._on_found, self._search, report_missing))
+        self._searches.append(self._search)
+        QThreadPool.globalInstance().start(self._search)
+
+    def _on_found(self, search, report_missing, position):
+        if search is not self._search:
+            return
+        self._search = None
+        if position == -1:
+            self._match = None
+            self.viewport().update()
+            if report_missing:
+                QMessageBox.information(self, "Поиск", "Совпадений не найдено")
+            return
+        self._match = (position, len(search.pattern))
+        self.go_to_offset(position)
+
+    def view_state(self) -> dict:
+        return {'Первая строка': self.top_line}
+
+    def restore_view_state(self, state: dict):
+        if not self.indexed:
+            # До конца индексации нужной строки может еще не быть в индексе
+            self._view_state = state
+            return
+        self._view_state = None
+        self.go_to_line(state.get('Первая строка', 0))
+
+    def ask_line(self):
+        line, ok = QInputDialog.getInt(self, "Перейти к строке", f"Строка (1 - {self.line_count}):",
+                                       self.top_line + 1, 1, max(1, min(self.line_count, 2 ** 31 - 1)))
+        if ok:
+            self.go_to_line(line - 1)
+
+    def ask_offset(self):
+        text, ok = QInputDialog.getText(self, "Перейти к смещению", f"Смещение в байтах (0 - {len(self.buffer)}):")
+        if ok and text.strip().isdigit():
+            self.go_to_offset(int(text.strip()))
+
+    def ask_search(self):
+        text, ok = QInputDialog.getText(self, "Поиск", "Найти:", text=self._last_search.decode('utf8'))
+        if ok and text:
+            self._last_search = text.encode('utf8')
+            self.find(self._last_search, report_missing=True)
+
+    def keyPressEvent(self, e: QKeyEvent):
+        if e.matches(QKeySequence.StandardKey.Find):
+            self.ask_search()
+        elif e.matches(QKeySequence.StandardKey.FindNext) or e.key() == Qt.Key.Key_F3:
+            self.find(self._last_search)
+        elif e.modifiers() == (Qt.KeyboardModifier.ControlModifier | Qt.KeyboardModifier.ShiftModifier) \
+                and e.key() == Qt.Key.Key_G:
+            self.ask_offset()
+        elif e.modifiers() == Qt.KeyboardModifier.ControlModifier and e.key() == Qt.Key.Key_G:
+            self.ask_line()
+        elif e.key() == Qt.Key.Key_Home and e.modifiers() == Qt.KeyboardModifier.ControlModifier:
+            self.go_to_line(0)
+        elif e.key() == Qt.Key.Key_End and e.modifiers() == Qt.KeyboardModifier.ControlModifier:
+            self.go_to_line(self.line_count - 1)
+        else:
+            super(LargeFileView, self).keyPressEvent(e)
+
+    def release(self):
+        """
+        Останавливает индексацию и поиск и отпускает отображение файла. Вызывается при
+        закрытии вкладки и не ждет фоновых задач: файл закроет та, что закончит последней.
+        """
+        if self.error_while_reading:
+            return
+        self.indexer.cancel()
+        self._search = None
+        for search in self._searches:
+            search.cancel()
+        self._searches = []
+        self.buffer = b''
+        self.mapped.release()
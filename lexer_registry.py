@@ -0,0 +1,112 @@
+import logging
+
+import PyQt6.Qsci as lexers
+from PyQt6.QtGui import QColor, QFont
+
+from globals import LOGGING_LEVEL
+from palettes import Theme
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOGGING_LEVEL)
+
+# Соответствие расширений языкам, если в settings.json нет своего.
+# Язык - это окончание имени класса лексера: 'Python' -> QsciLexerPython.
+DEFAULT_LANGUAGES = {
+    'json': 'JSON',
+    'py': 'Python',
+    'html': 'HTML',
+    'cs': 'CSharp',
+    'cpp': 'CPP',
+    'java': 'Java',
+    'css': 'CSS',
+    'js': 'JavaScript',
+}
+
+DARK_PAPER = '#353535'
+DARK_DEFAULT = 'white'
+# Цвета темной темы по описанию стиля лексера. Правила проверяются по порядку,
+# поэтому более точные описания стоят раньше общих.
+DARK_STYLE_COLORS = (
+    ('comment block', '#9ecbf2'),
+    ('comment', '#4c6a7d'),
+    ('keyword', '#f97578'),
+    ('number', '#9ecbf2'),
+    ('string', '#9ecbf2'),
+    ('class', '#b389c9'),
+    ('function', '#b389c9'),
+    ('decorator', '#b389c9'),
+)
+
+
+class LexerRegistry:
+    """
+    Общий реестр лексеров.
+
+    Каждый лексер создается и настраивается один раз на пару (язык, тема) и затем
+    используется всеми редакторами. Расширения сопоставляются языкам по таблице
+    из settings.json, поэтому для нового языка достаточно добавить в неё строку.
+    """
+
+    def __init__(self):
+        self.languages = dict(DEFAULT_LANGUAGES)
+        self._lexers = {}
+        self._font = None
+
+    def configure(self, languages: dict | None):
+        if languages:
+            self.languages = dict(languages)
+
+    def language_for(self, extension) -> str | None:
+        return self.languages.get((extension or '').lower())
+
+    def lexer_for(self, extension, theme):
+        """
+        Возвращает общий лексер для расширения файла (без точки) или None.
+        """
+        language = self.language_for(extension)
+        return self.lexer(language, theme) if language else None
+
+    def lexer(self, language, theme):
+        """
+        Возвращает общий лексер языка для темы, при первом обращении создавая его.
+        """
+        key = (language, theme)
+        if key in self._lexers:
+            return self._lexers[key]
+
+        lexer_class = getattr(lexers, f'QsciLexer{language}', None)
+        if lexer_class is None:
+            logger.warning(f"Лексер для языка {language} не найден")
+            self._lexers[key] = None
+            return None
+
+        lexer = lexer_class()
+        lexer.setFont(self.font())
+        if theme == Theme.DARK:
+            self._apply_dark_theme(lexer)
+        self._lexers[key] = lexer
+        return lexer
+
+    def font(self) -> QFont:
+        if self._font is None:
+            self._font = QFont('Fira Code')
+            self._font.setPointSize(10)
+        return self._font
+
+    @staticmethod
+    def _apply_dark_theme(lexer):
+        lexer.setDefaultPaper(QColor(DARK_PAPER))
+        lexer.setPaper(QColor(DARK_PAPER), -1)
+        lexer.setColor(QColor(DARK_DEFAULT), -1)
+        # Номера стилей у лексеров идут не подряд, но описание есть только у занятых
+        for style in range(128):
+            description = lexer.description(style).lower()
+            if not description:
+                continue
+            for part, color in DARK_STYLE_COLORS:
+                if part in description:
+                    lexer.setColor(QColor(color), style)
+                    break
+
+
+lexer_registry = LexerRegistry()
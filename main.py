@@ -1,19 +1,82 @@
 import sys
+import time
+from functools import partial
 
-from PyQt6.QtWidgets import QApplication, QStyleFactory
+STARTUP_PROFILE_FLAG = '--startup-profile'
+
+
+class StartupProfiler:
+    """
+    Замеряет время этапов запуска редактора и печатает их по флагу `--startup-profile`.
+    """
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.phases = []
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def watch_first_paint(self, widget):
+        """
+        Отмечает этап первой отрисовки окна и печатает отчет.
+        """
+        from PyQt6.QtCore import QEvent, QObject
+
+        profiler = self
+
+        class FirstPaintFilter(QObject):
+            def eventFilter(self, obj, event):
+                if event.type() == QEvent.Type.Paint:
+                    obj.removeEventFilter(self)
+                    profiler.mark('Первая отрисовка')
+                    profiler.report()
+                return False
+
+        self._paint_filter = FirstPaintFilter(widget)
+        widget.installEventFilter(self._paint_filter)
+
+    def report(self):
+        if not self.enabled:
+            return
+        print('Профиль запуска:', file=sys.stderr)
+        for phase, seconds in self.phases:
+            print(f'  {phase:<28}{seconds * 1000:8.1f} мс', file=sys.stderr)
+        total = self.last - self.started
+        print(f'  {"Итого до первого окна":<28}{total * 1000:8.1f} мс', file=sys.stderr)
 
-from palettes import get_dark_palette, Theme
-from utils import SettingsInstance
-from window import CustomMainWindow
 
 if __name__ == '__main__':
+    profiler = StartupProfiler(STARTUP_PROFILE_FLAG in sys.argv)
+    if profiler.enabled:
+        sys.argv.remove(STARTUP_PROFILE_FLAG)
+
+    from PyQt6.QtWidgets import QApplication, QStyleFactory
+
+    from palettes import get_dark_palette, Theme
+    from utils import SettingsInstance
+    from window import CustomMainWindow
+    profiler.mark('Импорт модулей')
+
     app = QApplication(sys.argv)
 
     QApplication.setStyle(QStyleFactory.create('Fusion'))
+    profiler.mark('Создание QApplication')
     
     settings = SettingsInstance()
+    # Отложенные изменения настроек записываются до выхода из приложения
+    app.aboutToQuit.connect(partial(settings.flush, wait=True))
     if settings.default_theme == Theme.DARK:
         app.setPalette(get_dark_palette())
+    profiler.mark('Загрузка SettingsInstance')
+
     gui = CustomMainWindow(settings)
+    profiler.mark('Создание CustomMainWindow')
+    if profiler.enabled:
+        profiler.watch_first_paint(gui)
 
     sys.exit(app.exec())
@@ -0,0 +1,170 @@
+import heapq
+import os
+import re
+
+from PyQt6.QtCore import Qt, pyqtSignal
+from PyQt6.QtGui import QKeyEvent
+from PyQt6.QtWidgets import (QDialog, QDockWidget, QLabel, QLineEdit, QListWidget, QListWidgetItem,
+                             QTreeWidget, QTreeWidgetItem, QVBoxLayout)
+
+from project_index import fuzzy_pattern
+
+# Сколько символов показывается в окне перехода к символу.
+GO_TO_SYMBOL_LIMIT = 50
+
+KIND_PREFIXES = {'class': 'class', 'function': 'def', 'method': 'def'}
+
+
+def symbol_label(symbol) -> str:
+    return f"{KIND_PREFIXES[symbol.kind]} {symbol.name}"
+
+
+class OutlineDock(QDockWidget):
+    """
+    Док панель со структурой открытого файла Python: классы, функции и методы
+    с вложенностью. Обновляется после разбора правок в фоне.
+    """
+    # Выбран символ: номер строки с нуля в открытом файле
+    lineActivated = pyqtSignal(int)
+
+    def __init__(self, symbol_index, parent=None):
+        super(OutlineDock, self).__init__("Структура", parent)
+        self.symbol_index = symbol_index
+        self.outline = None
+
+        self.tree = QTreeWidget()
+        self.tree.setHeaderHidden(True)
+        self.tree.setUniformRowHeights(True)
+        self.tree.itemActivated.connect(self._on_item_activated)
+        self.setWidget(self.tree)
+
+        symbol_index.documentChanged.connect(self._on_document_changed)
+
+    def show_document(self, outline):
+        """
+        Показывает структуру файла `outline` (`DocumentOutline` или None для вкладок не Python).
+        """
+        self.outline = outline
+        self.refresh()
+
+    def _on_document_changed(self, outline):
+        if outline is self.outline:
+            self.refresh()
+
+    def refresh(self):
+        self.tree.clear()
+        if self.outline is None:
+            return
+        self.tree.setUpdatesEnabled(False)
+        # Родитель для каждой глубины вложенности
+        parents = [self.tree.invisibleRootItem()]
+        for symbol in self.outline.symbols:
+            del parents[symbol.depth + 1:]
+            item = QTreeWidgetItem(parents[-1], [symbol_label(symbol)])
+            item.setData(0, Qt.ItemDataRole.UserRole, symbol.line)
+            item.setToolTip(0, f"Строка {symbol.line + 1}")
+            parents.append(item)
+        self.tree.expandAll()
+        self.tree.setUpdatesEnabled(True)
+
+    def _on_item_activated(self, item, column):
+        self.lineActivated.emit(item.data(0, Qt.ItemDataRole.UserRole))
+
+
+class GoToSymbolPopup(QDialog):
+    """
+    Всплывающее окно перехода к символу (Ctrl+Shift+O) по открытым файлам
+    и всем файлам Python открытой папки. Символы открытого файла идут первыми.
+    Как и в быстром открытии, дописанный запрос ищет только среди совпадений предыдущего.
+    """
+    # Выбран символ: путь к файлу (None для несохраненного файла) и номер строки с нуля
+    symbolChosen = pyqtSignal(object, int)
+
+    def __init__(self, symbol_index, parent=None):
+        super(GoToSymbolPopup, self).__init__(parent)
+        self.setWindowFlags(Qt.WindowType.Popup)
+        self.symbol_index = symbol_index
+        self.current_path = None
+        self._last_query = ''
+        self._last_matches = None
+
+        self.query = QLineEdit()
+        self.query.setPlaceholderText("Имя класса или функции")
+        self.query.textChanged.connect(self.refresh)
+        self.results = QListWidget()
+        self.results.itemActivated.connect(self.choose)
+        self.status = QLabel()
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(4, 4, 4, 4)
+        layout.addWidget(self.query)
+        layout.addWidget(self.results)
+        layout.addWidget(self.status)
+
+    def popup(self, current_path=None):
+        self.current_path = os.path.abspath(current_path) if current_path else None
+        self._last_query, self._last_matches = '', None
+        parent = self.parentWidget()
+        if parent:
+            width = max(400, parent.width() // 2)
+            self.resize(width, 360)
+            top_left = parent.mapToGlobal(parent.rect().topLeft())
+            self.move(top_left.x() + (parent.width() - width) // 2, top_left.y() + 40)
+        self.query.clear()
+        self.refresh()
+        self.show()
+        self.query.setFocus()
+
+    def refresh(self):
+        query = self.query.text().strip()
+        self.results.clear()
+
+        if query and self._last_query and query.startswith(self._last_query):
+            candidates = self._last_matches
+        else:
+            candidates = list(self.symbol_index.all_symbols())
+        if query:
+            pattern = re.compile(fuzzy_pattern(query).pattern, re.IGNORECASE)
+            matches = [(path, symbol) for path, symbol in candidates if pattern.search(symbol.name)]
+            lowered = query.lower()
+            shown = heapq.nsmallest(GO_TO_SYMBOL_LIMIT, matches, key=lambda match: (
+                not match[1].name.lower().startswith(lowered),
+                match[0] != self.current_path,
+                len(match[1].name),
+                match[1].name,
+            ))
+        else:
+            matches = candidates
+            # Без запроса - структура открытого файла
+            shown = [match for match in candidates if match[0] == self.current_path][:GO_TO_SYMBOL_LIMIT]
+        self._last_query, self._last_matches = query, matches
+
+        root = self.symbol_index.project_index.root
+        for path, symbol in shown:
+            where = os.path.relpath(path, root) if root and path and path.startswith(root) \
+                else os.path.basename(path or '') or "новый файл"
+            container = f"{symbol.container} · " if symbol.container else ''
+            item = QListWidgetItem(f"{symbol_label(symbol)}    {container}{where}:{symbol.line + 1}")
+            item.setData(Qt.ItemDataRole.UserRole, (path, symbol.line))
+            self.results.addItem(item)
+        if shown:
+            self.results.setCurrentRow(0)
+        self.status.setText(f"Найдено: {len(matches)}")
+
+    def choose(self, item=None):
+        item = item or self.results.currentItem()
+        if item is None:
+            return
+        self.close()
+        self.symbolChosen.emit(*item.data(Qt.ItemDataRole.UserRole))
+
+    def keyPressEvent(self, e: QKeyEvent):
+        if e.key() in (Qt.Key.Key_Down, Qt.Key.Key_Up):
+            step = 1 if e.key() == Qt.Key.Key_Down else -1
+            row = self.results.currentRow() + step
+            if 0 <= row < self.results.count():
+                self.results.setCurrentRow(row)
+        elif e.key() in (Qt.Key.Key_Return, Qt.Key.Key_Enter):
+            self.choose()
+        else:
+            super(GoToSymbolPopup, self).keyPressEvent(e)
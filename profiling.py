@@ -0,0 +1,416 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import pstats
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from PyQt6.QtCore import QObject, QRunnable, Qt, QThreadPool, pyqtSignal
+from PyQt6.QtWidgets import (QDockWidget, QLabel, QTableWidget, QTableWidgetItem, QTabWidget,
+                             QVBoxLayout, QWidget)
+
+from globals import CACHE_DIRECTORY, LOGGING_LEVEL
+from run_panel import child_times, command_arguments
+from utils import atomic_write
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOGGING_LEVEL)
+
+# Сколько самых затратных функций показывается в таблице профиля.
+HOTSPOT_LIMIT = 200
+# Сколько последних замеров хранится для каждого файла.
+BENCHMARK_HISTORY_SIZE = 20
+DEFAULT_BENCHMARK_REPEATS = 10
+
+Hotspot = namedtuple('Hotspot', ['function', 'path', 'line', 'calls', 'total', 'cumulative'])
+
+
+def _file_key(file_path) -> str:
+    return hashlib.sha1(os.path.normcase(os.path.abspath(file_path)).encode('utf8')).hexdigest()[:16]
+
+
+def profile_output_path(file_path) -> str:
+    """
+    Куда cProfile сохраняет последний профиль файла.
+    """
+    return os.path.join(CACHE_DIRECTORY, 'profiles', f'{_file_key(file_path)}.prof')
+
+
+def profile_template(template, output) -> str:
+    """
+    Превращает шаблон запуска Python файла в запуск под cProfile с записью в `output`.
+    """
+    return template.replace('$file_path', f'-m cProfile -o "{output}" $file_path', 1)
+
+
+def load_hotspots(path, limit=HOTSPOT_LIMIT) -> list:
+    """
+    Читает профиль cProfile и возвращает функции с наибольшим собственным временем.
+    """
+    stats = pstats.Stats(path)
+    hotspots = []
+    for (file_name, line, function), (_, calls, total, cumulative, _) in stats.stats.items():
+        hotspots.append(Hotspot(function, file_name, line, calls, total, cumulative))
+    hotspots.sort(key=lambda hotspot: hotspot.total, reverse=True)
+    return hotspots[:limit]
+
+
+def file_version(file_path) -> str:
+    """
+    Короткий хеш содержимого файла, чтобы замеры разных правок можно было различить.
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()[:8]
+    except OSError:
+        return ''
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class BenchmarkHistory:
+    """
+    Результаты замеров по файлам, сохраняются в `CACHE_DIRECTORY`.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CACHE_DIRECTORY, 'benchmarks.json')
+        self._results = None
+
+    def _load(self) -> dict:
+        if self._results is None:
+            try:
+                with open(self.path, 'r', encoding='utf8') as f:
+                    self._results = json.load(f)
+            except (OSError, ValueError):
+                self._results = {}
+        return self._results
+
+    def get(self, file_path) -> list:
+        return self._load().get(os.path.abspath(file_path), [])
+
+    def add(self, file_path, result: dict):
+        results = self._load()
+        history = results.setdefault(os.path.abspath(file_path), [])
+        history.append(result)
+        del history[:-BENCHMARK_HISTORY_SIZE]
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            atomic_write(self.path, json.dumps(results, ensure_ascii=False, indent=1))
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить результаты замеров: {e}")
+
+
+class BenchmarkSignals(QObject):
+    # Завершен очередной запуск: номер и общее число
+    progress = pyqtSignal(int, int)
+    # Результат замера, None если замер остановлен
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+
+class BenchmarkJob(QRunnable):
+    """
+    Запускает команду `repeats` раз подряд и замеряет время каждого запуска и пиковую
+    память процесса. Вывод программы отбрасывается, чтобы не влиять на замер.
+
+    Пиковая память берется из `os.wait4` и в Windows недоступна.
+    """
+
+    def __init__(self, arguments, cwd, repeats):
+        super(BenchmarkJob, self).__init__()
+        self.arguments = arguments
+        self.cwd = cwd
+        self.repeats = repeats
+        self.signals = BenchmarkSignals()
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+        self._process = None
+
+    def cancel(self):
+        self.cancelled.set()
+        if self._process is not None:
+            self._process.kill()
+
+    def run(self):
+        try:
+            self._run()
+        except Exception as e:
+            logger.error(f"Ошибка замера: {e}")
+            self.signals.failed.emit(str(e))
+        finally:
+            self.done.set()
+
+    def _run(self):
+        times, peaks = [], []
+        for i in range(self.repeats):
+            if self.cancelled.is_set():
+                self.signals.finished.emit(None)
+                return
+            elapsed, code, peak = self._run_once()
+            if self.cancelled.is_set():
+                self.signals.finished.emit(None)
+                return
+            if code != 0:
+                self.signals.failed.emit(f"Запуск {i + 1} завершился с кодом {code}")
+                return
+            times.append(elapsed)
+            if peak is not None:
+                peaks.append(peak)
+            self.signals.progress.emit(i + 1, self.repeats)
+        self.signals.finished.emit({
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'repeats': len(times),
+            'min': min(times),
+            'median': statistics.median(times),
+            'p95': percentile(times, 0.95),
+            'peak_rss': max(peaks) if peaks else None,
+        })
+
+    def _run_once(self):
+        started = time.perf_counter()
+        process = self._process = subprocess.Popen(self.arguments, cwd=self.cwd,
+                                                   stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                                   stderr=subprocess.DEVNULL)
+        if not hasattr(os, 'wait4'):
+            code = process.wait()
+            return time.perf_counter() - started, code, None
+
+        if hasattr(os, 'waitid'):
+            # Ждем завершения, не забирая процесс, чтобы не держать блокировку все время работы
+            os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+        # Процесс забирается здесь, поэтому его время не должно попасть в замер
+        # процессорного времени запусков в панели вывода
+        with child_times.lock:
+            _, status, usage = os.wait4(process.pid, 0)
+            child_times.exclude(usage.ru_utime + usage.ru_stime)
+        elapsed = time.perf_counter() - started
+        process.returncode = os.waitstatus_to_exitcode(status)
+        # В Linux ru_maxrss в килобайтах, в macOS в байтах
+        peak = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+        return elapsed, process.returncode, peak
+
+
+def _number_item(value) -> QTableWidgetItem:
+    # Значение хранится числом, чтобы столбец сортировался по величине, а не как строка
+    item = QTableWidgetItem()
+    item.setData(Qt.ItemDataRole.DisplayRole, value)
+    item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+    return item
+
+
+def _format_size(size) -> str:
+    if size is None:
+        return "нет данных"
+    return f"{size / 1024 / 1024:.1f} МБ"
+
+
+class ProfileDock(QDockWidget):
+    """
+    Док панель профилирования: таблица самых затратных функций последнего профиля
+    и история замеров времени открытого файла.
+    """
+    # Выбрана функция из профиля: путь к файлу и номер строки с нуля
+    functionActivated = pyqtSignal(str, int)
+
+    HOTSPOT_COLUMNS = ("Функция", "Файл", "Вызовов", "Собственное, с", "Общее, с")
+    BENCHMARK_COLUMNS = ("Время", "Версия", "Повторов", "Мин, с", "Медиана, с", "p95, с", "Пик памяти")
+
+    def __init__(self, run_dock, parent=None):
+        super(ProfileDock, self).__init__("Профилирование", parent)
+        self.run_dock = run_dock
+        self.history = BenchmarkHistory()
+        self._profiles = {}
+        self._benchmark = None
+        self._benchmark_file = None
+        self._benchmark_version = None
+        self._file_path = None
+
+        self.hotspots = QTableWidget(0, len(self.HOTSPOT_COLUMNS))
+        self.hotspots.setHorizontalHeaderLabels(self.HOTSPOT_COLUMNS)
+        self.hotspots.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.hotspots.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+        self.hotspots.verticalHeader().setVisible(False)
+        self.hotspots.cellActivated.connect(self._on_hotspot_activated)
+        self.hotspots_status = QLabel()
+
+        self.benchmarks = QTableWidget(0, len(self.BENCHMARK_COLUMNS))
+        self.benchmarks.setHorizontalHeaderLabels(self.BENCHMARK_COLUMNS)
+        self.benchmarks.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.benchmarks.verticalHeader().setVisible(False)
+        self.benchmarks_status = QLabel()
+
+        self.tabs = QTabWidget()
+        self.tabs.addTab(self._page(self.hotspots, self.hotspots_status), "Горячие точки")
+        self.tabs.addTab(self._page(self.benchmarks, self.benchmarks_status), "Замеры")
+        self.setWidget(self.tabs)
+
+        run_dock.runFinished.connect(self._on_run_finished)
+
+    @staticmethod
+    def _page(table, status) -> QWidget:
+        page = QWidget()
+        layout = QVBoxLayout(page)
+        layout.setContentsMargins(4, 4, 4, 4)
+        layout.addWidget(table)
+        layout.addWidget(status)
+        return page
+
+    def profile(self, template, file_path):
+        """
+        Запускает файл под cProfile в панели вывода. Таблица заполнится, когда запуск
+        завершится, в том числе после перезапуска из панели вывода.
+        """
+        output = profile_output_path(file_path)
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        # Иначе после неудачного запуска показался бы профиль предыдущего
+        try:
+            os.remove(output)
+        except FileNotFoundError:
+            pass
+        template = profile_template(template, output)
+        self._profiles[template] = (file_path, output)
+        self.hotspots_status.setText("Профилирование...")
+        self.tabs.setCurrentIndex(0)
+        self.run_dock.start(template, file_path)
+
+    def _on_run_finished(self, run):
+        if run.template not in self._profiles:
+            return
+        file_path, output = self._profiles[run.template]
+        if run.error or run.killed or not os.path.exists(output):
+            self.hotspots_status.setText("Профиль не получен")
+            return
+        self.show_profile(file_path)
+        self.setVisible(True)
+
+    def show_profile(self, file_path):
+        output = profile_output_path(file_path)
+        try:
+            hotspots = load_hotspots(output)
+        except (OSError, ValueError, TypeError, EOFError):
+            self.hotspots.setRowCount(0)
+            self.hotspots_status.setText("Профиль еще не снимался")
+            return
+
+        self.hotspots.setSortingEnabled(False)
+        self.hotspots.setRowCount(len(hotspots))
+        for row, hotspot in enumerate(hotspots):
+            name = QTableWidgetItem(hotspot.function)
+            name.setData(Qt.ItemDataRole.UserRole, (hotspot.path, hotspot.line))
+            self.hotspots.setItem(row, 0, name)
+            location = f"{os.path.basename(hotspot.path)}:{hotspot.line}" if hotspot.line else hotspot.path
+            file_item = QTableWidgetItem(location)
+            file_item.setToolTip(hotspot.path)
+            self.hotspots.setItem(row, 1, file_item)
+            self.hotspots.setItem(row, 2, _number_item(hotspot.calls))
+            self.hotspots.setItem(row, 3, _number_item(round(hotspot.total, 6)))
+            self.hotspots.setItem(row, 4, _number_item(round(hotspot.cumulative, 6)))
+        self.hotspots.setSortingEnabled(True)
+        self.hotspots.sortByColumn(3, Qt.SortOrder.DescendingOrder)
+        self.hotspots.resizeColumnsToContents()
+        changed = datetime.fromtimestamp(os.path.getmtime(output)).strftime('%H:%M:%S')
+        self.hotspots_status.setText(f"{os.path.basename(file_path)}, профиль от {changed}")
+
+    def _on_hotspot_activated(self, row, column):
+        path, line = self.hotspots.item(row, 0).data(Qt.ItemDataRole.UserRole)
+        # Встроенные функции не имеют файла
+        if line and os.path.isfile(path):
+            self.functionActivated.emit(path, line - 1)
+
+    def benchmark(self, template, file_path, repeats=DEFAULT_BENCHMARK_REPEATS):
+        """
+        Запускает замер времени файла в фоне.
+        """
+        if self._benchmark:
+            self._benchmark.cancel()
+        self._benchmark_file = file_path
+        self._benchmark_version = file_version(file_path)
+        job = BenchmarkJob(command_arguments(template, file_path),
+                           os.path.dirname(file_path) or None, max(1, repeats))
+        job.signals.progress.connect(self._on_benchmark_progress)
+        job.signals.finished.connect(self._on_benchmark_finished)
+        job.signals.failed.connect(self._on_benchmark_failed)
+        self._benchmark = job
+        self.show_benchmarks(file_path)
+        self.benchmarks_status.setText("Замер...")
+        self.tabs.setCurrentIndex(1)
+        self.setVisible(True)
+        QThreadPool.globalInstance().start(job)
+
+    def _current(self) -> bool:
+        return self._benchmark is not None and self.sender() is self._benchmark.signals
+
+    def _on_benchmark_progress(self, done, total):
+        if self._current():
+            self.benchmarks_status.setText(f"Замер: запуск {done} из {total}")
+
+    def _on_benchmark_finished(self, result):
+        if not self._current():
+            return
+        self._benchmark = None
+        if result is None:
+            self.benchmarks_status.setText("Замер остановлен")
+            return
+        result['version'] = self._benchmark_version
+        self.history.add(self._benchmark_file, result)
+        self.show_benchmarks(self._benchmark_file)
+
+    def _on_benchmark_failed(self, message):
+        if not self._current():
+            return
+        self._benchmark = None
+        self.benchmarks_status.setText(f"Замер не удался: {message}")
+
+    def show_benchmarks(self, file_path):
+        """
+        Показывает историю замеров файла, новые сверху.
+        """
+        history = self.history.get(file_path)
+        self.benchmarks.setSortingEnabled(False)
+        self.benchmarks.setRowCount(len(history))
+        for row, result in enumerate(reversed(history)):
+            self.benchmarks.setItem(row, 0, QTableWidgetItem(result['time'].replace('T', ' ')))
+            self.benchmarks.setItem(row, 1, QTableWidgetItem(result.get('version', '')))
+            self.benchmarks.setItem(row, 2, _number_item(result['repeats']))
+            for column, key in enumerate(('min', 'median', 'p95'), 3):
+                self.benchmarks.setItem(row, column, _number_item(round(result[key], 4)))
+            self.benchmarks.setItem(row, 6, QTableWidgetItem(_format_size(result.get('peak_rss'))))
+        self.benchmarks.setSortingEnabled(True)
+        self.benchmarks.resizeColumnsToContents()
+        if history:
+            last = history[-1]
+            text = f"{os.path.basename(file_path)}: медиана {last['median']:.4f} с"
+            if len(history) > 1:
+                previous = history[-2]['median']
+                change = (last['median'] - previous) / previous * 100 if previous else 0
+                text += f" ({change:+.1f}% к предыдущему замеру)"
+            self.benchmarks_status.setText(text)
+        else:
+            self.benchmarks_status.setText(f"{os.path.basename(file_path)}: замеров еще не было")
+
+    def show_file(self, file_path):
+        """
+        Показывает профиль и замеры файла, например при переключении вкладки.
+        """
+        if file_path == self._file_path or self._benchmark:
+            return
+        self._file_path = file_path
+        self.show_profile(file_path)
+        self.show_benchmarks(file_path)
+
+    def release(self):
+        if self._benchmark:
+            self._benchmark.cancel()
+            self._benchmark.done.wait()
+            self._benchmark = None
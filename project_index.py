@@ -0,0 +1,400 @@
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import os
+import re
+import threading
+from collections import defaultdict
+from functools import partial
+
+from PyQt6.QtCore import QFileSystemWatcher, QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+
+from globals import CACHE_DIRECTORY, LOGGING_LEVEL
+from ignore import IgnoreRules
+from utils import atomic_write
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOGGING_LEVEL)
+
+# Сколько папок проекта отслеживается на изменения. Системные наблюдатели не бесплатны,
+# поэтому следим только за верхними уровнями, а остальное обновит следующий обход.
+MAX_WATCHED_DIRECTORIES = 1024
+# Через сколько миллисекунд после изменения папки она пересматривается.
+RESCAN_DELAY_MS = 300
+# Сколько кандидатов максимум проверяется за один поиск. Сначала идут имена, которые
+# начинаются с запроса: для коротких запросов лучшие совпадения среди них, а проверка
+# всех кандидатов слишком долгая.
+MAX_SCORED_CANDIDATES = 1000
+
+
+def index_cache_path(root) -> str:
+    key = hashlib.sha1(os.path.normcase(os.path.abspath(root)).encode('utf8')).hexdigest()[:16]
+    return os.path.join(CACHE_DIRECTORY, f'project-{key}.json')
+
+
+def fuzzy_pattern(query):
+    # Символы запроса должны встречаться в имени по порядку, но не обязательно подряд
+    return re.compile('.*?'.join(re.escape(c) for c in query))
+
+
+class FuzzyFileIndex:
+    """
+    Список файлов проекта с индексом для нечеткого поиска.
+
+    Для каждого символа хранится множество номеров файлов, в имени которых он есть,
+    поэтому кандидаты на совпадение находятся пересечением множеств, а регулярное
+    выражение проверяется уже только на них. Удаленные файлы оставляют пустое место,
+    чтобы номера остальных не сдвигались.
+    """
+
+    def __init__(self, paths=()):
+        # Пути относительно корня проекта с `/` в качестве разделителя
+        self.paths = []
+        self._names = []
+        self._ids = {}
+        self._by_char = defaultdict(set)
+        # Номера файлов по первым одному и двум символам имени
+        self._by_prefix = defaultdict(set)
+        for path in paths:
+            self.add(path)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, path):
+        return path in self._ids
+
+    def files(self) -> list:
+        return [path for path in self.paths if path is not None]
+
+    def add(self, path):
+        if path in self._ids:
+            return
+        file_id = len(self.paths)
+        name = path.rsplit('/', 1)[-1].lower()
+        self.paths.append(path)
+        self._names.append(name)
+        self._ids[path] = file_id
+        for char in set(name):
+            self._by_char[char].add(file_id)
+        for prefix in {name[:1], name[:2]}:
+            self._by_prefix[prefix].add(file_id)
+
+    def remove(self, path):
+        file_id = self._ids.pop(path, None)
+        if file_id is None:
+            return
+        name = self._names[file_id]
+        for char in set(name):
+            self._by_char[char].discard(file_id)
+        for prefix in {name[:1], name[:2]}:
+            self._by_prefix[prefix].discard(file_id)
+        self.paths[file_id] = None
+        self._names[file_id] = ''
+
+    def candidates(self, name_query, within=None) -> set:
+        # Символ, который есть в имени каждого файла, например точка, ничего не отсеивает
+        sets = [found for found in (self._by_char.get(char, set()) for char in set(name_query))
+                if len(found) < len(self._ids)]
+        if within is not None:
+            sets.append(within)
+        if not sets:
+            return set(self._ids.values())
+        sets.sort(key=len)
+        return sets[0].intersection(*sets[1:])
+
+    def search(self, query, limit=50, within=None):
+        """
+        Ищет файлы, в имени которых символы запроса идут по порядку. Если в запросе
+        есть `/`, часть до последнего `/` так же ищется в пути к папке файла.
+
+        :return: Список путей, лучшие первыми, множество номеров найденных совпадений
+                 и признак того, что проверены все кандидаты. Только в этом случае
+                 совпадения полные, и по ним можно сузить поиск при уточнении запроса
+        """
+        query = query.strip().lower().replace('\\', '/')
+        directory_query, _, name_query = query.rpartition('/')
+        name_match = fuzzy_pattern(name_query).search
+        directory_match = fuzzy_pattern(directory_query).search if directory_query else None
+
+        candidates = self.candidates(name_query, within)
+        complete = len(candidates) <= MAX_SCORED_CANDIDATES
+        if not complete:
+            starting = candidates & self._by_prefix.get(name_query[:2], set())
+            rest = (file_id for file_id in candidates if file_id not in starting)
+            candidates = itertools.islice(itertools.chain(starting, rest), MAX_SCORED_CANDIDATES)
+        scored = []
+        self._score(candidates, name_match, directory_match, scored)
+        best = heapq.nsmallest(limit, scored)
+        return [item[3] for item in best], {item[-1] for item in scored}, complete
+
+    def _score(self, file_ids, name_match, directory_match, scored):
+        for file_id in file_ids:
+            name = self._names[file_id]
+            match = name_match(name)
+            if match is None:
+                continue
+            path = self.paths[file_id]
+            if directory_match and not directory_match(path.lower(), 0, max(0, len(path) - len(name))):
+                continue
+            # Лучше совпадения, где символы идут плотнее и ближе к началу имени, и короткие пути
+            scored.append((match.end() - match.start(), match.start(), len(path), path, file_id))
+
+
+class ProjectIndexerSignals(QObject):
+    # Индекс из кэша на диске, пока идет обход
+    loaded = pyqtSignal(object)
+    # Индекс после полного обхода папки; None, если обход был отменен
+    finished = pyqtSignal(object)
+    # Файлы, найденные при обходе новой подпапки
+    found = pyqtSignal(str, object)
+
+
+def walk(root, base='', rules=None, cancelled=None):
+    """
+    Обходит папку `root`/`base` без рекурсии и возвращает пути файлов относительно
+    `root`, не заходя в исключенные папки.
+    """
+    files = []
+    stack = [base]
+    while stack:
+        if cancelled is not None and cancelled.is_set():
+            break
+        relative = stack.pop()
+        try:
+            with os.scandir(os.path.join(root, relative) if relative else root) as entries:
+                for entry in entries:
+                    path = f'{relative}/{entry.name}' if relative else entry.name
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if rules is not None and rules.is_ignored(path, is_dir):
+                        continue
+                    if is_dir:
+                        stack.append(path)
+                    else:
+                        files.append(path)
+        except OSError:
+            continue
+    return files
+
+
+class ProjectIndexer(QRunnable):
+    """
+    Строит индекс проекта в фоновом потоке: сначала читает сохраненный индекс,
+    чтобы быстрый поиск заработал сразу, потом обходит папку и сохраняет свежий.
+    """
+
+    def __init__(self, root, rules, base=''):
+        super(ProjectIndexer, self).__init__()
+        self.root = root
+        self.rules = rules
+        self.base = base
+        self.signals = ProjectIndexerSignals()
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        try:
+            self._run()
+        finally:
+            self.done.set()
+
+    def _run(self):
+        if self.base:
+            self.signals.found.emit(self.base, walk(self.root, self.base, self.rules, self.cancelled))
+            return
+
+        cache_path = index_cache_path(self.root)
+        try:
+            with open(cache_path, 'r', encoding='utf8') as f:
+                cached = json.load(f)
+            if cached.get('root') == self.root:
+                self.signals.loaded.emit(FuzzyFileIndex(cached.get('files', ())))
+        except (OSError, ValueError):
+            pass
+
+        files = walk(self.root, rules=self.rules, cancelled=self.cancelled)
+        if self.cancelled.is_set():
+            self.signals.finished.emit(None)
+            return
+        files.sort()
+        self.signals.finished.emit(FuzzyFileIndex(files))
+        try:
+            os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+            atomic_write(cache_path, json.dumps({'root': self.root, 'files': files}, ensure_ascii=False))
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить индекс проекта: {e}")
+
+
+class ProjectIndex(QObject):
+    """
+    Индекс файлов открытой папки для быстрого открытия файлов.
+
+    Индекс строится в фоне при открытии папки и сохраняется в `CACHE_DIRECTORY`,
+    поэтому при следующем открытии той же папки поиск доступен сразу. После обхода
+    изменения в отслеживаемых папках применяются к индексу по одной папке.
+    """
+    # Индекс готов к поиску или обновился
+    changed = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super(ProjectIndex, self).__init__(parent)
+        self.root = None
+        self.rules = None
+        self.index = FuzzyFileIndex()
+        self.ready = False
+        self._indexer = None
+        self._jobs = set()
+        self._dirty_directories = set()
+        self._rescan_timer = QTimer(self)
+        self._rescan_timer.setSingleShot(True)
+        self._rescan_timer.setInterval(RESCAN_DELAY_MS)
+        self._rescan_timer.timeout.connect(self._rescan)
+        self.watcher = None
+
+    def open(self, root):
+        """
+        Начинает индексировать папку `root`, прекращая индексацию предыдущей.
+        """
+        self.close()
+        self.root = os.path.abspath(root).replace('\\', '/')
+        self.rules = IgnoreRules(self.root)
+        self.index = FuzzyFileIndex()
+        self.ready = False
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self._on_directory_changed)
+
+        self._indexer = ProjectIndexer(self.root, self.rules)
+        self._indexer.signals.loaded.connect(self._on_loaded)
+        self._indexer.signals.finished.connect(self._on_finished)
+        self._start(self._indexer, self._indexer.signals.finished)
+
+    def _start(self, job, last_signal):
+        # Задача хранится, пока не придет её последний сигнал, иначе вместе с ней удалятся и сигналы
+        self._jobs.add(job)
+        last_signal.connect(partial(self._forget, job))
+        QThreadPool.globalInstance().start(job)
+
+    def _forget(self, job, *args):
+        QTimer.singleShot(0, lambda: self._jobs.discard(job))
+
+    def close(self, wait=False):
+        """
+        Прекращает индексацию. С `wait` дожидается остановки фоновых обходов,
+        это нужно перед выходом из приложения.
+        """
+        for job in self._jobs:
+            job.cancel()
+        if wait:
+            for job in list(self._jobs):
+                job.done.wait()
+        self._indexer = None
+        if self.watcher:
+            self.watcher.deleteLater()
+            self.watcher = None
+        self._dirty_directories.clear()
+
+    def search(self, query, limit=50, within=None):
+        return self.index.search(query, limit, within)
+
+    def absolute(self, path) -> str:
+        return os.path.join(self.root, path)
+
+    def _accept(self, indexer):
+        return indexer is self._indexer and self.sender() is indexer.signals
+
+    def _on_loaded(self, index):
+        if self._accept(self._indexer) and not self.ready:
+            self.index = index
+            self.ready = True
+            self.changed.emit()
+
+    def _on_finished(self, index):
+        if index is None or not self._accept(self._indexer):
+            return
+        self.index = index
+        self.ready = True
+        self._indexer = None
+        self._watch(index)
+        logger.debug(f"Проиндексировано файлов в {self.root}: {len(index)}")
+        self.changed.emit()
+
+    def _watch(self, index):
+        # Папки выбираются от верхних к нижним, пока не кончится лимит
+        directories = {''}
+        for path in index.files():
+            parts = path.split('/')[:-1]
+            for depth in range(1, len(parts) + 1):
+                directories.add('/'.join(parts[:depth]))
+        watched = sorted(directories, key=lambda d: (d.count('/') + bool(d), d))[:MAX_WATCHED_DIRECTORIES]
+        self.watcher.addPaths([self.absolute(d) if d else self.root for d in watched])
+
+    def _on_directory_changed(self, directory):
+        self._dirty_directories.add(directory)
+        self._rescan_timer.start()
+
+    def _rescan(self):
+        """
+        Сверяет содержимое измененных папок с индексом: добавляет новые файлы,
+        убирает удаленные, а новые подпапки обходит в фоне целиком.
+        """
+        directories, self._dirty_directories = self._dirty_directories, set()
+        # Список файлов берется один раз на всю пачку папок: он строится за O(N)
+        files = self.index.files()
+        for directory in directories:
+            relative = os.path.relpath(directory, self.root).replace('\\', '/')
+            relative = '' if relative == '.' else relative
+            prefix = f'{relative}/' if relative else ''
+            # Файлы могли быть убраны при сверке предыдущей папки этой же пачки
+            known = {path for path in files if path.startswith(prefix) and path in self.index}
+
+            present_files, present_directories = set(), set()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        path = prefix + entry.name
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        if self.rules.is_ignored(path, is_dir):
+                            continue
+                        (present_directories if is_dir else present_files).add(path)
+            except OSError:
+                pass
+
+            for path in known:
+                rest = path[len(prefix):]
+                subdirectory = rest.split('/', 1)[0]
+                if '/' not in rest:
+                    if path not in present_files:
+                        self.index.remove(path)
+                elif prefix + subdirectory not in present_directories:
+                    self.index.remove(path)
+            for path in present_files - known:
+                self.index.add(path)
+
+            known_directories = {prefix + path[len(prefix):].split('/', 1)[0]
+                                 for path in known if '/' in path[len(prefix):]}
+            for subdirectory in present_directories - known_directories:
+                self._index_subdirectory(subdirectory)
+        self.changed.emit()
+
+    def _index_subdirectory(self, base):
+        job = ProjectIndexer(self.root, self.rules, base)
+        job.signals.found.connect(partial(self._on_found, self.root))
+        self._start(job, job.signals.found)
+
+    def _on_found(self, root, base, files):
+        if root != self.root:
+            # Подпапка из предыдущего проекта
+            return
+        for path in files:
+            self.index.add(path)
+        if self.watcher and len(self.watcher.directories()) < MAX_WATCHED_DIRECTORIES:
+            self.watcher.addPath(self.absolute(base))
+        self.changed.emit()
@@ -0,0 +1,263 @@
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from PyQt6.QtCore import QObject, QRunnable, Qt, QThreadPool, pyqtSignal
+from PyQt6.QtGui import QAction, QKeySequence
+from PyQt6.QtWidgets import (QCheckBox, QDockWidget, QHBoxLayout, QLabel, QLineEdit,
+                             QPushButton, QTreeWidget, QTreeWidgetItem, QVBoxLayout, QWidget)
+
+from globals import LOGGING_LEVEL
+from ignore import IgnoreRules
+from project_index import walk
+from search_worker import search_files
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOGGING_LEVEL)
+
+# Сколько файлов проверяет процесс пула за одну задачу.
+FILES_PER_TASK = 32
+# Сколько задач одновременно стоит в очереди пула на каждый процесс: больше не нужно,
+# чтобы отмена не ждала разбора длинной очереди.
+TASKS_PER_WORKER = 4
+# После стольких найденных строк поиск останавливается.
+MAX_RESULTS = 20000
+
+
+class SearchSignals(QObject):
+    # Порция результатов: список пар (путь, [(строка, текст), ...])
+    batch = pyqtSignal(object)
+    # Поиск завершен: количество проверенных файлов и время в секундах
+    finished = pyqtSignal(int, float)
+    failed = pyqtSignal(str)
+
+
+class SearchJob(QRunnable):
+    """
+    Раздает файлы проекта процессам пула порциями по `FILES_PER_TASK` и пересылает
+    найденное в GUI поток по мере готовности. Отмена снимает еще не начатые задачи,
+    а уже начатые заканчиваются за время проверки одной порции файлов.
+    """
+
+    def __init__(self, pool, root, files, pattern: bytes, flags: int):
+        super(SearchJob, self).__init__()
+        self.pool = pool
+        self.root = root
+        self.files = files
+        self.pattern = pattern
+        self.flags = flags
+        self.signals = SearchSignals()
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        try:
+            self._run()
+        finally:
+            self.done.set()
+
+    def _run(self):
+        started = time.perf_counter()
+        files = self.files
+        if files is None:
+            files = walk(self.root, rules=IgnoreRules(self.root), cancelled=self.cancelled)
+        paths = [os.path.join(self.root, path) for path in files]
+        tasks = (paths[i:i + FILES_PER_TASK] for i in range(0, len(paths), FILES_PER_TASK))
+        limit = max(1, (os.cpu_count() or 1) * TASKS_PER_WORKER)
+
+        pending = set()
+        found = 0
+        try:
+            while not self.cancelled.is_set():
+                for chunk in tasks:
+                    pending.add(self.pool.submit(search_files, chunk, self.pattern, self.flags))
+                    if len(pending) >= limit:
+                        break
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                results = []
+                for future in done:
+                    results.extend(future.result())
+                if results and not self.cancelled.is_set():
+                    found += sum(len(matches) for _, matches in results)
+                    self.signals.batch.emit(results)
+                    if found >= MAX_RESULTS:
+                        self.cancel()
+        except Exception as e:
+            logger.error(f"Ошибка поиска: {e}")
+            self.signals.failed.emit(str(e))
+            return
+        finally:
+            for future in pending:
+                future.cancel()
+        self.signals.finished.emit(len(paths), time.perf_counter() - started)
+
+
+class SearchDock(QDockWidget):
+    """
+    Док панель поиска по всем файлам открытой папки.
+
+    Файлы проверяются в пуле процессов (по процессу на ядро) через `mmap`, двоичные
+    пропускаются. Результаты появляются в дереве по мере нахождения, двойной щелчок
+    по строке открывает файл на ней. Поиск можно остановить в любой момент.
+    """
+    # Выбрано совпадение: путь к файлу и номер строки с нуля
+    matchActivated = pyqtSignal(str, int)
+
+    def __init__(self, project_index, parent=None):
+        super(SearchDock, self).__init__("Поиск в файлах", parent)
+        self.project_index = project_index
+        self._pool = None
+        self._job = None
+        self._matches = 0
+
+        self.query = QLineEdit()
+        self.query.setPlaceholderText("Текст или регулярное выражение")
+        self.query.returnPressed.connect(self.start)
+        self.regex_box = QCheckBox("Регулярное выражение")
+        self.case_box = QCheckBox("Учитывать регистр")
+        self.search_button = QPushButton("Найти")
+        self.search_button.clicked.connect(self.start)
+        self.stop_button = QPushButton("Остановить")
+        self.stop_button.setEnabled(False)
+        self.stop_button.clicked.connect(self.stop)
+
+        self.results = QTreeWidget()
+        self.results.setHeaderHidden(True)
+        self.results.setUniformRowHeights(True)
+        self.results.itemActivated.connect(self._on_item_activated)
+        self.status = QLabel()
+
+        stop_action = QAction(self)
+        stop_action.setShortcut(QKeySequence(Qt.Key.Key_Escape))
+        stop_action.setShortcutContext(Qt.ShortcutContext.WidgetWithChildrenShortcut)
+        stop_action.triggered.connect(self.stop)
+
+        options = QHBoxLayout()
+        options.addWidget(self.regex_box)
+        options.addWidget(self.case_box)
+        options.addStretch()
+        options.addWidget(self.search_button)
+        options.addWidget(self.stop_button)
+
+        content = QWidget()
+        content.addAction(stop_action)
+        layout = QVBoxLayout(content)
+        layout.setContentsMargins(4, 4, 4, 4)
+        layout.addWidget(self.query)
+        layout.addLayout(options)
+        layout.addWidget(self.results)
+        layout.addWidget(self.status)
+        self.setWidget(content)
+
+    def focus_query(self, text=''):
+        self.setVisible(True)
+        if text:
+            self.query.setText(text)
+        self.query.setFocus()
+        self.query.selectAll()
+
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # fork копировал бы процесс с потоками Qt и их захваченными блокировками
+            self._pool = ProcessPoolExecutor(max_workers=os.cpu_count(),
+                                             mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def start(self):
+        """
+        Запускает поиск по открытой папке, останавливая предыдущий.
+        """
+        text = self.query.text()
+        root = self.project_index.root
+        if not text or not root:
+            self.status.setText("Откройте папку проекта" if not root else "")
+            return
+        pattern = text.encode('utf8')
+        if not self.regex_box.isChecked():
+            pattern = re.escape(pattern)
+        flags = re.MULTILINE | (0 if self.case_box.isChecked() else re.IGNORECASE)
+        try:
+            re.compile(pattern, flags)
+        except re.error as e:
+            self.status.setText(f"Ошибка в выражении: {e}")
+            return
+
+        self.stop()
+        self.results.clear()
+        self._matches = 0
+        files = self.project_index.index.files() if self.project_index.ready else None
+        self._job = SearchJob(self.pool(), root, files, pattern, flags)
+        self._job.signals.batch.connect(self._on_batch)
+        self._job.signals.finished.connect(self._on_finished)
+        self._job.signals.failed.connect(self._on_failed)
+        QThreadPool.globalInstance().start(self._job)
+        self.search_button.setEnabled(False)
+        self.stop_button.setEnabled(True)
+        self.status.setText("Поиск...")
+
+    def stop(self):
+        if self._job:
+            self._job.cancel()
+
+    def _current(self) -> bool:
+        return self._job is not None and self.sender() is self._job.signals
+
+    def _on_batch(self, results):
+        if not self._current():
+            return
+        root = self.project_index.root
+        self.results.setUpdatesEnabled(False)
+        for path, matches in results:
+            item = QTreeWidgetItem(self.results, [f"{os.path.relpath(path, root)} ({len(matches)})"])
+            item.setData(0, Qt.ItemDataRole.UserRole, (path, matches[0][0]))
+            for line, text in matches:
+                child = QTreeWidgetItem(item, [f"{line + 1}: {text.strip()}"])
+                child.setData(0, Qt.ItemDataRole.UserRole, (path, line))
+            self._matches += len(matches)
+        self.results.setUpdatesEnabled(True)
+        self.status.setText(f"Найдено строк: {self._matches}...")
+
+    def _on_finished(self, files, elapsed):
+        if not self._current():
+            return
+        stopped = self._job.cancelled.is_set()
+        self._job = None
+        self.search_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        note = " (поиск остановлен)" if stopped else ""
+        self.status.setText(f"Найдено строк: {self._matches} в {self.results.topLevelItemCount()} файлах, "
+                            f"проверено файлов: {files}, {elapsed:.2f} с{note}")
+
+    def _on_failed(self, message):
+        if not self._current():
+            return
+        self._job = None
+        self.search_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.status.setText(f"Ошибка поиска: {message}")
+
+    def _on_item_activated(self, item, column):
+        data = item.data(0, Qt.ItemDataRole.UserRole)
+        if data:
+            self.matchActivated.emit(*data)
+
+    def release(self):
+        """
+        Останавливает поиск и завершает процессы пула. Вызывается при закрытии окна.
+        """
+        if self._job:
+            self._job.cancel()
+            self._job.done.wait()
+            self._job = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,235 @@
+import logging
+import sqlite3
+import threading
+import time
+from functools import partial
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+
+from db_connections import registry
+from globals import LOGGING_LEVEL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOGGING_LEVEL)
+
+# Сколько строк передается в GUI поток за один сигнал.
+BATCH_SIZE = 500
+# Через сколько инструкций виртуальной машины SQLite проверяется флаг отмены.
+PROGRESS_STEPS = 1000
+
+
+class QuerySignals(QObject):
+    """
+    Сигналы запроса. Объект живет в GUI потоке, поэтому слоты вызываются в нем же.
+    """
+    # Очередная порция строк (список кортежей)
+    batch = pyqtSignal(object)
+    # Запрос выполнен, передается общее количество строк
+    finished = pyqtSignal(int)
+    # Запрос завершился ошибкой
+    failed = pyqtSignal(str)
+    # Запрос был отменен
+    cancelled = pyqtSignal()
+
+
+class QueryJob(QRunnable):
+    """
+    Один запрос к базе данных, выполняемый в потоке `QueryExecutor`.
+
+    Если `on_demand` включен, после каждой порции строк задача ждет вызова
+    `request_more`, так что курсор читается ровно настолько, насколько его
+    прокрутили в интерфейсе. Пока задача ждет, открытый курсор держит транзакцию
+    чтения: в режиме WAL она лишь не дает checkpoint дойти до конца журнала, а в режиме
+    с журналом отката держит блокировку SHARED, и запись в файл из других подключений
+    ждет, пока строки не будут дочитаны или запрос не будет остановлен.
+    """
+
+    def __init__(self, executor, query, params=(), batch_size=BATCH_SIZE, on_demand=False):
+        super(QueryJob, self).__init__()
+        self.executor = executor
+        self.query = query
+        self.params = params
+        self.batch_size = batch_size
+        self.on_demand = on_demand
+        self.signals = QuerySignals()
+        self.description = None
+        # Время работы запроса в потоке без учета ожидания `request_more`, в секундах
+        self.elapsed = 0.0
+        # Количество инструкций виртуальной машины SQLite (с точностью до PROGRESS_STEPS)
+        self.vm_steps = 0
+        self._cancelled = False
+        self._connection = None
+        self._lock = threading.Lock()
+        self._more = threading.Event()
+
+    @property
+    def is_cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        """
+        Отменяет запрос. Если он уже выполняется, SQLite прерывается через `interrupt()`.
+        """
+        with self._lock:
+            self._cancelled = True
+            if self._connection is not None:
+                self._connection.interrupt()
+        self._more.set()
+
+    def request_more(self):
+        """
+        Разрешает задаче с `on_demand` прочитать следующую порцию строк.
+        """
+        self._more.set()
+
+    def _progress(self):
+        self.vm_steps += PROGRESS_STEPS
+        return int(self._cancelled)
+
+    def run(self):
+        if self._cancelled:
+            self.signals.cancelled.emit()
+            return
+
+        try:
+            connection = self.executor.thread_connection(self.on_demand)
+        except sqlite3.Error as e:
+            self.signals.failed.emit(str(e))
+            return
+
+        with self._lock:
+            self._connection = connection
+        connection.set_progress_handler(self._progress, PROGRESS_STEPS)
+
+        total = 0
+        started = time.perf_counter()
+        try:
+            cursor = connection.execute(self.query, self.params)
+            self.description = cursor.description
+            while not self._cancelled:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                total += len(rows)
+                self.signals.batch.emit(rows)
+                if self.on_demand and len(rows) == self.batch_size:
+                    self.elapsed += time.perf_counter() - started
+                    self._more.wait()
+                    self._more.clear()
+                    started = time.perf_counter()
+            cursor.close()
+            if connection.in_transaction:
+                connection.commit()
+        except sqlite3.Error as e:
+            if connection.in_transaction:
+                connection.rollback()
+            if not (self._cancelled and isinstance(e, sqlite3.OperationalError)):
+                logger.error(f"Ошибка выполнения запроса: {e}")
+                self.signals.failed.emit(str(e))
+                return
+        finally:
+            self.elapsed += time.perf_counter() - started
+            connection.set_progress_handler(None, 0)
+            with self._lock:
+                self._connection = None
+
+        if self._cancelled:
+            self.signals.cancelled.emit()
+        else:
+            self.signals.finished.emit(total)
+
+
+class _CloseConnectionJob(QRunnable):
+
+    def __init__(self, executor, on_demand):
+        super(_CloseConnectionJob, self).__init__()
+        self.executor = executor
+        self.on_demand = on_demand
+
+    def run(self):
+        self.executor.close_thread_connection(self.on_demand)
+
+
+class QueryExecutor(QObject):
+    """
+    Выполняет запросы к одному файлу базы данных вне GUI потока.
+
+    У исполнителя есть свой пул из одного потока, который держит собственное
+    подключение к базе данных, поэтому запросы выполняются по очереди, а результаты
+    приходят в GUI поток сигналами порциями по `batch_size` строк. Задачи `on_demand`
+    простаивают между порциями, поэтому выполняются во втором таком же пуле со своим
+    подключением и не задерживают очередь остальных запросов.
+    """
+
+    def __init__(self, path, parent=None):
+        super(QueryExecutor, self).__init__(parent)
+        self.path = path
+        # Подключения пулов (ключ - `on_demand`) создаются в потоках пулов и используются только в них
+        self._connections = {}
+        self._closed = False
+        self._jobs = set()
+        self.pool = self._create_pool()
+        self.on_demand_pool = self._create_pool()
+
+    def _create_pool(self) -> QThreadPool:
+        pool = QThreadPool(self)
+        pool.setMaxThreadCount(1)
+        pool.setExpiryTimeout(-1)
+        return pool
+
+    def thread_connection(self, on_demand=False) -> sqlite3.Connection:
+        """
+        Возвращает подключение потока пула, при первом вызове создавая его.
+        """
+        connection = self._connections.get(on_demand)
+        if connection is None:
+            # Пул может пересоздать свой единственный поток, поэтому проверку потока отключаем
+            connection = registry.open(self.path, check_same_thread=False)
+            self._connections[on_demand] = connection
+            logger.debug(f"Рабочее подключение к {self.path} открыто")
+        return connection
+
+    def close_thread_connection(self, on_demand=False):
+        connection = self._connections.pop(on_demand, None)
+        if connection is not None:
+            connection.close()
+            logger.debug(f"Рабочее подключение к {self.path} закрыто")
+
+    def submit(self, query, params=(), batch_size=BATCH_SIZE, on_demand=False) -> QueryJob:
+        """
+        Ставит запрос в очередь. Слоты к сигналам `job.signals` нужно подключить сразу
+        после вызова, до возврата в цикл событий: запрос запускается только после этого.
+        """
+        job = QueryJob(self, query, params, batch_size, on_demand)
+        self._jobs.add(job)
+        for signal in (job.signals.finished, job.signals.failed, job.signals.cancelled):
+            signal.connect(partial(self._forget, job))
+        QTimer.singleShot(0, partial(self._start, job))
+        return job
+
+    def _start(self, job):
+        if not self._closed:
+            (self.on_demand_pool if job.on_demand else self.pool).start(job)
+
+    def _forget(self, job, *args):
+        # Ссылку на задачу отпускаем после того, как отработают остальные слоты сигнала,
+        # иначе вместе с задачей удалятся и её сигналы
+        QTimer.singleShot(0, lambda: self._jobs.discard(job))
+
+    def cancel_all(self):
+        """
+        Отменяет все запросы, которые еще не завершились.
+        """
+        for job in list(self._jobs):
+            job.cancel()
+
+    def close(self):
+        """
+        Отменяет запросы, дожидается завершения потока и закрывает его подключение.
+        """
+        self._closed = True
+        self.cancel_all()
+        for on_demand, pool in ((False, self.pool), (True, self.on_demand_pool)):
+            pool.start(_CloseConnectionJob(self, on_demand))
+        for pool in (self.pool, self.on_demand_pool):
+            pool.waitForDone()
@@ -0,0 +1,108 @@
+import time
+
+from PyQt6.QtCore import Qt, pyqtSignal
+from PyQt6.QtGui import QKeyEvent
+from PyQt6.QtWidgets import QDialog, QLabel, QLineEdit, QListWidget, QVBoxLayout
+
+# Сколько файлов показывается в списке быстрого открытия.
+QUICK_OPEN_LIMIT = 50
+
+
+class QuickOpenPopup(QDialog):
+    """
+    Всплывающее окно быстрого открытия файла проекта (Ctrl+P).
+
+    Поиск идет по `ProjectIndex`. Пока запрос только дописывается, следующий поиск
+    проверяет лишь файлы, подошедшие под предыдущий, поэтому каждое нажатие клавиши
+    обходится дешевле первого. Если кандидатов слишком много, индекс проверяет только
+    часть из них, и тогда число совпадений показывается как нижняя граница.
+    """
+    # Выбран файл, передается абсолютный путь
+    fileChosen = pyqtSignal(str)
+
+    def __init__(self, project_index, parent=None):
+        super(QuickOpenPopup, self).__init__(parent)
+        self.setWindowFlags(Qt.WindowType.Popup)
+        self.project_index = project_index
+        self._last_query = ''
+        self._last_matches = None
+
+        self.query = QLineEdit()
+        self.query.setPlaceholderText("Имя файла")
+        self.query.textChanged.connect(self.refresh)
+        self.results = QListWidget()
+        self.results.itemActivated.connect(self.choose)
+        self.status = QLabel()
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(4, 4, 4, 4)
+        layout.addWidget(self.query)
+        layout.addWidget(self.results)
+        layout.addWidget(self.status)
+
+        project_index.changed.connect(self._on_index_changed)
+
+    def popup(self):
+        parent = self.parentWidget()
+        if parent:
+            width = max(400, parent.width() // 2)
+            self.resize(width, 360)
+            top_left = parent.mapToGlobal(parent.rect().topLeft())
+            self.move(top_left.x() + (parent.width() - width) // 2, top_left.y() + 40)
+        self.query.clear()
+        self.refresh()
+        self.show()
+        self.query.setFocus()
+
+    def _on_index_changed(self):
+        # Сохраненные совпадения относятся к старому индексу
+        self._last_query = ''
+        self._last_matches = None
+        if self.isVisible():
+            self.refresh()
+
+    def refresh(self):
+        query = self.query.text()
+        self.results.clear()
+        if not self.project_index.ready:
+            self.status.setText("Индексация проекта...")
+            return
+        if not query.strip():
+            self.status.setText(f"Файлов в проекте: {len(self.project_index.index)}")
+            self._last_query, self._last_matches = '', None
+            return
+
+        within = None
+        if self._last_query and query.startswith(self._last_query) \
+                and query.count('/') == self._last_query.count('/'):
+            within = self._last_matches
+
+        started = time.perf_counter()
+        paths, matches, complete = self.project_index.search(query, QUICK_OPEN_LIMIT, within)
+        elapsed = (time.perf_counter() - started) * 1000
+        # Неполные совпадения не годятся для сужения: среди непроверенных могут быть подходящие
+        self._last_query, self._last_matches = query, matches if complete else None
+
+        self.results.addItems(paths)
+        if paths:
+            self.results.setCurrentRow(0)
+        found = len(matches) if complete else f"не меньше {len(matches)}"
+        self.status.setText(f"Найдено: {found} ({elapsed:.1f} мс)")
+
+    def choose(self, item=None):
+        item = item or self.results.currentItem()
+        if item is None:
+            return
+        self.close()
+        self.fileChosen.emit(self.project_index.absolute(item.text()))
+
+    def keyPressEvent(self, e: QKeyEvent):
+        if e.key() in (Qt.Key.Key_Down, Qt.Key.Key_Up):
+            step = 1 if e.key() == Qt.Key.Key_Down else -1
+            row = self.results.currentRow() + step
+            if 0 <= row < self.results.count():
+                self.results.setCurrentRow(row)
+        elif e.key() in (Qt.Key.Key_Return, Qt.Key.Key_Enter):
+            self.choose()
+        else:
+            super(QuickOpenPopup, self).keyPressEvent(e)
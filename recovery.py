@@ -0,0 +1,417 @@
+"""
+Журнал несохраненных правок для восстановления вкладок после аварийного завершения.
+
+Для каждого измененного документа ведется файл, в который дописываются операции
+вставки и удаления со смещениями в байтах UTF-8. Первая строка журнала описывает
+исходный текст: файл на диске (с временем изменения и размером) или снимок текста.
+"""
+import glob
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import namedtuple
+
+from PyQt6.Qsci import QsciScintilla
+from PyQt6.QtCore import QLockFile, QObject, QRunnable, QThreadPool, QTimer
+
+from editor import make_decoder
+from globals import CACHE_DIRECTORY, LOGGING_LEVEL
+from utils import atomic_write
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOGGING_LEVEL)
+
+RECOVERY_DIRECTORY = os.path.join(CACHE_DIRECTORY, 'recovery')
+JOURNAL_VERSION = 1
+# Как часто накопленные операции дописываются в журналы и сбрасываются на диск, в миллисекундах.
+FLUSH_INTERVAL_MS = 1000
+# Журнал, который стал больше документа и больше этого размера (в байтах),
+# заменяется снимком текста.
+COMPACT_THRESHOLD = 256 * 1024
+# Примерный размер записи операции в журнале без вставленного текста, в байтах.
+RECORD_OVERHEAD = 16
+
+# path - путь к файлу или None для нового файла; text - восстановленный текст
+# или None, если журнал не удалось применить; reason - причина неудачи;
+# journal - файл журнала: отложенный, если журнал не удалось применить, иначе
+# журнал, который ждет вызова `RecoveryJournal.applied` или `RecoveryJournal.set_aside`
+Recovered = namedtuple('Recovered', ['path', 'text', 'reason', 'journal'])
+# Суффикс, с которым откладываются журналы, которые не удалось применить.
+FAILED_SUFFIX = '.failed'
+
+
+class JournalError(Exception):
+    pass
+
+
+def replay(journal_path) -> tuple:
+    """
+    Применяет операции журнала к исходному тексту. Возвращает путь к файлу (или None)
+    и восстановленный текст. Недописанная при сбое последняя строка пропускается.
+    Бросает `JournalError`, если исходный текст получить нельзя.
+    """
+    with open(journal_path, 'rb') as f:
+        lines = f.read().split(b'\n')
+    try:
+        header = json.loads(lines[0])
+    except ValueError:
+        raise JournalError("поврежден заголовок журнала")
+    if header.get('v') != JOURNAL_VERSION:
+        raise JournalError("неизвестная версия журнала")
+    path = header.get('path')
+
+    buffer = None
+    if header.get('base') == 'file':
+        try:
+            stat = os.stat(path)
+            if stat.st_mtime != header['mtime'] or stat.st_size != header['size']:
+                raise JournalError("файл изменился на диске после начала правок")
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            raise JournalError(f"файл недоступен: {e}")
+        # Документ редактора хранит текст так же, как он был прочитан при открытии
+        buffer = bytearray(make_decoder().decode(data, final=True).encode('utf8'))
+
+    for line in lines[1:]:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            break
+        if 's' in record:
+            buffer = bytearray(record['s'].encode('utf8'))
+        elif buffer is None:
+            raise JournalError("в журнале нет исходного текста")
+        elif 'i' in record:
+            position = record['i']
+            buffer[position:position] = record['t'].encode('utf8')
+        elif 'd' in record:
+            position = record['d']
+            del buffer[position:position + record['n']]
+    if buffer is None:
+        raise JournalError("в журнале нет исходного текста")
+    return path, buffer.decode('utf8', errors='replace')
+
+
+class Journal:
+    """
+    Журнал одного документа: еще не записанные операции и путь к его файлу.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.started = False
+        # Следующая запись начинает файл заново: заголовок и, возможно, снимок
+        self.rewrite = False
+        self.pending = []
+        self.pending_size = 0
+        self.written_size = 0
+
+    def start(self, header, snapshot=None):
+        self.started = True
+        self.rewrite = True
+        self.pending = [('header', header)]
+        self.pending_size = 0
+        if snapshot is not None:
+            self.pending.append(('snapshot', snapshot))
+            self.pending_size = len(snapshot)
+        self.written_size = 0
+
+
+class JournalFlush(QRunnable):
+    """
+    Дописывает накопленные операции в журналы и сбрасывает их на диск одним проходом.
+    Записи разных проходов не перемешиваются: одновременно выполняется только один.
+    """
+    _lock = threading.Lock()
+
+    def __init__(self, batches):
+        super(JournalFlush, self).__init__()
+        # Тройки (путь, начать заново, записи); записи None - удалить журнал
+        self.batches = batches
+        self.done = threading.Event()
+
+    @staticmethod
+    def _serialize(record) -> str:
+        kind = record[0]
+        if kind == 'header':
+            value = record[1]
+        elif kind == 'snapshot':
+            value = {'s': record[1]}
+        elif kind == 'i':
+            value = {'i': record[1], 't': record[2].decode('utf8', errors='replace')}
+        else:
+            value = {'d': record[1], 'n': record[2]}
+        return json.dumps(value, ensure_ascii=False) + '\n'
+
+    def run(self):
+        try:
+            with self._lock:
+                for path, rewrite, records in self.batches:
+                    try:
+                        self._write(path, rewrite, records)
+                    except OSError as e:
+                        logger.warning(f"Не удалось записать журнал {path}: {e}")
+        finally:
+            self.done.set()
+
+    def _write(self, path, rewrite, records):
+        if records is None:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        data = ''.join(map(self._serialize, records)).encode('utf8', errors='replace')
+        if rewrite:
+            atomic_write(path, data)
+            return
+        with open(path, 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class RecoveryJournal(QObject):
+    """
+    Ведет журналы измененных вкладок текущего запуска и восстанавливает вкладки
+    запусков, которые завершились аварийно.
+
+    Журнал начинается с первой правки и удаляется, когда документ снова совпадает
+    с сохраненным, а также при закрытии вкладки или окна. Операции копятся в памяти
+    и раз в `FLUSH_INTERVAL_MS` записываются в фоновом потоке с одним fsync на журнал.
+    Каждый запуск держит файл блокировки, поэтому журналы другого работающего
+    окна не восстанавливаются.
+    """
+
+    def __init__(self, directory=RECOVERY_DIRECTORY, parent=None):
+        super(RecoveryJournal, self).__init__(parent)
+        self.directory = directory
+        self.session = uuid.uuid4().hex[:12]
+        self._journals = {}
+        self._removed = []
+        self._counter = 0
+        self._flush = None
+        self._lock = None
+        try:
+            os.makedirs(directory, exist_ok=True)
+            self._lock = QLockFile(os.path.join(directory, f'{self.session}.lock'))
+            if not self._lock.tryLock(0):
+                self._lock = None
+        except OSError as e:
+            logger.warning(f"Журнал правок недоступен: {e}")
+        self._timer = QTimer(self)
+        self._timer.setInterval(FLUSH_INTERVAL_MS)
+        self._timer.timeout.connect(self.flush)
+
+    @property
+    def enabled(self) -> bool:
+        return self._lock is not None
+
+    def attach(self, editor):
+        """
+        Начинает записывать правки редактора `editor`.
+        """
+        if not self.enabled:
+            return
+        self._counter += 1
+        journal = Journal(os.path.join(self.directory, f'{self.session}-{self._counter}.journal'))
+        self._journals[editor] = journal
+        editor.SCN_MODIFIED.connect(
+            lambda *args: self._on_modified(editor, journal, *args))
+        editor.modificationChanged.connect(
+            lambda modified: modified or self.discard(editor))
+
+    def detach(self, editor):
+        """
+        Перестает вести журнал редактора и удаляет его. Вызывается при закрытии вкладки.
+        """
+        self.discard(editor)
+        self._journals.pop(editor, None)
+
+    def discard(self, editor):
+        journal = self._journals.get(editor)
+        if journal is None or not journal.started:
+            return
+        journal.started = False
+        journal.pending = []
+        self._removed.append(journal.path)
+
+    def restart(self, editor):
+        """
+        Начинает журнал редактора заново снимком текста. Вызывается, когда текст
+        отмечен сохраненным, но на диск не попал, например после неудачной записи.
+        """
+        journal = self._journals.get(editor)
+        if journal is None:
+            return
+        if journal.path in self._removed:
+            self._removed.remove(journal.path)
+        journal.start(self._header(editor), editor.text())
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def _on_modified(self, editor, journal, position, modification_type, text, length, *args):
+        if not modification_type & (QsciScintilla.SC_MOD_INSERTTEXT | QsciScintilla.SC_MOD_DELETETEXT):
+            return
+        # Если журнал начат снимком текста, эта правка в нем уже есть
+        if journal.started or self._start(editor, journal):
+            if modification_type & QsciScintilla.SC_MOD_INSERTTEXT:
+                journal.pending.append(('i', position, bytes(text)))
+                journal.pending_size += length + RECORD_OVERHEAD
+            else:
+                journal.pending.append(('d', position, length))
+                journal.pending_size += RECORD_OVERHEAD
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def _start(self, editor, journal) -> bool:
+        """
+        Начинает журнал с первой правки. Возвращает True, если исходный текст - файл
+        на диске и правку нужно записать, и False, если журнал начат снимком текста
+        с уже примененной правкой (новый файл или файл, пропавший с диска).
+        """
+        if journal.path in self._removed:
+            self._removed.remove(journal.path)
+        path = editor.file.path
+        if path and not editor.file.new:
+            try:
+                stat = os.stat(path)
+                journal.start({'v': JOURNAL_VERSION, 'path': path, 'base': 'file',
+                               'mtime': stat.st_mtime, 'size': stat.st_size})
+                return True
+            except OSError:
+                pass
+        journal.start(self._header(editor), editor.text())
+        return False
+
+    def flush(self, wait=False):
+        """
+        Передает накопленные операции в фоновую запись. Пока предыдущая запись
+        не закончилась, операции продолжают копиться.
+        """
+        if self._flush is not None and not self._flush.done.is_set():
+            if not wait:
+                return
+            self._flush.done.wait()
+        batches = [(path, False, None) for path in self._removed]
+        self._removed = []
+        for editor, journal in self._journals.items():
+            if not journal.started or not journal.pending:
+                continue
+            if not journal.rewrite and journal.written_size + journal.pending_size > \
+                    max(COMPACT_THRESHOLD, 2 * editor.length()):
+                # Журнал разросся: дешевле один раз записать текст целиком
+                journal.start(self._header(editor), editor.text())
+            batches.append((journal.path, journal.rewrite, journal.pending))
+            journal.written_size += journal.pending_size
+            journal.rewrite = False
+            journal.pending = []
+            journal.pending_size = 0
+        if not batches:
+            self._timer.stop()
+            return
+        self._flush = JournalFlush(batches)
+        if wait:
+            self._flush.run()
+        else:
+            QThreadPool.globalInstance().start(self._flush)
+
+    @staticmethod
+    def _header(editor) -> dict:
+        return {'v': JOURNAL_VERSION, 'path': editor.file.path, 'base': 'snapshot'}
+
+    def recover(self) -> list:
+        """
+        Восстанавливает документы из журналов запусков, которые завершились
+        аварийно, и возвращает список `Recovered`.
+
+        Журнал с восстановленным текстом переходит к текущему запуску и остается на диске,
+        пока текст не окажется в редакторе (`applied`) или не будет отложен (`set_aside`):
+        если запуск тоже завершится аварийно, журнал восстановится снова. Журналы, которые
+        применить не удалось, переименовываются с суффиксом `FAILED_SUFFIX` и остаются
+        в папке, чтобы правки можно было достать вручную.
+        """
+        if not self.enabled:
+            return []
+        sessions = set()
+        for path in glob.glob(os.path.join(self.directory, '*.journal')):
+            sessions.add(os.path.basename(path).split('-', 1)[0])
+        recovered = []
+        for session in sorted(sessions - {self.session}):
+            lock = QLockFile(os.path.join(self.directory, f'{session}.lock'))
+            # Блокировку умершего процесса QLockFile считает устаревшей и снимает,
+            # а по возрасту блокировка живого окна устаревшей считаться не должна
+            lock.setStaleLockTime(0)
+            if not lock.tryLock(0):
+                continue
+            journals = sorted(glob.glob(os.path.join(self.directory, f'{session}-*.journal')),
+                              key=os.path.getmtime)
+            for journal_path in journals:
+                try:
+                    path, text = replay(journal_path)
+                except (OSError, JournalError) as e:
+                    logger.warning(f"Не удалось восстановить {journal_path}: {e}")
+                    recovered.append(Recovered(self._journal_file(journal_path), None, str(e),
+                                               self._set_aside(journal_path)))
+                    continue
+                self._counter += 1
+                adopted_path = os.path.join(self.directory, f'{self.session}-{self._counter}.journal')
+                try:
+                    os.replace(journal_path, adopted_path)
+                except OSError as e:
+                    logger.warning(f"Не удалось перенести журнал {journal_path}: {e}")
+                    adopted_path = journal_path
+                recovered.append(Recovered(path, text, None, adopted_path))
+            lock.unlock()
+        return recovered
+
+    def applied(self, item):
+        """
+        Удаляет журнал восстановленного документа `item`, когда его текст уже в редакторе.
+        Сначала записываются журналы вкладок, чтобы правка попала в журнал редактора.
+        """
+        self.flush(wait=True)
+        try:
+            os.remove(item.journal)
+        except OSError:
+            pass
+
+    def set_aside(self, item) -> str:
+        """
+        Откладывает журнал восстановленного документа `item`, текст которого не удалось
+        показать в редакторе. Возвращает новый путь к журналу.
+        """
+        return self._set_aside(item.journal)
+
+    @staticmethod
+    def _set_aside(journal_path):
+        failed_path = journal_path + FAILED_SUFFIX
+        try:
+            os.replace(journal_path, failed_path)
+        except OSError as e:
+            logger.warning(f"Не удалось отложить журнал {journal_path}: {e}")
+            return journal_path
+        return failed_path
+
+    @staticmethod
+    def _journal_file(journal_path):
+        try:
+            with open(journal_path, 'rb') as f:
+                return json.loads(f.readline()).get('path')
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def close(self):
+        """
+        Удаляет журналы всех вкладок и снимает блокировку. Вызывается при закрытии окна,
+        когда пользователь уже решил, что делать с несохраненными файлами.
+        """
+        self._timer.stop()
+        for editor in list(self._journals):
+            self.discard(editor)
+        self._journals.clear()
+        if self.enabled:
+            self.flush(wait=True)
+            self._lock.unlock()
+            self._lock = None
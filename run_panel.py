@@ -0,0 +1,479 @@
+import codecs
+import logging
+import os
+import shlex
+import threading
+import time
+from collections import deque
+
+try:
+    import resource
+except ImportError:
+    # Windows: процессорное время дочерних процессов недоступно
+    resource = None
+
+from PyQt6.QtCore import QObject, QProcess, QProcessEnvironment, QTimer, pyqtSignal
+from PyQt6.QtGui import QColor, QFont, QTextCharFormat, QTextCursor
+from PyQt6.QtWidgets import (QDockWidget, QHBoxLayout, QLabel, QLineEdit, QPlainTextEdit,
+                             QPushButton, QTabWidget, QVBoxLayout, QWidget)
+
+from globals import LOGGING_LEVEL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOGGING_LEVEL)
+
+# Сколько последних строк вывода хранится для каждого запуска.
+MAX_OUTPUT_LINES = 10000
+# Строка без перевода строки длиннее этого разбивается, чтобы буфер оставался ограниченным.
+MAX_LINE_LENGTH = 4096
+# Как часто новый вывод переносится в окно: при частой печати это одна вставка вместо тысяч.
+FLUSH_INTERVAL_MS = 50
+FILE_PATH_VARIABLE = '$file_path'
+
+
+def command_arguments(template, file_path) -> list:
+    """
+    Разбивает шаблон из "Настройки запуска" на аргументы и подставляет путь к файлу.
+    Путь подставляется после разбиения, поэтому пробелы в нем не мешают.
+    """
+    # В Windows обратная косая черта - разделитель пути, а не экранирование
+    posix = os.name != 'nt'
+    arguments = shlex.split(template, posix=posix)
+    if not posix:
+        arguments = [argument.strip('"') for argument in arguments]
+    return [argument.replace(FILE_PATH_VARIABLE, file_path) for argument in arguments]
+
+
+class ChildTimes:
+    """
+    Процессорное время завершенных дочерних процессов.
+
+    `getrusage(RUSAGE_CHILDREN)` растет, когда завершившийся процесс забирается
+    системой, а QProcess забирает их по одному перед сигналом finished. Прирост
+    с предыдущего вызова `take` - время только что завершившегося процесса, если он
+    работал один. Если одновременно работали другие запуски, их процесс мог быть
+    забран раньше, чем дошел сигнал, и тогда время приблизительное.
+
+    Код, который сам забирает дочерние процессы (например, замеры через `os.wait4`),
+    делает это под `lock` и вычитает их время через `exclude`.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._last = self._total()
+        self._active = set()
+        # Запуски, которые работали одновременно с другими
+        self._overlapped = set()
+
+    @staticmethod
+    def _total():
+        if resource is None:
+            return None
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return usage.ru_utime + usage.ru_stime
+
+    def begin(self, run):
+        with self.lock:
+            if self._active:
+                self._overlapped.update(self._active)
+                self._overlapped.add(run)
+            self._active.add(run)
+
+    def forget(self, run):
+        """
+        Убирает запуск, процесс которого не запустился.
+        """
+        with self.lock:
+            self._active.discard(run)
+            self._overlapped.discard(run)
+
+    def take(self, run) -> tuple:
+        """
+        Возвращает процессорное время только что завершившегося запуска `run` (или None,
+        если оно недоступно) и True, если время точное.
+        """
+        with self.lock:
+            exact = run not in self._overlapped
+            self._active.discard(run)
+            self._overlapped.discard(run)
+            total = self._total()
+            if total is None:
+                return None, False
+            spent, self._last = total - self._last, total
+            return spent, exact
+
+    def exclude(self, spent):
+        if self._last is not None:
+            self._last += spent
+
+
+child_times = ChildTimes()
+
+
+class OutputBuffer:
+    """
+    Кольцевой буфер строк вывода одного запуска.
+
+    Хранит не больше `MAX_OUTPUT_LINES` строк, более старые вытесняются и учитываются
+    в `dropped`. Байты потоков декодируются по частям, так что символ, разрезанный
+    между двумя порциями чтения, не портится.
+    """
+
+    def __init__(self, max_lines=MAX_OUTPUT_LINES):
+        self.lines = deque(maxlen=max_lines)
+        self.dropped = 0
+        self._partial = {}
+        self._decoders = {}
+
+    def write(self, data: bytes, is_error=False):
+        decoder = self._decoders.get(is_error)
+        if decoder is None:
+            decoder = self._decoders[is_error] = codecs.getincrementaldecoder('utf8')(errors='replace')
+        text = self._partial.pop(is_error, '') + decoder.decode(data)
+        *complete, rest = text.replace('\r\n', '\n').split('\n')
+        for line in complete:
+            self._append(line, is_error)
+        while len(rest) > MAX_LINE_LENGTH:
+            self._append(rest[:MAX_LINE_LENGTH], is_error)
+            rest = rest[MAX_LINE_LENGTH:]
+        if rest:
+            self._partial[is_error] = rest
+
+    def finish(self):
+        """
+        Переносит в буфер недописанные строки после завершения процесса.
+        """
+        for is_error, decoder in self._decoders.items():
+            rest = self._partial.pop(is_error, '') + decoder.decode(b'', final=True)
+            if rest:
+                self._append(rest, is_error)
+
+    def _append(self, line, is_error):
+        if len(self.lines) == self.lines.maxlen:
+            self.dropped += 1
+        self.lines.append((line, is_error))
+
+    def take(self) -> list:
+        """
+        Забирает накопленные строки.
+        """
+        lines = list(self.lines)
+        self.lines.clear()
+        return lines
+
+
+class Run(QObject):
+    """
+    Один запуск команды в `QProcess`: вывод stdout и stderr копится в `OutputBuffer`,
+    по завершении известны код возврата, время работы и процессорное время.
+    """
+    output = pyqtSignal()
+    started = pyqtSignal()
+    finished = pyqtSignal()
+
+    def __init__(self, template, file_path, parent=None):
+        super(Run, self).__init__(parent)
+        self.template = template
+        self.file_path = file_path
+        self.arguments = command_arguments(template, file_path)
+        self.buffer = OutputBuffer()
+        self.exit_code = None
+        self.crashed = False
+        self.killed = False
+        self.error = None
+        self.wall_time = None
+        self.cpu_time = None
+        # False, если в `cpu_time` могло попасть время других запусков
+        self.cpu_time_exact = False
+        self._started_at = None
+
+        self.process = QProcess(self)
+        environment = QProcessEnvironment.systemEnvironment()
+        # Иначе Python буферизует вывод в канал, и он приходит только в конце
+        environment.insert('PYTHONUNBUFFERED', '1')
+        environment.insert('PYTHONIOENCODING', 'utf-8')
+        self.process.setProcessEnvironment(environment)
+        self.process.setWorkingDirectory(os.path.dirname(file_path) or os.getcwd())
+        self.process.readyReadStandardOutput.connect(self._read_output)
+        self.process.readyReadStandardError.connect(self._read_error)
+        self.process.finished.connect(self._on_finished)
+        self.process.errorOccurred.connect(self._on_error)
+
+    @property
+    def running(self) -> bool:
+        return self.process.state() != QProcess.ProcessState.NotRunning
+
+    def start(self):
+        if not self.arguments:
+            self.error = "Пустая команда запуска"
+            self.finished.emit()
+            return
+        self._started_at = time.perf_counter()
+        child_times.begin(self)
+        self.process.start(self.arguments[0], self.arguments[1:])
+        self.started.emit()
+
+    def kill(self):
+        if self.running:
+            self.killed = True
+            self.process.kill()
+
+    def write(self, text):
+        if self.running:
+            self.process.write(text.encode('utf8'))
+
+    def _read_output(self):
+        self.buffer.write(self.process.readAllStandardOutput().data())
+        self.output.emit()
+
+    def _read_error(self):
+        self.buffer.write(self.process.readAllStandardError().data(), is_error=True)
+        self.output.emit()
+
+    def _on_finished(self, exit_code, exit_status):
+        # Время забирается сразу: процесс только что завершен и забран
+        self.cpu_time, self.cpu_time_exact = child_times.take(self)
+        self.wall_time = time.perf_counter() - self._started_at
+        self.exit_code = exit_code
+        self.crashed = exit_status == QProcess.ExitStatus.CrashExit
+        self._read_output()
+        self._read_error()
+        self.buffer.finish()
+        self.finished.emit()
+
+    def _on_error(self, error):
+        if error == QProcess.ProcessError.FailedToStart:
+            child_times.forget(self)
+            self.error = f"Не удалось запустить {self.arguments[0]}: {self.process.errorString()}"
+            self.wall_time = time.perf_counter() - self._started_at
+            self.finished.emit()
+
+    def summary(self) -> str:
+        if self.error:
+            return self.error
+        if self.killed:
+            result = "Остановлено"
+        elif self.crashed:
+            result = "Аварийное завершение"
+        else:
+            result = f"Завершено с кодом {self.exit_code}"
+        if self.cpu_time is None:
+            cpu = "нет данных"
+        else:
+            # Приблизительное время помечается: в нем может быть время других запусков
+            cpu = f"{'' if self.cpu_time_exact else '≈'}{self.cpu_time:.2f} с"
+        return f"{result} за {self.wall_time:.2f} с, процессорное время: {cpu}"
+
+
+class RunView(QWidget):
+    """
+    Вывод одного запуска. Новые строки переносятся в окно по таймеру порциями,
+    само окно тоже хранит не больше `MAX_OUTPUT_LINES` строк.
+    """
+
+    def __init__(self, run, parent=None):
+        super(RunView, self).__init__(parent)
+        self.output = QPlainTextEdit()
+        self.output.setReadOnly(True)
+        self.output.setMaximumBlockCount(MAX_OUTPUT_LINES)
+        self.output.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+        font = QFont('Fira Code')
+        font.setStyleHint(QFont.StyleHint.Monospace)
+        self.output.setFont(font)
+        self.status = QLabel()
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.output)
+        layout.addWidget(self.status)
+
+        self._error_format = QTextCharFormat()
+        self._error_format.setForeground(QColor('#d32f2f'))
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(FLUSH_INTERVAL_MS)
+        self._flush_timer.timeout.connect(self.flush)
+        self.run = None
+        self.attach(run)
+
+    def attach(self, run):
+        """
+        Показывает в окне новый запуск, например при перезапуске.
+        """
+        if self.run is not None:
+            self.run.output.disconnect(self._flush_timer.start)
+            self.run.finished.disconnect(self._on_finished)
+        self.run = run
+        self._shown = 0
+        self.output.clear()
+        self.output.appendPlainText(f"> {' '.join(run.arguments)}")
+        self.status.setText("Выполняется...")
+        run.output.connect(self._flush_timer.start)
+        run.finished.connect(self._on_finished)
+
+    def flush(self):
+        lines = self.run.buffer.take()
+        if not lines:
+            return
+        at_bottom = self.output.verticalScrollBar().value() == self.output.verticalScrollBar().maximum()
+        cursor = QTextCursor(self.output.document())
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.beginEditBlock()
+        plain = QTextCharFormat()
+        for line, is_error in lines:
+            cursor.insertBlock()
+            cursor.insertText(line, self._error_format if is_error else plain)
+        cursor.endEditBlock()
+        self._shown += len(lines)
+        if at_bottom:
+            self.output.verticalScrollBar().setValue(self.output.verticalScrollBar().maximum())
+
+    def _on_finished(self):
+        self._flush_timer.stop()
+        self.flush()
+        summary = self.run.summary()
+        # Строки вытесняются и из буфера до показа, и из самого окна
+        evicted = self.run.buffer.dropped + max(0, self._shown + 1 - MAX_OUTPUT_LINES)
+        if evicted:
+            summary += f", старых строк вытеснено: {evicted}"
+        self.output.appendPlainText(f"\n{summary}")
+        self.status.setText(summary)
+
+
+class RunDock(QDockWidget):
+    """
+    Док панель запусков. Каждый запуск открывается на своей вкладке, несколько
+    программ могут работать одновременно. Повторный запуск того же файла занимает
+    вкладку его завершившегося запуска.
+    """
+    # Изменилось состояние какого-либо запуска
+    stateChanged = pyqtSignal()
+    # Запуск завершился, передается `Run`
+    runFinished = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super(RunDock, self).__init__("Вывод", parent)
+        self.tabs = QTabWidget()
+        self.tabs.setTabsClosable(True)
+        self.tabs.tabCloseRequested.connect(self.close_run)
+        self.tabs.currentChanged.connect(self._on_state_changed)
+
+        self.stop_button = QPushButton("Остановить")
+        self.stop_button.clicked.connect(self.stop)
+        self.restart_button = QPushButton("Перезапустить")
+        self.restart_button.clicked.connect(self.restart)
+        self.input = QLineEdit()
+        self.input.setPlaceholderText("Ввод для программы")
+        self.input.returnPressed.connect(self._send_input)
+
+        controls = QHBoxLayout()
+        controls.addWidget(self.input)
+        controls.addWidget(self.stop_button)
+        controls.addWidget(self.restart_button)
+
+        content = QWidget()
+        layout = QVBoxLayout(content)
+        layout.setContentsMargins(4, 4, 4, 4)
+        layout.addWidget(self.tabs)
+        layout.addLayout(controls)
+        self.setWidget(content)
+        self._update_buttons()
+
+    def views(self) -> list:
+        return [self.tabs.widget(i) for i in range(self.tabs.count())]
+
+    def current(self) -> RunView:
+        return self.tabs.currentWidget()
+
+    def start(self, template, file_path) -> Run:
+        """
+        Запускает команду `template` для файла `file_path` и показывает её вывод.
+        """
+        run = Run(template, file_path, self)
+        view = next((view for view in self.views()
+                     if view.run.file_path == file_path and not view.run.running), None)
+        if view is None:
+            view = RunView(run)
+            self.tabs.addTab(view, os.path.basename(file_path))
+        else:
+            self._discard(view.run)
+            view.attach(run)
+        self._connect(view, run)
+        self.tabs.setCurrentWidget(view)
+        self.setVisible(True)
+        run.start()
+        return run
+
+    def _connect(self, view, run):
+        run.started.connect(self._on_state_changed)
+        run.finished.connect(self._on_state_changed)
+        run.finished.connect(lambda: self._mark(view))
+        run.finished.connect(lambda: self.runFinished.emit(run))
+
+    def _mark(self, view):
+        index = self.tabs.indexOf(view)
+        if index != -1:
+            self.tabs.setTabText(index, os.path.basename(view.run.file_path))
+
+    def _on_state_changed(self, *args):
+        for view in self.views():
+            if view.run.running:
+                self.tabs.setTabText(self.tabs.indexOf(view), f"▶ {os.path.basename(view.run.file_path)}")
+        self._update_buttons()
+        self.stateChanged.emit()
+
+    def _update_buttons(self):
+        view = self.current()
+        running = bool(view and view.run.running)
+        self.stop_button.setEnabled(running)
+        self.input.setEnabled(running)
+        self.restart_button.setEnabled(view is not None)
+
+    def stop(self):
+        if view := self.current():
+            view.run.kill()
+
+    def restart(self):
+        """
+        Останавливает текущий запуск и запускает ту же команду заново на той же вкладке.
+        """
+        view = self.current()
+        if view is None:
+            return
+        old = view.run
+        run = Run(old.template, old.file_path, self)
+        view.attach(run)
+        # Завершение остановленного запуска не должно помечать вкладку и считаться
+        # завершением нового: его сигналы отключаются до того, как процесс убит
+        old.started.disconnect()
+        old.finished.disconnect()
+        self._discard(old)
+        self._connect(view, run)
+        run.start()
+
+    def _send_input(self):
+        if view := self.current():
+            view.run.write(self.input.text() + '\n')
+            self.input.clear()
+
+    def close_run(self, index):
+        view = self.tabs.widget(index)
+        self.tabs.removeTab(index)
+        self._discard(view.run)
+        view.deleteLater()
+        self._on_state_changed()
+
+    def _discard(self, run):
+        if run.running:
+            run.kill()
+            run.process.waitForFinished(1000)
+        run.deleteLater()
+
+    def release(self):
+        """
+        Останавливает все запуски. Вызывается при закрытии окна.
+        """
+        for view in self.views():
+            if view.run.running:
+                view.run.kill()
+                view.run.process.waitForFinished(1000)
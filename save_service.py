@@ -0,0 +1,143 @@
+import logging
+from functools import partial
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from globals import LOGGING_LEVEL
+from utils import atomic_write
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOGGING_LEVEL)
+
+
+class SaveJobSignals(QObject):
+    # Файл записан, передается объект `File`
+    saved = pyqtSignal(object)
+    # Запись не удалась: объект `File` и текст ошибки
+    failed = pyqtSignal(object, str)
+
+
+class SaveJob(QRunnable):
+    """
+    Запись снимка текста в файл в потоке `SaveService`.
+    """
+
+    def __init__(self, file, path, data):
+        super(SaveJob, self).__init__()
+        self.file = file
+        self.path = path
+        self.data = data
+        self.error = None
+        # Неудачу уже вернул `SaveService.wait`, сигнал о ней не нужен
+        self.reported = False
+        self.signals = SaveJobSignals()
+
+    def run(self):
+        try:
+            atomic_write(self.path, self.data)
+        except OSError as e:
+            logger.error(f"Не удалось сохранить {self.path}: {e}")
+            self.error = str(e)
+            self.signals.failed.emit(self.file, self.error)
+            return
+        finally:
+            # Снимок больше не нужен, а задача может еще храниться до доставки сигнала
+            self.data = None
+        self.signals.saved.emit(self.file)
+
+
+class SaveService(QObject):
+    """
+    Сохраняет файлы в пуле потоков, не блокируя интерфейс.
+
+    В задачу передается снимок текста, сделанный в момент сохранения, так что
+    дальнейшее редактирование на записываемые данные не влияет. Записи одного
+    файла выполняются строго по очереди: пока идет запись, новый снимок ждет,
+    а промежуточные снимки заменяются последним.
+    """
+    saved = pyqtSignal(object)
+    failed = pyqtSignal(object, str)
+
+    def __init__(self, parent=None):
+        super(SaveService, self).__init__(parent)
+        self.pool = QThreadPool(self)
+        self._running = {}
+        self._queued = {}
+        # Последняя запущенная задача каждого файла, о результате которой еще не сообщено
+        self._undelivered = {}
+
+    def save(self, file, data: str):
+        """
+        Ставит в очередь запись снимка `data` в файл `file`.
+        """
+        path = file.path
+        if path in self._running:
+            self._queued[path] = (file, data)
+            return
+        self._start(file, path, data)
+
+    def save_all(self, snapshots) -> list:
+        """
+        Запускает параллельную запись всех пар (файл, текст) и возвращает их задачи.
+        """
+        jobs = []
+        for file, data in snapshots:
+            if file.path in self._running:
+                self._queued[file.path] = (file, data)
+            else:
+                jobs.append(self._start(file, file.path, data))
+        return jobs
+
+    def wait(self) -> list:
+        """
+        Блокирующе дожидается окончания всех записей, включая отложенные.
+
+        :return: Неудачные задачи, о которых еще не сообщил сигнал `failed`,
+            кроме тех, файл которых потом все же записан следующим снимком.
+            Сигнал `failed` для них уже не придет.
+        """
+        self.pool.waitForDone()
+        while self._queued:
+            queued, self._queued = self._queued, {}
+            self._running.clear()
+            for path, (file, data) in queued.items():
+                self._start(file, path, data)
+            self.pool.waitForDone()
+        # Пока GUI поток ждет, сигналы о неудачах не доставлены, поэтому ошибки берутся из задач
+        failed = [job for job in self._undelivered.values() if job.error]
+        for job in failed:
+            job.reported = True
+        self._undelivered = {}
+        return failed
+
+    def _start(self, file, path, data) -> SaveJob:
+        job = SaveJob(file, path, data)
+        job.signals.saved.connect(partial(self._on_saved, job))
+        job.signals.failed.connect(partial(self._on_failed, job))
+        self._running[path] = job
+        self._undelivered[path] = job
+        self.pool.start(job)
+        return job
+
+    def _finish(self, job):
+        if self._running.get(job.path) is job:
+            del self._running[job.path]
+            queued = self._queued.pop(job.path, None)
+            if queued:
+                self._start(queued[0], job.path, queued[1])
+
+    def _deliver(self, job):
+        if self._undelivered.get(job.path) is job:
+            del self._undelivered[job.path]
+
+    def _on_saved(self, job, file):
+        self._finish(job)
+        self._deliver(job)
+        file.mark_saved()
+        self.saved.emit(file)
+
+    def _on_failed(self, job, file, message):
+        self._finish(job)
+        self._deliver(job)
+        if not job.reported:
+            self.failed.emit(file, message)
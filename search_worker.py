@@ -0,0 +1,73 @@
+"""
+Поиск по файлам в процессах пула. Модуль не зависит от Qt, чтобы дочерние
+процессы запускались быстро и на платформах, где они не наследуют память родителя.
+"""
+import mmap
+import re
+from functools import lru_cache
+
+# Файл считается двоичным, если в его начале есть нулевой байт.
+BINARY_CHECK_SIZE = 8192
+# Сколько совпадений в одном файле возвращается, остальные отбрасываются.
+MAX_MATCHES_PER_FILE = 1000
+# Сколько символов строки с совпадением передается для показа.
+MAX_LINE_LENGTH = 240
+
+
+@lru_cache(maxsize=8)
+def compile_pattern(pattern: bytes, flags: int):
+    return re.compile(pattern, flags)
+
+
+def search_file(path, regex) -> list:
+    """
+    Ищет `regex` в файле через `mmap` и возвращает список (номер строки с нуля, текст строки).
+    """
+    try:
+        with open(path, 'rb') as f:
+            try:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Пустой файл нельзя отобразить в память
+                return []
+    except OSError:
+        return []
+
+    with buffer:
+        if b'\0' in buffer[:BINARY_CHECK_SIZE]:
+            return []
+        matches = []
+        line = 0
+        counted_until = 0
+        last_line_start = -1
+        for match in regex.finditer(buffer):
+            start = match.start()
+            line_start = buffer.rfind(b'\n', 0, start) + 1
+            if line_start == last_line_start:
+                # Несколько совпадений в одной строке показываются один раз
+                continue
+            line += buffer[counted_until:line_start].count(b'\n')
+            counted_until = line_start
+            last_line_start = line_start
+            line_end = buffer.find(b'\n', start)
+            if line_end == -1:
+                line_end = len(buffer)
+            text = buffer[line_start:min(line_end, line_start + MAX_LINE_LENGTH)]
+            matches.append((line, text.decode('utf8', errors='replace').rstrip('\r')))
+            if len(matches) >= MAX_MATCHES_PER_FILE:
+                break
+        return matches
+
+
+def search_files(paths, pattern: bytes, flags: int) -> list:
+    """
+    Ищет шаблон в каждом файле из `paths`. Возвращает только файлы с совпадениями:
+    список пар (путь, совпадения).
+    """
+    regex = compile_pattern(pattern, flags)
+    results = []
+    for path in paths:
+        matches = search_file(path, regex)
+        if matches:
+            results.append((path, matches))
+    return results
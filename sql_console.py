@@ -0,0 +1,262 @@
+import logging
+
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, Qt
+from PyQt6.QtGui import QAction, QKeySequence
+from PyQt6.QtWidgets import (QHeaderView, QLabel, QSplitter, QTableView,
+                             QToolBar, QTreeWidget, QTreeWidgetItem,
+                             QVBoxLayout, QWidget)
+
+from editor import CustomEditor, File
+from globals import LOGGING_LEVEL
+from lexer_registry import lexer_registry
+from query_executor import QueryExecutor
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOGGING_LEVEL)
+
+# Сколько строк результата читается за одну прокрутку таблицы.
+RESULT_BATCH_SIZE = 200
+
+
+class StreamingResultModel(QAbstractTableModel):
+    """
+    Модель результата запроса, которая дочитывает строки из курсора по мере прокрутки.
+
+    Запрос выполняется задачей `QueryJob` в режиме `on_demand`: каждая следующая
+    порция строк читается из курсора только тогда, когда таблица просит её через
+    `fetchMore`.
+    """
+
+    def __init__(self, parent=None):
+        super(StreamingResultModel, self).__init__(parent)
+        self.columns = []
+        self._rows = []
+        self._job = None
+        self._waiting = False
+
+    def start(self, job):
+        """
+        Привязывает модель к новой задаче, сбрасывая предыдущий результат.
+        """
+        self.beginResetModel()
+        self.columns = []
+        self._rows = []
+        self._job = job
+        self._waiting = True
+        self.endResetModel()
+        job.signals.batch.connect(self._on_batch)
+        for signal in (job.signals.finished, job.signals.failed, job.signals.cancelled):
+            signal.connect(self._on_done)
+
+    def _set_columns(self, job):
+        if self.columns or not job.description:
+            return
+        self.beginResetModel()
+        self.columns = [column[0] for column in job.description]
+        self.endResetModel()
+
+    def _on_batch(self, rows):
+        job = self.sender_job()
+        if job is None:
+            return
+        self._set_columns(job)
+        self._waiting = False
+        self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(rows) - 1)
+        self._rows.extend(rows)
+        self.endInsertRows()
+
+    def _on_done(self, *args):
+        job = self.sender_job()
+        if job is None:
+            return
+        self._set_columns(job)
+        self._job = None
+        self._waiting = False
+
+    def sender_job(self):
+        # Сигналы задачи, которая уже была заменена новой, игнорируются
+        if self._job is None or self.sender() is not self._job.signals:
+            return None
+        return self._job
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._job is not None and not self._waiting
+
+    def fetchMore(self, parent=QModelIndex()):
+        if self.canFetchMore(parent):
+            self._waiting = True
+            self._job.request_more()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        value = self._rows[index.row()][index.column()]
+        if value is None:
+            return 'NULL'
+        return value if isinstance(value, (int, float, str)) else str(value)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return self.columns[section] if section < len(self.columns) else None
+        return section + 1
+
+
+class SqlConsole(QWidget):
+    """
+    Вкладка для выполнения произвольных запросов к базе данных.
+
+    Для каждого запуска показывается время выполнения, количество строк, число шагов
+    виртуальной машины SQLite и план запроса из `EXPLAIN QUERY PLAN`.
+    """
+
+    def __init__(self, theme, file_path, *args, **kwargs):
+        super(SqlConsole, self).__init__(*args, **kwargs)
+
+        self.file = File(file_path)
+        self.error_while_reading = False
+        self.executor = QueryExecutor(file_path, parent=self)
+        self._job = None
+        self._plan = None
+
+        self.query_editor = CustomEditor(theme)
+        self.query_editor.setLexer(lexer_registry.lexer('SQL', theme))
+
+        self.run_action = QAction("Выполнить", self)
+        self.run_action.setShortcut(QKeySequence("Ctrl+Return"))
+        self.run_action.setShortcutContext(Qt.ShortcutContext.WidgetWithChildrenShortcut)
+        self.run_action.triggered.connect(self.run_query)
+
+        self.stop_action = QAction("Остановить", self)
+        self.stop_action.setEnabled(False)
+        self.stop_action.triggered.connect(self.stop_query)
+
+        toolbar = QToolBar(self)
+        toolbar.addAction(self.run_action)
+        toolbar.addAction(self.stop_action)
+        self.addAction(self.run_action)
+
+        self.result_model = StreamingResultModel(self)
+        self.result_view = QTableView()
+        self.result_view.setModel(self.result_model)
+        self.result_view.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+
+        self.plan_view = QTreeWidget()
+        self.plan_view.setHeaderLabels(["План запроса"])
+
+        self.status = QLabel()
+
+        results = QSplitter(Qt.Orientation.Horizontal)
+        results.addWidget(self.result_view)
+        results.addWidget(self.plan_view)
+        results.setStretchFactor(0, 3)
+
+        splitter = QSplitter(Qt.Orientation.Vertical)
+        splitter.addWidget(self.query_editor)
+        splitter.addWidget(results)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(toolbar)
+        layout.addWidget(splitter)
+        layout.addWidget(self.status)
+
+    def query_text(self) -> str:
+        """
+        Возвращает выделенный текст запроса, а если выделения нет - весь текст.
+        """
+        text = self.query_editor.selectedText() or self.query_editor.text()
+        return text.strip().rstrip(';')
+
+    def run_query(self):
+        """
+        Запускает запрос и построение его плана. Предыдущий запрос отменяется.
+        """
+        query = self.query_text()
+        if not query:
+            return
+        self.stop_query()
+
+        self.plan_view.clear()
+        self._plan = self.executor.submit(f"EXPLAIN QUERY PLAN {query}")
+        self._plan.signals.batch.connect(self._show_plan)
+        self._plan.signals.failed.connect(self._on_plan_failed)
+
+        self._job = self.executor.submit(query, batch_size=RESULT_BATCH_SIZE, on_demand=True)
+        self._job.signals.batch.connect(self._show_progress)
+        self._job.signals.finished.connect(self._on_finished)
+        self._job.signals.failed.connect(self._on_failed)
+        self._job.signals.cancelled.connect(self._on_cancelled)
+        self.result_model.start(self._job)
+
+        self.stop_action.setEnabled(True)
+        self.status.setText("Выполняется...")
+
+    def stop_query(self):
+        if self._job:
+            self._job.cancel()
+            self._job = None
+        self.stop_action.setEnabled(False)
+
+    def _show_plan(self, rows):
+        if self._plan is None or self.sender() is not self._plan.signals:
+            return
+        # Строки плана: (id, parent, notused, detail), parent ссылается на id родителя
+        items = {}
+        for row in rows:
+            node_id, parent_id, detail = row[0], row[1], row[-1]
+            parent = items.get(parent_id)
+            item = QTreeWidgetItem(parent if parent else self.plan_view, [str(detail)])
+            items[node_id] = item
+        self.plan_view.expandAll()
+
+    def _on_plan_failed(self, message):
+        if self._plan and self.sender() is self._plan.signals:
+            self.plan_view.clear()
+            QTreeWidgetItem(self.plan_view, [f"План не построен: {message}"])
+
+    def _statistics(self, job, rows) -> str:
+        return f"Время: {job.elapsed * 1000:.1f} мс, строк: {rows}, шагов VM: ~{job.vm_steps}"
+
+    def _show_progress(self, rows):
+        job = self._job
+        if job and self.sender() is job.signals:
+            self.status.setText(self._statistics(job, self.result_model.rowCount() + len(rows)) + " (есть еще строки)")
+
+    def _on_finished(self, total):
+        job = self._job
+        if job and self.sender() is job.signals:
+            self.status.setText(self._statistics(job, total))
+            self._job = None
+            self.stop_action.setEnabled(False)
+
+    def _on_failed(self, message):
+        job = self._job
+        if job and self.sender() is job.signals:
+            self.status.setText(f"Ошибка: {message}")
+            self._job = None
+            self.stop_action.setEnabled(False)
+
+    def _on_cancelled(self):
+        if self._job is None:
+            self.status.setText("Запрос остановлен")
+
+    def view_state(self) -> dict:
+        return {'Консоль SQL': True, 'Запрос': self.query_editor.text()}
+
+    def restore_view_state(self, state: dict):
+        self.query_editor.setText(state.get('Запрос', ''))
+
+    def release(self):
+        """
+        Останавливает запросы и закрывает подключение. Вызывается при закрытии вкладки.
+        """
+        self.executor.close()
+        self.query_editor.release()
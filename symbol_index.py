@@ -0,0 +1,368 @@
+import ast
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict, namedtuple
+from functools import partial
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+
+from globals import CACHE_DIRECTORY, LOGGING_LEVEL
+from utils import atomic_write
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOGGING_LEVEL)
+
+# Через сколько миллисекунд после последней правки открытый файл разбирается заново.
+PARSE_DELAY_MS = 400
+# Сколько разобранных блоков верхнего уровня хранится в памяти.
+BLOCK_CACHE_SIZE = 4096
+# Файлы проекта больше этого размера не разбираются: обычно это сгенерированный код.
+MAX_PROJECT_FILE_SIZE = 1024 * 1024
+
+# kind: 'class', 'function' или 'method'; line - номер строки с нуля;
+# container - имя объемлющего класса или функции через точку
+Symbol = namedtuple('Symbol', ['name', 'kind', 'line', 'depth', 'container'])
+
+# Строка, с которой начинается новый блок верхнего уровня
+BLOCK_START = re.compile(r'(?:async\s+def|def|class)\b|@')
+
+
+def _symbols_of(tree) -> list:
+    symbols = []
+
+    def visit(node, depth, container, in_class):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.ClassDef):
+                kind = 'class'
+            elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                kind = 'method' if in_class else 'function'
+            else:
+                visit(child, depth, container, in_class)
+                continue
+            symbols.append(Symbol(child.name, kind, child.lineno - 1, depth, container))
+            name = f'{container}.{child.name}' if container else child.name
+            visit(child, depth + 1, name, kind == 'class')
+
+    visit(tree, 0, '', False)
+    return symbols
+
+
+def split_blocks(text) -> list:
+    """
+    Делит исходный код на блоки верхнего уровня: каждое определение класса или функции
+    вместе с декораторами и код между ними. Возвращает пары (первая строка, текст).
+    """
+    lines = text.splitlines(keepends=True)
+    blocks = []
+    start = 0
+    in_decorators = False
+    for number, line in enumerate(lines):
+        if not line[:1].isspace() and BLOCK_START.match(line):
+            # Определение после декораторов продолжает их блок
+            if number > start and not in_decorators:
+                blocks.append((start, ''.join(lines[start:number])))
+                start = number
+            in_decorators = line.startswith('@')
+        elif line.strip() and not line[:1].isspace() and not line.startswith('#'):
+            in_decorators = False
+    if start < len(lines):
+        blocks.append((start, ''.join(lines[start:])))
+    return blocks
+
+
+class BlockCache:
+    """
+    Символы уже разобранных блоков по хешу их текста. Блок, который не менялся,
+    при следующем разборе файла берется отсюда, даже если он сдвинулся по строкам.
+    """
+
+    def __init__(self, size=BLOCK_CACHE_SIZE):
+        self.size = size
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            symbols = self._blocks.get(key)
+            if symbols is not None:
+                self._blocks.move_to_end(key)
+            return symbols
+
+    def put(self, key, symbols):
+        with self._lock:
+            self._blocks[key] = symbols
+            self._blocks.move_to_end(key)
+            while len(self._blocks) > self.size:
+                self._blocks.popitem(last=False)
+
+
+block_cache = BlockCache()
+
+
+def parse_symbols(text, cache=block_cache) -> list:
+    """
+    Возвращает символы исходного кода Python. Каждый блок верхнего уровня разбирается
+    отдельно, неизмененные блоки берутся из кеша. Если блок отдельно не разбирается
+    (например, граница блока пришлась на многострочную строку), разбирается весь текст.
+    Бросает SyntaxError, если в тексте синтаксическая ошибка.
+    """
+    symbols = []
+    for start, block in split_blocks(text):
+        key = hashlib.sha1(block.encode('utf8', errors='surrogatepass')).digest()
+        relative = cache.get(key)
+        if relative is None:
+            try:
+                relative = _symbols_of(ast.parse(block))
+            except SyntaxError:
+                break
+            cache.put(key, relative)
+        symbols.extend(symbol._replace(line=symbol.line + start) for symbol in relative)
+    else:
+        return symbols
+    return _symbols_of(ast.parse(text))
+
+
+class ParseSignals(QObject):
+    # Номер версии текста и символы, или None при синтаксической ошибке
+    finished = pyqtSignal(int, object)
+
+
+class ParseJob(QRunnable):
+    """
+    Разбирает снимок текста открытого файла в фоне.
+    """
+
+    def __init__(self, text, version):
+        super(ParseJob, self).__init__()
+        self.text = text
+        self.version = version
+        self.signals = ParseSignals()
+
+    def run(self):
+        try:
+            symbols = parse_symbols(self.text)
+        except (SyntaxError, ValueError):
+            symbols = None
+        self.signals.finished.emit(self.version, symbols)
+
+
+class DocumentOutline(QObject):
+    """
+    Символы одного открытого файла Python. После правок текст разбирается заново
+    с задержкой `PARSE_DELAY_MS`; результат устаревшей версии текста отбрасывается.
+    При синтаксической ошибке остаются символы последнего удачного разбора.
+    """
+    changed = pyqtSignal()
+
+    def __init__(self, editor, parent=None):
+        super(DocumentOutline, self).__init__(parent)
+        self.editor = editor
+        self.symbols = []
+        self.valid = True
+        self._version = 0
+        self._job = None
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(PARSE_DELAY_MS)
+        self._timer.timeout.connect(self.parse)
+        editor.textChanged.connect(self._timer.start)
+        self.parse()
+
+    @property
+    def path(self):
+        return self.editor.file.path
+
+    def parse(self):
+        self._version += 1
+        job = ParseJob(self.editor.text(), self._version)
+        job.signals.finished.connect(self._on_parsed)
+        # Задача хранится до сигнала, иначе вместе с ней удалятся и сигналы
+        self._job = job
+        QThreadPool.globalInstance().start(job)
+
+    def _on_parsed(self, version, symbols):
+        if version != self._version:
+            return
+        self._job = None
+        self.valid = symbols is not None
+        if symbols is not None:
+            self.symbols = symbols
+        self.changed.emit()
+
+    def close(self):
+        self._timer.stop()
+        self._version += 1
+
+
+def symbols_cache_path(root) -> str:
+    key = hashlib.sha1(os.path.normcase(os.path.abspath(root)).encode('utf8')).hexdigest()[:16]
+    return os.path.join(CACHE_DIRECTORY, f'symbols-{key}.json')
+
+
+class ProjectSymbolsSignals(QObject):
+    # Словарь путь -> символы, или None, если обход остановлен
+    finished = pyqtSignal(object)
+
+
+class ProjectSymbolIndexer(QRunnable):
+    """
+    Собирает символы всех файлов Python проекта. Файлы, у которых не изменились время
+    изменения и размер, берутся из сохраненного кеша, остальные разбираются заново.
+    """
+
+    def __init__(self, root, files):
+        super(ProjectSymbolIndexer, self).__init__()
+        self.root = root
+        self.files = [path for path in files if path.endswith('.py')]
+        self.signals = ProjectSymbolsSignals()
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        try:
+            self._run()
+        finally:
+            self.done.set()
+
+    def _run(self):
+        cache_path = symbols_cache_path(self.root)
+        try:
+            with open(cache_path, 'r', encoding='utf8') as f:
+                cached = json.load(f)
+            if cached.get('root') != self.root:
+                cached = {}
+        except (OSError, ValueError):
+            cached = {}
+        cached_files = cached.get('files', {})
+
+        entries, symbols, parsed = {}, {}, 0
+        for path in self.files:
+            if self.cancelled.is_set():
+                self.signals.finished.emit(None)
+                return
+            try:
+                stat = os.stat(os.path.join(self.root, path))
+            except OSError:
+                continue
+            if stat.st_size > MAX_PROJECT_FILE_SIZE:
+                continue
+            entry = cached_files.get(path)
+            if entry and entry[0] == stat.st_mtime and entry[1] == stat.st_size:
+                file_symbols = [Symbol(*symbol) for symbol in entry[2]]
+            else:
+                file_symbols = self._parse(os.path.join(self.root, path))
+                parsed += 1
+            entries[path] = [stat.st_mtime, stat.st_size, file_symbols]
+            symbols[path] = file_symbols
+        self.signals.finished.emit(symbols)
+
+        if parsed or len(entries) != len(cached_files):
+            try:
+                os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+                atomic_write(cache_path, json.dumps({'root': self.root, 'files': entries}, ensure_ascii=False))
+            except OSError as e:
+                logger.warning(f"Не удалось сохранить символы проекта: {e}")
+
+    @staticmethod
+    def _parse(path) -> list:
+        try:
+            with open(path, 'rb') as f:
+                return _symbols_of(ast.parse(f.read()))
+        except (OSError, SyntaxError, ValueError):
+            return []
+
+
+class SymbolIndex(QObject):
+    """
+    Символы открытых файлов Python и всех файлов Python открытой папки.
+    Символы открытого файла берутся из его текста, а не с диска, поэтому
+    учитывают несохраненные правки.
+    """
+    # Изменились символы проекта
+    changed = pyqtSignal()
+    # Изменились символы открытого файла, передается его `DocumentOutline`
+    documentChanged = pyqtSignal(object)
+
+    def __init__(self, project_index, parent=None):
+        super(SymbolIndex, self).__init__(parent)
+        self.project_index = project_index
+        self.project_symbols = {}
+        self._documents = {}
+        self._indexer = None
+        self._jobs = set()
+        project_index.changed.connect(self._reindex)
+
+    def document(self, editor) -> DocumentOutline:
+        """
+        Возвращает символы открытого файла, начиная следить за ним при первом обращении.
+        """
+        key = id(editor)
+        outline = self._documents.get(key)
+        if outline is None:
+            outline = DocumentOutline(editor, self)
+            outline.changed.connect(partial(self.documentChanged.emit, outline))
+            self._documents[key] = outline
+            editor.destroyed.connect(partial(self._forget_document, key))
+        return outline
+
+    def _forget_document(self, key, *args):
+        outline = self._documents.pop(key, None)
+        if outline is not None:
+            outline.close()
+            outline.deleteLater()
+
+    def _reindex(self):
+        if not self.project_index.ready or self.project_index.root is None:
+            return
+        if self._indexer:
+            self._indexer.cancel()
+        root = self.project_index.root
+        self._indexer = ProjectSymbolIndexer(root, self.project_index.index.files())
+        self._indexer.signals.finished.connect(partial(self._on_indexed, self._indexer, root))
+        self._jobs.add(self._indexer)
+        QThreadPool.globalInstance().start(self._indexer)
+
+    def _on_indexed(self, indexer, root, symbols):
+        QTimer.singleShot(0, lambda: self._jobs.discard(indexer))
+        if indexer is not self._indexer or root != self.project_index.root:
+            return
+        self._indexer = None
+        if symbols is not None:
+            self.project_symbols = symbols
+            self.changed.emit()
+
+    def all_symbols(self):
+        """
+        Перебирает пары (путь, символ): сначала открытых файлов, затем остальных файлов проекта.
+        У нового, еще не сохраненного файла путь None.
+        """
+        root = self.project_index.root
+        seen = set()
+        for outline in self._documents.values():
+            path = os.path.abspath(outline.path) if outline.path else None
+            seen.add(path)
+            for symbol in outline.symbols:
+                yield path, symbol
+        if root is None:
+            return
+        for relative, symbols in self.project_symbols.items():
+            path = os.path.abspath(os.path.join(root, relative))
+            if path in seen:
+                continue
+            for symbol in symbols:
+                yield path, symbol
+
+    def close(self, wait=False):
+        for job in self._jobs:
+            job.cancel()
+        if wait:
+            for job in list(self._jobs):
+                job.done.wait()
+        self._indexer = None
@@ -1,13 +1,70 @@
-from PyQt6.QtWidgets import QTabWidget
+import logging
+import os
+import time
+from functools import partial
 
+from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtWidgets import QLabel, QMessageBox, QTabWidget, QWidget
+
+from document_tracker import DocumentTracker
 from editor import CustomEditor, File
-from db_view import DatabaseEditor, Database
+from globals import LOGGING_LEVEL
+from recovery import RecoveryJournal
+from tracing import traced
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOGGING_LEVEL)
+
+# Как часто пересчитывается память вкладок, в миллисекундах.
+MEMORY_CHECK_INTERVAL_MS = 5000
+
+
+class TabStub(QWidget):
+    """
+    Легкая заглушка вкладки: хранит только путь к файлу и позицию просмотра.
+    Настоящий редактор создается, когда вкладку впервые делают активной.
+    """
+
+    def __init__(self, file_path, state=None, *args, **kwargs):
+        super(TabStub, self).__init__(*args, **kwargs)
+        self.file = File(file_path)
+        self.state = state or {}
+        self.error_while_reading = False
+
+    @property
+    def sql_console(self) -> bool:
+        return bool(self.state.get('Консоль SQL'))
+
+    def view_state(self) -> dict:
+        return dict(self.state)
+
 
 class TabManager(QTabWidget):
 
-    def __init__(self, theme):
+    def __init__(self, theme, large_file_threshold=512, memory_budget=512):
         super(TabManager, self).__init__()
         self.theme = theme
+        # Файлы больше этого размера (в мегабайтах) открываются в просмотрщике без загрузки в редактор
+        self.large_file_threshold = large_file_threshold
+        # Сколько мегабайт могут занимать открытые вкладки, прежде чем давно не
+        # использовавшиеся из них будут выгружены в заглушки
+        self.memory_budget = memory_budget
+        # Пока сессия восстанавливается, заглушки не превращаются во вкладки
+        self._restoring = False
+        # Время последней активации каждой вкладки
+        self._last_used = {}
+        self.document_tracker = DocumentTracker(self)
+        self.recovery = RecoveryJournal(parent=self)
+        self.currentChanged.connect(self.materialize)
+        self.currentChanged.connect(self._on_current_changed)
+
+        self.memory_label = QLabel()
+        self.memory_label.setContentsMargins(4, 0, 4, 0)
+        self.setCornerWidget(self.memory_label, Qt.Corner.TopRightCorner)
+        self._memory_timer = QTimer(self)
+        self._memory_timer.setInterval(MEMORY_CHECK_INTERVAL_MS)
+        self._memory_timer.timeout.connect(self.enforce_memory_budget)
+        self._memory_timer.start()
 
     def editors_states(self) -> dict:
         """
@@ -22,36 +79,253 @@ class TabManager(QTabWidget):
         """
         return [self.widget(i).file for i in range(self.count())]
 
-    def show_file(self, filepath=None, is_new=False):
+    @traced
+    def show_file(self, filepath=None, is_new=False, sql_console=False):
         """
         The show_file function creates a new tab in the editor and displays the file contents.
         If no filepath is provided, it creates an empty editor instead.
         
         :param filepath=None: Determine whether the file is opened from a file or created new
         :param is_new=False: Determine whether the file should be opened in a new tab or not
+        :param sql_console=False: Open an SQL console for the database at filepath instead of its table
         
         :return: True if the file was opened successfully, False otherwise
         """
-        if filepath:
+        newtab, newtabName = self.create_widget(filepath, is_new, sql_console)
+        if newtab is None:
+            return False
+
+        self.addTab(newtab, newtabName)
+        self.setCurrentWidget(newtab)
+        return True
+
+    @traced
+    def create_widget(self, filepath=None, is_new=False, sql_console=False):
+        """
+        Создает виджет вкладки для файла, не добавляя его в панель.
+
+        :return: Виджет и заголовок вкладки, или (None, None), если файл не удалось открыть
+        """
+        newtab, newtabName = None, None
+        # Модули баз данных и просмотрщика загружаются при первом обращении к ним,
+        # чтобы не замедлять запуск редактора
+        if filepath and sql_console:
+            from sql_console import SqlConsole
+            newtab = SqlConsole(self.theme, filepath)
+            newtabName = f"SQL: {newtab.file.name}"
+        elif filepath:
             file = File(filepath)
             if file.extention in File.DATABASE_EXTENTIONS:
+                from db_view import Database, DatabaseEditor
                 db = Database(filepath)
                 newtab = DatabaseEditor(db)
+                db.pendingChanged.connect(partial(self.show_pending_edits, newtab))
+                newtab.sqlConsoleRequested.connect(partial(self.show_file, sql_console=True))
+            elif os.path.getsize(filepath) >= self.large_file_threshold * 1024 * 1024:
+                from large_file_view import LargeFileView
+                newtab = LargeFileView(file)
             else:
                 newtab = CustomEditor(self.theme, file_object=file)
+                newtab.loadProgress.connect(partial(self.show_load_progress, newtab))
+                newtab.loadFinished.connect(partial(self.show_load_finished, newtab))
+                newtab.loadFailed.connect(partial(self.show_load_failed, newtab))
                 newtab.setCursorPosition(0, 0)
                 newtab.ensureCursorVisible()
                 newtab.setFocus()
+                if not newtab.error_while_reading:
+                    self.document_tracker.track(newtab)
+                    self.recovery.attach(newtab)
             if newtab.error_while_reading:
-                return False
+                return None, None
             newtabName = newtab.file.name
         elif is_new:
             newtab = CustomEditor(self.theme)
             newtabName = "Без имени"
+            self.recovery.attach(newtab)
+        return newtab, newtabName
 
-        self.addTab(newtab, newtabName)
-        self.setCurrentWidget(newtab)
+    @traced
+    def materialize(self, index):
+        """
+        Заменяет заглушку с индексом `index` настоящей вкладкой и восстанавливает
+        в ней позицию просмотра. Если файл открыть не удалось, вкладка закрывается.
+        """
+        stub = self.widget(index)
+        if self._restoring or not isinstance(stub, TabStub):
+            return
+        if not os.path.exists(stub.file.path):
+            self.removeTab(index)
+            return
 
-        
-        
-        return True
+        widget, name = self.create_widget(stub.file.path, sql_console=stub.sql_console)
+        if widget is None:
+            self.removeTab(index)
+            return
+        if stub.sql_console:
+            name = f"SQL: {widget.file.name}"
+
+        self.blockSignals(True)
+        self.insertTab(index, widget, name)
+        self.removeTab(index + 1)
+        self.setCurrentIndex(index)
+        self.blockSignals(False)
+        if stub.state and hasattr(widget, 'restore_view_state'):
+            widget.restore_view_state(stub.state)
+        # Сигнал был заблокирован, а окно должно узнать о смене активной вкладки
+        self.currentChanged.emit(index)
+
+    def _on_current_changed(self, index):
+        widget = self.widget(index)
+        if widget is not None and not isinstance(widget, TabStub):
+            self._last_used[widget] = time.monotonic()
+            self.enforce_memory_budget()
+
+    def memory_usage(self) -> int:
+        """
+        Примерный объем памяти всех вкладок в байтах.
+        """
+        return sum(self.widget(i).memory_usage() for i in range(self.count())
+                   if hasattr(self.widget(i), 'memory_usage'))
+
+    @traced
+    def enforce_memory_budget(self):
+        """
+        Выгружает давно не использовавшиеся неизмененные вкладки, пока их общий объем
+        превышает `memory_budget`, и обновляет показатель памяти в панели вкладок.
+        """
+        budget = self.memory_budget * 1024 * 1024
+        usage = self.memory_usage()
+        if usage > budget:
+            current = self.currentWidget()
+            candidates = sorted(
+                (i for i in range(self.count())
+                 if self.widget(i) is not current and getattr(self.widget(i), 'can_unload', False)),
+                key=lambda i: self._last_used.get(self.widget(i), 0))
+            for index in candidates:
+                if usage <= budget:
+                    break
+                usage -= self.widget(index).memory_usage()
+                self.unload(index)
+        self.memory_label.setText(f"Память вкладок: {usage / 1024 / 1024:.0f} / {self.memory_budget} МБ")
+
+    @traced
+    def unload(self, index):
+        """
+        Заменяет вкладку заглушкой с тем же файлом и позицией просмотра.
+        При следующем переходе на неё файл будет прочитан заново.
+        """
+        widget = self.widget(index)
+        stub = TabStub(widget.file.path, self.tab_state(index))
+        logger.debug(f"Вкладка {widget.file.name} выгружена из памяти")
+        self.blockSignals(True)
+        current = self.currentIndex()
+        self.insertTab(index, stub, self.tabText(index))
+        self.removeTab(index + 1)
+        self.setCurrentIndex(current)
+        self.blockSignals(False)
+
+    def tab_state(self, index) -> dict:
+        """
+        Возвращает путь к файлу вкладки и позицию просмотра в нем.
+        """
+        widget = self.widget(index)
+        state = {'Путь': widget.file.path}
+        if hasattr(widget, 'view_state'):
+            state.update(widget.view_state())
+        return state
+
+    def session(self) -> dict:
+        """
+        Описание открытых вкладок для сохранения сессии. Новые файлы без пути пропускаются.
+        """
+        tabs, active = [], 0
+        for index in range(self.count()):
+            if self.widget(index).file.new:
+                continue
+            if index == self.currentIndex():
+                active = len(tabs)
+            tabs.append(self.tab_state(index))
+        return {'Вкладки': tabs, 'Активная вкладка': active}
+
+    @traced
+    def restore_session(self, session: dict):
+        """
+        Открывает вкладки сохраненной сессии заглушками. Файлы читаются только
+        при переходе на вкладку, поэтому сразу создается лишь активная из них.
+        """
+        saved_active = session.get('Активная вкладка', 0)
+        active = None
+        self._restoring = True
+        try:
+            for number, state in enumerate(session.get('Вкладки', ())):
+                path = state.get('Путь')
+                if not path or not os.path.exists(path):
+                    continue
+                stub = TabStub(path, state)
+                index = self.addTab(stub, f"SQL: {stub.file.name}" if stub.sql_console else stub.file.name)
+                if active is None or number <= saved_active:
+                    active = index
+        finally:
+            self._restoring = False
+        if active is not None:
+            self.setCurrentIndex(active)
+            self.materialize(active)
+
+    @traced
+    def removeTab(self, index):
+        """
+        Удаляет вкладку и освобождает ресурсы её виджета.
+        """
+        widget = self.widget(index)
+        super(TabManager, self).removeTab(index)
+        if widget is None:
+            return
+        self._last_used.pop(widget, None)
+        if isinstance(widget, CustomEditor):
+            self.document_tracker.untrack(widget)
+            self.recovery.detach(widget)
+        if hasattr(widget, 'release'):
+            widget.release()
+        widget.deleteLater()
+
+    def release(self):
+        """
+        Освобождает ресурсы виджетов всех вкладок. Вызывается при закрытии окна.
+        """
+        for index in range(self.count()):
+            widget = self.widget(index)
+            if hasattr(widget, 'release'):
+                widget.release()
+
+    def show_load_progress(self, widget, percent):
+        """
+        Показывает в заголовке вкладки, какая часть файла уже загружена.
+        """
+        index = self.indexOf(widget)
+        if index != -1:
+            self.setTabText(index, f"{widget.file.name} ({percent}%)")
+
+    def show_load_finished(self, widget, complete):
+        index = self.indexOf(widget)
+        if index != -1:
+            name = widget.file.name
+            self.setTabText(index, name if complete else f"{name} (загружен частично)")
+
+    def show_load_failed(self, widget, message):
+        """
+        Закрывает вкладку, файл которой не удалось дочитать.
+        """
+        index = self.indexOf(widget)
+        if index == -1:
+            return
+        QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить файл {widget.file.name}: {message}")
+        self.removeTab(index)
+
+    def show_pending_edits(self, widget, count):
+        """
+        Показывает в заголовке вкладки количество еще не записанных изменений базы данных.
+        """
+        index = self.indexOf(widget)
+        if index != -1:
+            name = widget.file.name
+            self.setTabText(index, f"{name} [{count}]" if count else name)
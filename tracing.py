@@ -0,0 +1,165 @@
+"""
+Трассировка задержек интерфейса.
+
+Обработчики действий и операции с вкладками отмечены декоратором `traced`: пока
+трассировка включена, каждый их вызов записывается как отрезок времени. Таймер-пульс
+в GUI потоке замечает, когда цикл событий не успевал обрабатывать события, и записывает
+такие медленные кадры. Трассировку можно сохранить в формате Chrome trace event и
+открыть в chrome://tracing или https://ui.perfetto.dev.
+
+Трассировка включается из меню "Справка" или переменной окружения `EDITOR_TRACE`.
+Если её значение оканчивается на .json, при выходе трассировка сохраняется в этот файл.
+Выключенная трассировка стоит одной проверки флага на вызов.
+"""
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+from PyQt6.QtCore import QCoreApplication, QObject, Qt, QTimer
+
+from globals import LOGGING_LEVEL
+from utils import atomic_write
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOGGING_LEVEL)
+
+TRACE_ENVIRONMENT_VARIABLE = 'EDITOR_TRACE'
+# Как часто срабатывает пульс цикла событий, в миллисекундах.
+HEARTBEAT_INTERVAL_MS = 16
+# Опоздание пульса, начиная с которого кадр считается медленным, в миллисекундах.
+SLOW_FRAME_MS = 50
+# Сколько последних событий хранится; более старые вытесняются.
+MAX_TRACE_EVENTS = 200000
+
+SLOW_FRAME_NAME = "Цикл событий занят"
+
+
+class Tracer(QObject):
+    """
+    Хранит записанные отрезки и медленные кадры в кольцевом буфере.
+    Отрезки можно записывать из любого потока, пульс работает в GUI потоке.
+    """
+
+    def __init__(self, parent=None):
+        super(Tracer, self).__init__(parent)
+        value = os.environ.get(TRACE_ENVIRONMENT_VARIABLE, '')
+        self.enabled = bool(value) and value != '0'
+        self.export_path = value if value.lower().endswith('.json') else None
+        # Кортежи (имя, категория, начало нс, длительность нс, поток, аргументы)
+        self.events = deque(maxlen=MAX_TRACE_EVENTS)
+        self.slow_frames = 0
+        self.max_lag_ms = 0.0
+        self._origin = time.perf_counter_ns()
+        self._heartbeat = None
+        self._last_beat = None
+        self._thread_names = {}
+
+    def install(self):
+        """
+        Запускает пульс, если трассировка включена. Вызывается, когда QApplication уже создан.
+        """
+        self.set_enabled(self.enabled)
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        if QCoreApplication.instance() is None:
+            return
+        if enabled:
+            if self._heartbeat is None:
+                self._heartbeat = QTimer(self)
+                self._heartbeat.setTimerType(Qt.TimerType.PreciseTimer)
+                self._heartbeat.setInterval(HEARTBEAT_INTERVAL_MS)
+                self._heartbeat.timeout.connect(self._beat)
+            self._last_beat = time.perf_counter_ns()
+            self._heartbeat.start()
+        elif self._heartbeat is not None:
+            self._heartbeat.stop()
+
+    def _beat(self):
+        now = time.perf_counter_ns()
+        expected = self._last_beat + HEARTBEAT_INTERVAL_MS * 1000000
+        self._last_beat = now
+        lag = now - expected
+        if lag >= SLOW_FRAME_MS * 1000000:
+            self.slow_frames += 1
+            self.max_lag_ms = max(self.max_lag_ms, lag / 1000000)
+            self.record(SLOW_FRAME_NAME, 'event loop', expected, lag, {'lag_ms': round(lag / 1000000, 1)})
+
+    def record(self, name, category, start, duration, args=None):
+        thread = threading.get_ident()
+        if thread not in self._thread_names:
+            self._thread_names[thread] = threading.current_thread().name
+        self.events.append((name, category, start, duration, thread, args))
+
+    def clear(self):
+        self.events.clear()
+        self.slow_frames = 0
+        self.max_lag_ms = 0.0
+
+    def trace_events(self) -> dict:
+        """
+        Записанные события в формате Chrome trace event.
+        """
+        pid = os.getpid()
+        main_thread = threading.main_thread().ident
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread,
+                   'args': {'name': 'GUI' if thread == main_thread else name}}
+                  for thread, name in list(self._thread_names.items())]
+        for name, category, start, duration, thread, args in list(self.events):
+            event = {'name': name, 'cat': category, 'ph': 'X', 'pid': pid, 'tid': thread,
+                     'ts': (start - self._origin) / 1000, 'dur': duration / 1000}
+            if args:
+                event['args'] = args
+            events.append(event)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export(self, path):
+        """
+        Сохраняет трассировку в файл `path`. Бросает OSError, если записать не удалось.
+        """
+        atomic_write(path, json.dumps(self.trace_events(), ensure_ascii=False))
+
+    def close(self):
+        """
+        Останавливает пульс и сохраняет трассировку в файл из переменной окружения, если он указан.
+        """
+        if self._heartbeat is not None:
+            self._heartbeat.stop()
+        if self.enabled and self.export_path:
+            try:
+                self.export(self.export_path)
+            except OSError as e:
+                logger.warning(f"Не удалось сохранить трассировку: {e}")
+
+
+tracer = Tracer()
+
+
+def traced(function):
+    """
+    Декоратор: записывает каждый вызов функции как отрезок трассировки с её полным именем.
+    """
+    name = function.__qualname__
+    category = function.__module__
+    code = function.__code__
+    # Сигналы Qt передают обработчику все свои аргументы, а лишние PyQt отбрасывает,
+    # только глядя на саму функцию. За обертку это приходится делать ей самой.
+    max_arguments = None if code.co_flags & inspect.CO_VARARGS else code.co_argcount
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        if max_arguments is not None and len(args) > max_arguments:
+            args = args[:max_arguments]
+        if not tracer.enabled:
+            return function(*args, **kwargs)
+        start = time.perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            tracer.record(name, category, start, time.perf_counter_ns() - start)
+    return wrapper
@@ -1,66 +1,350 @@
-from PyQt6.QtWidgets import QTreeView, QApplication
-from PyQt6.QtGui import QFileSystemModel
-from PyQt6.QtCore import QDir, QModelIndex, QSortFilterProxyModel
+import bisect
+import logging
+import os
 
-FILE_SYSTEM_ROOT = QDir.rootPath()
+from PyQt6.QtWidgets import QTreeView, QApplication, QFileIconProvider
+from PyQt6.QtCore import (QAbstractItemModel, QFileSystemWatcher, QModelIndex, Qt, QTimer)
 
+from globals import LOGGING_LEVEL
+from ignore import IgnoreRules
 
-class ProxyModel(QSortFilterProxyModel):
+logger = logging.getLogger(__name__)
+logger.setLevel(LOGGING_LEVEL)
+
+# Сколько строк добавляется в модель за один вызов fetchMore. Остальное содержимое
+# большой папки дозагружается, когда пользователь докручивает до конца списка.
+FETCH_BATCH_SIZE = 500
+# Задержка перед повторным чтением измененной папки: за одну операцию приходит
+# несколько уведомлений подряд.
+REFRESH_DELAY_MS = 200
+# Роль с абсолютным путем к файлу или папке.
+PATH_ROLE = Qt.ItemDataRole.UserRole + 1
+
+
+def _sort_key(name, is_dir):
+    # Папки выше файлов, внутри - по имени без учета регистра
+    return (not is_dir, name.casefold(), name)
+
+
+class Node:
+    __slots__ = ('name', 'path', 'relative', 'is_dir', 'parent', 'row', 'children', 'pending')
+
+    def __init__(self, name, path, relative, is_dir, parent=None, row=0):
+        self.name = name
+        self.path = path
+        self.relative = relative
+        self.is_dir = is_dir
+        self.parent = parent
+        self.row = row
+        # Показанные в модели дочерние узлы
+        self.children = []
+        # Прочитанные, но еще не добавленные в модель записи (имя, папка ли);
+        # None - папка еще не читалась
+        self.pending = None
+
+    @property
+    def key(self):
+        return _sort_key(self.name, self.is_dir)
+
+
+class ProjectTreeModel(QAbstractItemModel):
+    """
+    Модель дерева файлов открытой папки.
+
+    В отличие от `QFileSystemModel`, который следит за всей файловой системой от корня,
+    модель читает папку только когда её раскрывают, одним `os.scandir` без отдельного
+    `stat` на каждый файл, и добавляет строки порциями по `FETCH_BATCH_SIZE`.
+    Файлы из правил исключения проекта не показываются. Следит модель только за
+    раскрытыми папками, а при смене корня сбрасывается, а не создается заново.
+    """
 
     def __init__(self, parent=None):
-        super().__init__(parent)
-        self._root_path = ""
-
-    def filterAcceptsRow(self, source_row, source_parent):
-        source_model = self.sourceModel()
-        if self._root_path and isinstance(source_model, QFileSystemModel):
-            root_index = source_model.index(self._root_path).parent()
-            if root_index == source_parent:
-                index = source_model.index(source_row, 0, source_parent)
-                return index.data(
-                    QFileSystemModel.Roles.FilePathRole) == self._root_path
-        return True
+        super(ProjectTreeModel, self).__init__(parent)
+        self._root = None
+        self.rules = IgnoreRules()
+        provider = QFileIconProvider()
+        self._folder_icon = provider.icon(QFileIconProvider.IconType.Folder)
+        self._file_icon = provider.icon(QFileIconProvider.IconType.File)
+        self._nodes = {}
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self._on_directory_changed)
+        self._dirty = set()
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.setSingleShot(True)
+        self._refresh_timer.setInterval(REFRESH_DELAY_MS)
+        self._refresh_timer.timeout.connect(self._refresh_dirty)
 
     @property
     def root_path(self):
-        return self._root_path
+        return self._root.path if self._root else None
 
-    @root_path.setter
-    def root_path(self, p):
-        self._root_path = p
-        self.invalidateFilter()
+    def set_root(self, path, rules=None):
+        """
+        Показывает в модели папку `path`. Уже созданные представления остаются
+        подключенными к модели.
+        """
+        self.beginResetModel()
+        if self.watcher.directories():
+            self.watcher.removePaths(self.watcher.directories())
+        self._dirty.clear()
+        self._nodes = {}
+        self._root = None
+        if path:
+            path = os.path.abspath(path)
+            self.rules = rules or IgnoreRules(path)
+            self._root = Node(os.path.basename(path) or path, path, '', True)
+            self._nodes[path] = self._root
+        self.endResetModel()
 
+    def root_index(self) -> QModelIndex:
+        """
+        Индекс самой открытой папки, единственной строки верхнего уровня.
+        """
+        if self._root is None:
+            return QModelIndex()
+        return self.createIndex(0, 0, self._root)
 
-class FileTree(QTreeView):
+    def node(self, index) -> Node:
+        return index.internalPointer() if index.isValid() else None
 
-    def __init__(self, path=FILE_SYSTEM_ROOT):
-        QTreeView.__init__(self)
-        
-        self.dirModel = QFileSystemModel()
-        self.dirModel.setRootPath(QDir.rootPath())
-        self.dirModel.setFilter(QDir.Filter.Files | QDir.Filter.Dirs | QDir.Filter.NoDotAndDotDot)
+    def file_path(self, index) -> str:
+        node = self.node(index)
+        return node.path if node else None
+
+    def is_dir(self, index) -> bool:
+        node = self.node(index)
+        return bool(node and node.is_dir)
+
+    def _index(self, node) -> QModelIndex:
+        return self.createIndex(node.row, 0, node)
+
+    # Интерфейс QAbstractItemModel
+
+    def index(self, row, column, parent=QModelIndex()):
+        if column != 0:
+            return QModelIndex()
+        if not parent.isValid():
+            if row == 0 and self._root is not None:
+                return self.createIndex(0, 0, self._root)
+            return QModelIndex()
+        node = parent.internalPointer()
+        if 0 <= row < len(node.children):
+            return self.createIndex(row, 0, node.children[row])
+        return QModelIndex()
+
+    def parent(self, index=QModelIndex()):
+        if not index.isValid():
+            return QModelIndex()
+        node = index.internalPointer()
+        if node.parent is None:
+            return QModelIndex()
+        return self._index(node.parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return 1 if self._root is not None else 0
+        return len(parent.internalPointer().children)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return self._root is not None
+        node = parent.internalPointer()
+        if not node.is_dir:
+            return False
+        # Пока папка не прочитана, считаем, что она не пуста: иначе пришлось бы читать её заранее
+        return node.pending is None or bool(node.children or node.pending)
+
+    def canFetchMore(self, parent):
+        node = self.node(parent)
+        return bool(node and node.is_dir and (node.pending is None or node.pending))
+
+    def fetchMore(self, parent):
+        node = self.node(parent)
+        if node is None or not node.is_dir:
+            return
+        if node.pending is None:
+            node.pending = self._scan(node)
+            self.watch(node)
+        batch, node.pending = node.pending[:FETCH_BATCH_SIZE], node.pending[FETCH_BATCH_SIZE:]
+        if not batch:
+            # Пустая папка: стрелка раскрытия больше не нужна
+            self.dataChanged.emit(parent, parent)
+            return
+        first = len(node.children)
+        self.beginInsertRows(parent, first, first + len(batch) - 1)
+        for row, (name, is_dir) in enumerate(batch, first):
+            node.children.append(self._child(node, name, is_dir, row))
+        self.endInsertRows()
 
-        root_index = self.dirModel.index(path).parent()
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        node = self.node(index)
+        if node is None:
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            return node.name
+        if role == Qt.ItemDataRole.DecorationRole:
+            return self._folder_icon if node.is_dir else self._file_icon
+        if role in (PATH_ROLE, Qt.ItemDataRole.ToolTipRole):
+            return node.path
+        return None
 
-        self.proxy = ProxyModel(self.dirModel)
-        self.proxy.setSourceModel(self.dirModel)
-        self.proxy.root_path = path
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemFlag.NoItemFlags
+        return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
 
-        self.setModel(self.proxy)
+    # Чтение папок и слежение за ними
+
+    def _child(self, parent, name, is_dir, row):
+        path = os.path.join(parent.path, name)
+        relative = f'{parent.relative}/{name}' if parent.relative else name
+        node = Node(name, path, relative, is_dir, parent, row)
+        if is_dir:
+            self._nodes[path] = node
+        return node
+
+    def _scan(self, node) -> list:
+        """
+        Читает папку и возвращает отсортированный список (имя, папка ли) без исключенных файлов.
+        """
+        prefix = f'{node.relative}/' if node.relative else ''
+        entries = []
+        try:
+            with os.scandir(node.path) as it:
+                for entry in it:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if not self.rules.is_ignored(prefix + entry.name, is_dir):
+                        entries.append((entry.name, is_dir))
+        except OSError as e:
+            logger.warning(f"Не удалось прочитать папку {node.path}: {e}")
+        entries.sort(key=lambda entry: _sort_key(*entry))
+        return entries
+
+    def watch(self, node):
+        if node.pending is not None and node.path not in self.watcher.directories():
+            self.watcher.addPath(node.path)
+
+    def unwatch(self, node):
+        """
+        Прекращает следить за свернутой папкой. При следующем раскрытии она перечитывается.
+        """
+        if node.path in self.watcher.directories():
+            self.watcher.removePath(node.path)
+
+    def expanded(self, index):
+        node = self.node(index)
+        if node is not None and node.pending is not None and node.path not in self.watcher.directories():
+            # Пока папка была свернута, за ней не следили
+            self.refresh(node)
+            self.watch(node)
+
+    def collapsed(self, index):
+        node = self.node(index)
+        if node is not None:
+            self.unwatch(node)
+
+    def _on_directory_changed(self, path):
+        self._dirty.add(path)
+        self._refresh_timer.start()
+
+    def _refresh_dirty(self):
+        paths, self._dirty = self._dirty, set()
+        for path in paths:
+            node = self._nodes.get(path)
+            if node is not None and node.pending is not None:
+                self.refresh(node)
+
+    def refresh(self, node):
+        """
+        Перечитывает папку и применяет разницу к модели: убирает исчезнувшие строки
+        и вставляет новые на их места по порядку сортировки.
+        """
+        entries = self._scan(node)
+        present = set(entries)
+        parent = self._index(node)
+
+        for row in range(len(node.children) - 1, -1, -1):
+            child = node.children[row]
+            if (child.name, child.is_dir) not in present:
+                self.beginRemoveRows(parent, row, row)
+                del node.children[row]
+                self._forget(child)
+                self.endRemoveRows()
+        self._renumber(node)
+
+        shown = {(child.name, child.is_dir) for child in node.children}
+        hidden = [entry for entry in entries if entry not in shown]
+        if node.pending:
+            # Папка показана не целиком: новые записи дождутся своей порции
+            node.pending = hidden
+            return
+        node.pending = []
+        keys = [child.key for child in node.children]
+        for name, is_dir in hidden:
+            key = _sort_key(name, is_dir)
+            row = bisect.bisect_left(keys, key)
+            self.beginInsertRows(parent, row, row)
+            node.children.insert(row, self._child(node, name, is_dir, row))
+            keys.insert(row, key)
+            self._renumber(node, row + 1)
+            self.endInsertRows()
+
+    def _renumber(self, node, start=0):
+        for row in range(start, len(node.children)):
+            node.children[row].row = row
+
+    def _forget(self, node):
+        if not node.is_dir:
+            return
+        self._nodes.pop(node.path, None)
+        self.unwatch(node)
+        for child in node.children:
+            self._forget(child)
+
+
+class FileTree(QTreeView):
+    """
+    Дерево файлов открытой папки в док панели.
+    """
+
+    def __init__(self, path=None):
+        QTreeView.__init__(self)
+
+        self.dirModel = ProjectTreeModel(self)
+        self.setModel(self.dirModel)
+        self.expanded.connect(self.dirModel.expanded)
+        self.collapsed.connect(self.dirModel.collapsed)
 
-        proxy_root_index = self.proxy.mapFromSource(root_index)
-        self.setRootIndex(proxy_root_index)
-        
         self.setHeaderHidden(True)
-        self.hideColumn(1)
-        self.hideColumn(2)
-        self.hideColumn(3)
+        self.setUniformRowHeights(True)
         self.setMaximumWidth(1000)
         self.setMinimumWidth(0)
 
+        if path:
+            self.set_root(path)
+
+    def set_root(self, path, rules=None):
+        """
+        Открывает в дереве папку `path` без пересоздания модели.
+        """
+        self.dirModel.set_root(path, rules)
+        root_index = self.dirModel.root_index()
+        if root_index.isValid():
+            self.expand(root_index)
+
+    def file_path(self, index) -> str:
+        return self.dirModel.file_path(index)
+
+
 if __name__ == '__main__':
     import sys
     app = QApplication(sys.argv)
-    w = FileTree()
+    w = FileTree(sys.argv[1] if len(sys.argv) > 1 else os.getcwd())
     w.show()
-    sys.exit(app.exec())
\ No newline at end of file
+    sys.exit(app.exec())
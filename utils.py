@@ -1,14 +1,126 @@
 import json
-from pprint import pprint
-from globals import SETTINGS_PATH
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import defaultdict, deque
 
+from PyQt6.QtCore import QFileSystemWatcher, QObject, QRunnable, QThreadPool, QTimer
+
+from globals import LOGGING_LEVEL, SETTINGS_PATH
 from palettes import Theme
 
-class SettingsInstance:
+logger = logging.getLogger(__name__)
+logger.setLevel(LOGGING_LEVEL)
+
+# Маска прав процесса. Узнать её можно только заменив, поэтому она читается один раз
+# при импорте, пока фоновые потоки записи еще не запущены.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def atomic_write(path, data: str | bytes, encoding='utf8'):
+    """
+    Атомарно записывает `data` в файл: данные пишутся во временный файл рядом с ним,
+    сбрасываются на диск и только потом переименовываются поверх исходного файла.
+    Если процесс упадет посреди записи, на диске останется старая версия файла.
+    """
+    path = os.path.realpath(path)
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data.encode(encoding) if isinstance(data, str) else data)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        else:
+            # mkstemp создает файл с правами 0600, а новый файл должен получить
+            # обычные права с учетом маски, как при open(path, 'w')
+            os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    if hasattr(os, 'O_DIRECTORY'):
+        # Переименование тоже нужно сбросить на диск, иначе после сбоя оно может пропасть
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+# Через сколько миллисекунд после последнего изменения настройки записываются на диск.
+SETTINGS_SAVE_DELAY_MS = 500
+# Сколько собственных записей настроек может ждать своего события от наблюдателя.
+SETTINGS_KNOWN_TEXTS = 16
+
+
+class _SettingsWriter(QRunnable):
+    """
+    Записывает снимок настроек на диск в фоновом потоке.
+    """
+    # Записи из разных потоков идут по очереди, а устаревший снимок не перезаписывает новый
+    _lock = threading.Lock()
+    _written_generation = 0
+
+    def __init__(self, path, text, generation):
+        super(_SettingsWriter, self).__init__()
+        self.path = path
+        self.text = text
+        self.generation = generation
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            with _SettingsWriter._lock:
+                if self.generation <= _SettingsWriter._written_generation:
+                    return
+                atomic_write(self.path, self.text)
+                _SettingsWriter._written_generation = self.generation
+        except OSError as e:
+            logger.error(f"Не удалось сохранить настройки: {e}")
+        finally:
+            self.done.set()
+
+
+class SettingsInstance(QObject):
+    """
+    Настройки редактора из settings.json.
+
+    Изменения копятся в памяти и записываются на диск одним снимком через
+    `SETTINGS_SAVE_DELAY_MS` после последнего из них: запись атомарная и идет вне
+    GUI потока. Файл отслеживается, поэтому правки из другого запущенного редактора
+    или из текстового редактора подхватываются сами, а подписчики (`subscribe`)
+    узнают только о тех ключах, которые действительно поменялись.
+    """
+
+    def __init__(self, path=SETTINGS_PATH):
+        super(SettingsInstance, self).__init__()
+        self.path = path
+        with open(self.path, 'r', encoding='utf8') as f:
+            text = f.read()
+        self.__settings = json.loads(text)
+        # Тексты, которые уже есть или скоро окажутся в файле: последний прочитанный и
+        # все еще не подтвержденные событием записи этого окна
+        self.__known_texts = deque([text], maxlen=SETTINGS_KNOWN_TEXTS)
+        self.__dirty = set()
+        self.__generation = 0
+        self.__writer = None
+        self.__subscribers = defaultdict(list)
 
-    def __init__(self):
-        with open(SETTINGS_PATH, 'r', encoding='utf8') as f:
-            self.__settings = json.load(f)
+        self.__save_timer = QTimer(self)
+        self.__save_timer.setSingleShot(True)
+        self.__save_timer.setInterval(SETTINGS_SAVE_DELAY_MS)
+        self.__save_timer.timeout.connect(self.flush)
+
+        self.__watcher = QFileSystemWatcher([self.path], self)
+        self.__watcher.fileChanged.connect(self._on_file_changed)
         self.refresh()
 
     def refresh(self):
@@ -16,32 +128,102 @@ class SettingsInstance:
         self.default_theme = Theme.get_theme(self.__settings.get('Тема по умолчанию'))
         self.run_settings = self.__settings.get('Настройки запуска')
         self.recent_files = self.__settings.get('Последние файлы')
+        self.sqlite_profiles = self.__settings.get('Профили SQLite', {})
+        self.large_file_threshold = self.__settings.get('Порог больших файлов (МБ)', 512)
+        self.tab_memory_budget = self.__settings.get('Память вкладок (МБ)', 512)
+        self.benchmark_repeats = self.__settings.get('Повторов замера', 10)
+        self.languages = self.__settings.get('Языки')
+
+    def get(self, key: str, default=None):
+        return self.__settings.get(key, default)
+
+    def subscribe(self, key: str, callback):
+        """
+        Подписывает `callback(value)` на изменения ключа `key`, как из этого окна,
+        так и из файла настроек.
+        """
+        self.__subscribers[key].append(callback)
+
+    def _notify(self, keys):
+        for key in keys:
+            for callback in self.__subscribers.get(key, ()):
+                callback(self.__settings.get(key))
 
     def save(self):
-        with open(SETTINGS_PATH, 'w', encoding='utf8') as f:
-            json.dump(self.__settings, f, ensure_ascii=False)
+        """
+        Планирует запись настроек. Несколько изменений подряд записываются одним разом.
+        """
+        self.__save_timer.start()
+
+    def flush(self, wait=False):
+        """
+        Сразу записывает накопленные изменения. С `wait` дожидается окончания записи,
+        это нужно перед выходом из приложения.
+        """
+        self.__save_timer.stop()
+        if self.__dirty:
+            self.__generation += 1
+            text = json.dumps(self.__settings, ensure_ascii=False, indent=2) + '\n'
+            self.__known_texts.append(text)
+            self.__dirty.clear()
+            self.__writer = _SettingsWriter(self.path, text, self.__generation)
+            QThreadPool.globalInstance().start(self.__writer)
+        if wait and self.__writer is not None:
+            self.__writer.done.wait()
 
     def set(self, key: str, value):
-        self.__settings[key] = value
-        self.save()
+        self.update({key: value})
 
     def update(self, chains: dict):
+        changed = [key for key, value in chains.items() if self.__settings.get(key) != value]
+        if not changed:
+            return
         self.__settings.update(chains)
+        self.__dirty.update(changed)
+        self.refresh()
         self.save()
-        
+        self._notify(changed)
+
     def add_recent(self, file_path):
         recent: list = self.__settings['Последние файлы']
         if file_path in recent:
             return
-        
-        if len(recent) >= 10:
-            recent.pop(0)
-            
-        self.__settings.update({'Последние файлы': recent + [file_path]})
-        self.refresh()
-        self.save()
+        self.set('Последние файлы', recent[-9:] + [file_path])
+
+    def _on_file_changed(self, path):
+        # При атомарной записи файл заменяется новым, и наблюдатель перестает за ним следить
+        if path not in self.__watcher.files() and os.path.exists(path):
+            self.__watcher.addPath(path)
+        try:
+            with open(path, 'r', encoding='utf8') as f:
+                text = f.read()
+            if text in self.__known_texts:
+                # Это одна из наших записей: событие о ней могло прийти, когда следующая
+                # уже начата, поэтому более старые тексты больше не понадобятся
+                while self.__known_texts.popleft() != text:
+                    pass
+                self.__known_texts.appendleft(text)
+                return
+            settings = json.loads(text)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось перечитать настройки: {e}")
+            return
+
+        self.__known_texts.append(text)
+        # Еще не записанные изменения этого окна важнее прочитанных из файла
+        for key in self.__dirty:
+            if key in self.__settings:
+                settings[key] = self.__settings[key]
+        changed = [key for key in settings.keys() | self.__settings.keys()
+                   if settings.get(key) != self.__settings.get(key)]
+        self.__settings = settings
+        if changed:
+            logger.debug(f"Настройки изменены извне: {', '.join(changed)}")
+            self.refresh()
+            self._notify(changed)
 
     def describe(self):
+        from pprint import pprint
         pprint(self.__settings)
 
 
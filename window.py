@@ -1,15 +1,27 @@
 import os
-import subprocess
-from functools import partial
 from typing import Tuple
 
 from PyQt6.QtCore import QCoreApplication, QModelIndex, Qt, pyqtSlot
-from PyQt6.QtGui import QAction, QFileSystemModel, QIcon
+from PyQt6.QtGui import QAction, QIcon
 from PyQt6.QtWidgets import (QDockWidget, QFileDialog, QFrame, QLabel,
                              QMainWindow, QMessageBox, QVBoxLayout)
 
+from db_connections import registry
+from db_view import DatabaseEditor
+from editor import CustomEditor
 from globals import WINDOW_ICON
+from lexer_registry import lexer_registry
+from project_index import ProjectIndex
+from project_search import SearchDock
+from run_panel import RunDock
+from profiling import ProfileDock
+from symbol_index import SymbolIndex
+from outline import GoToSymbolPopup, OutlineDock
+from diagnostics import DiagnosticsEngine
+from quick_open import QuickOpenPopup
+from save_service import SaveService
 from tabmanager import TabManager
+from tracing import tracer, traced
 from tree import FileTree
 
 
@@ -24,6 +36,10 @@ class CustomMainWindow(QMainWindow):
 
         self.settings = settings
         self.theme = self.settings.default_theme
+        # Папка, открытая в дереве файлов
+        self.project_root = None
+        registry.configure(self.settings.sqlite_profiles)
+        lexer_registry.configure(self.settings.languages)
 
         layout = QVBoxLayout()
 
@@ -32,8 +48,33 @@ class CustomMainWindow(QMainWindow):
 
         self.setCentralWidget(frame)
 
-        self.tab_manager = TabManager(theme=self.theme)
+        self.save_service = SaveService(self)
+
+        self.project_index = ProjectIndex(self)
+        self.quick_open = QuickOpenPopup(self.project_index, self)
+        self.quick_open.fileChosen.connect(self.openActionHandler)
+        self.search_dock = SearchDock(self.project_index, self)
+        self.search_dock.matchActivated.connect(self.openActionHandler)
+        self.run_dock = RunDock(self)
+        self.run_dock.stateChanged.connect(self._updateRunActions)
+        self.profile_dock = ProfileDock(self.run_dock, self)
+        self.profile_dock.functionActivated.connect(self.openActionHandler)
+        self.symbol_index = SymbolIndex(self.project_index, self)
+        self.outline_dock = OutlineDock(self.symbol_index, self)
+        self.outline_dock.lineActivated.connect(self.goToLine)
+        self.go_to_symbol = GoToSymbolPopup(self.symbol_index, self)
+        self.go_to_symbol.symbolChosen.connect(self.symbolChosenHandler)
+        self.diagnostics = DiagnosticsEngine(self)
+        self.save_service.saved.connect(self.savedHandler)
+        self.save_service.failed.connect(self.saveFailedHandler)
+
+        self.tab_manager = TabManager(theme=self.theme,
+                                      large_file_threshold=self.settings.large_file_threshold,
+                                      memory_budget=self.settings.tab_memory_budget)
         self.tab_manager.setVisible(False)
+        self.tab_manager.currentChanged.connect(self._showProfileOfCurrent)
+        self.tab_manager.currentChanged.connect(self._showOutlineOfCurrent)
+        self.tab_manager.currentChanged.connect(self._checkCurrent)
 
         self.file_tree = FileTree()
         self.file_tree.doubleClicked.connect(self.openFromTree)
@@ -49,6 +90,26 @@ class CustomMainWindow(QMainWindow):
         self.addDockWidget(Qt.DockWidgetArea.LeftDockWidgetArea,
                            self.directory_sidebar)
 
+        self.search_dock.setAllowedAreas(
+            Qt.DockWidgetArea.BottomDockWidgetArea
+            | Qt.DockWidgetArea.LeftDockWidgetArea
+            | Qt.DockWidgetArea.RightDockWidgetArea)
+        self.search_dock.setVisible(False)
+        self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea,
+                           self.search_dock)
+
+        self.run_dock.setVisible(False)
+        self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea,
+                           self.run_dock)
+
+        self.profile_dock.setVisible(False)
+        self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea,
+                           self.profile_dock)
+
+        self.outline_dock.setVisible(False)
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea,
+                           self.outline_dock)
+
         self.placeholder = QLabel(
             'Создайте новый файл (Ctrl + n)\nили\nоткройте существующий (Ctrl + o).'
         )
@@ -56,12 +117,115 @@ class CustomMainWindow(QMainWindow):
 
         self._createActions()
         self._createMenuBar()
+        self._subscribeSettings()
 
         layout.addWidget(self.tab_manager)
         layout.addWidget(self.placeholder)
 
+        tracer.install()
+        self.restoreSession()
+        self.recoverUnsaved()
         self.show()
 
+    @traced
+    def restoreSession(self):
+        """
+        Восстанавливает вкладки и папку из сохраненной при выходе сессии.
+        """
+        session = self.settings.get('Сессия') or {}
+        root = session.get('Корень дерева')
+        if root and os.path.isdir(root):
+            self.open_directory(root)
+        self.tab_manager.restore_session(session)
+        if self.tab_manager.count():
+            self.placeholder.setVisible(False)
+            self.tab_manager.setVisible(True)
+
+    @traced
+    def recoverUnsaved(self):
+        """
+        Открывает вкладки с несохраненными правками, восстановленными из журнала
+        после аварийного завершения редактора. Восстановленный текст заменяет текст
+        файла одной правкой, поэтому её можно отменить. Журнал удаляется, только когда
+        текст уже в редакторе, иначе он откладывается и его путь показывается в строке состояния.
+        """
+        recovery = self.tab_manager.recovery
+        restored, waiting, failed, journals = [], [], [], []
+        for item in recovery.recover():
+            name = os.path.basename(item.path or '') or "Без имени"
+            if item.text is None:
+                failed.append(f"{name} ({item.reason})")
+                journals.append(item.journal)
+                continue
+            editor = self._openRecovered(item)
+            if editor is None:
+                failed.append(f"{name} (файл не открылся в редакторе)")
+                journals.append(recovery.set_aside(item))
+            elif editor.is_loading:
+                # Текст заменяется, когда файл дочитан до конца
+                waiting.append(name)
+                self._recoverWhenLoaded(editor, item, name)
+            else:
+                editor.replace_text(item.text)
+                recovery.applied(item)
+                restored.append(name)
+
+        messages = []
+        if restored:
+            messages.append("Восстановлены несохраненные правки: " + ", ".join(restored))
+        if waiting:
+            messages.append("Правки будут восстановлены после загрузки: " + ", ".join(waiting))
+        if failed:
+            messages.append("Не удалось восстановить: " + ", ".join(failed))
+        if journals:
+            messages.append("Журналы правок сохранены: " + ", ".join(journals))
+        if messages:
+            self.statusBar().showMessage(". ".join(messages))
+
+    def _openRecovered(self, item):
+        """
+        Открывает вкладку для восстановленного документа и возвращает её редактор
+        или None, если документ открылся не в `CustomEditor`.
+        """
+        if item.path and os.path.exists(item.path):
+            index = self.find_tab(item.path)
+            if index != -1:
+                self.tab_manager.setCurrentIndex(index)
+            elif not self.add_tab(path=item.path):
+                return None
+        else:
+            self.add_tab(is_new_file=True)
+        editor = self.tab_manager.currentWidget()
+        return editor if isinstance(editor, CustomEditor) else None
+
+    def _recoverWhenLoaded(self, editor, item, name):
+        recovery = self.tab_manager.recovery
+
+        def finish(reason=None):
+            editor.loadFinished.disconnect(loaded)
+            editor.loadFailed.disconnect(failed)
+            if reason is None:
+                editor.replace_text(item.text)
+                recovery.applied(item)
+                self.statusBar().showMessage(f"Восстановлены несохраненные правки: {name}")
+            else:
+                self.statusBar().showMessage(f"Не удалось восстановить: {name} ({reason}). "
+                                             f"Журнал правок сохранен: {recovery.set_aside(item)}")
+
+        def loaded(complete):
+            finish(None if complete else "загрузка файла прервана")
+
+        def failed(message):
+            finish(f"файл не загружен: {message}")
+
+        editor.loadFinished.connect(loaded)
+        editor.loadFailed.connect(failed)
+
+    def saveSession(self):
+        session = self.tab_manager.session()
+        session['Корень дерева'] = self.project_root
+        self.settings.set('Сессия', session)
+
     def get_editors(self):
         """
         Возвращает список всех редакторов.
@@ -70,11 +234,13 @@ class CustomMainWindow(QMainWindow):
             self.tab_manager.widget(i) for i in range(self.tab_manager.count())
         ]
 
+    @traced
     def closeEvent(self, event):
         """
         Переопределение метода закрытия окна.
         """
         are_all_saved = all(e.file.saved for e in self.get_editors())
+        saved_all = discard = False
 
         if not are_all_saved:
             msgBox = QMessageBox()
@@ -93,15 +259,54 @@ class CustomMainWindow(QMainWindow):
             # 1 - Да
             # 2 - Нет
             if reply == 0:
-                for editor in self.get_editors():
-                    if not editor.file.saved:
-                        self.saveActionHandler(editor)
+                # Записи проверяются ниже вместе с начатыми раньше
+                self.saveAllActionHandler()
+                saved_all = True
                 event.accept()
             elif reply == 1:
+                discard = True
                 event.accept()
             else:
                 event.ignore()
 
+        if event.isAccepted():
+            # Файлы считаются сохраненными с момента снимка, дожидаемся самой записи.
+            # Файлы пишутся параллельно, поэтому ждем только самую долгую запись
+            failed = self.save_service.wait()
+            if failed:
+                for job in failed:
+                    self.markUnsaved(job.file)
+                QMessageBox.warning(
+                    self, "Ошибка",
+                    "Не удалось сохранить файлы: " + ", ".join(job.file.name for job in failed))
+                event.ignore()
+                return
+            # Изменения баз данных записываются, пока все вкладки еще работают: если запись
+            # не удалась, окно остается открытым. При выходе без сохранения они отбрасываются
+            for editor in self.get_editors():
+                if not isinstance(editor, DatabaseEditor) or editor.error_while_reading:
+                    continue
+                if discard:
+                    editor.database.discard()
+                    continue
+                # После "Сохранить" запись уже была, и оставшиеся изменения значат, что она не удалась
+                pending = editor.database.pending_count
+                if pending and (saved_all or not editor.database.flush()):
+                    event.ignore()
+                    return
+            self.saveSession()
+            self.project_index.close(wait=True)
+            self.search_dock.release()
+            self.run_dock.release()
+            self.profile_dock.release()
+            self.symbol_index.close(wait=True)
+            self.diagnostics.release()
+            self.tab_manager.recovery.close()
+            self.tab_manager.release()
+            # Общие подключения закрываются, когда вкладки баз данных уже отпустили их
+            registry.close_all()
+            tracer.close()
+
     def _createActions(self):
         """
         Описание действий, которые будут выполняться при нажатии на кнопки в меню, а так же
@@ -134,11 +339,31 @@ class CustomMainWindow(QMainWindow):
         self.openDirectoryAction.triggered.connect(
             self.openDirectoryActionHandler)
 
+        self.quickOpenAction = QAction("&Быстрое открытие...", self)
+        self.quickOpenAction.setShortcut(
+            self.settings.hotkeys_settings.get('Быстрое открытие', 'Ctrl+p'))
+        self.quickOpenAction.triggered.connect(self.quickOpenActionHandler)
+
+        self.searchAction = QAction("&Поиск в файлах...", self)
+        self.searchAction.setShortcut(
+            self.settings.hotkeys_settings.get('Поиск в файлах', 'Ctrl+Shift+f'))
+        self.searchAction.triggered.connect(self.searchActionHandler)
+
+        self.goToSymbolAction = QAction("&Переход к символу...", self)
+        self.goToSymbolAction.setShortcut(
+            self.settings.hotkeys_settings.get('Переход к символу', 'Ctrl+Shift+o'))
+        self.goToSymbolAction.triggered.connect(self.goToSymbolActionHandler)
+
         self.saveAction = QAction("&Сохранить", self)
         self.saveAction.setShortcut(
             self.settings.hotkeys_settings['Сохранить'])
         self.saveAction.triggered.connect(self.saveActionHandler)
 
+        self.saveAllAction = QAction("&Сохранить все", self)
+        self.saveAllAction.setShortcut(
+            self.settings.hotkeys_settings['Сохранить все'])
+        self.saveAllAction.triggered.connect(self.saveAllActionHandler)
+
         self.saveAsAction = QAction("&Сохранить как...", self)
         self.saveAsAction.setShortcut(
             self.settings.hotkeys_settings['Сохранить как'])
@@ -162,12 +387,88 @@ class CustomMainWindow(QMainWindow):
             self.settings.hotkeys_settings['Запуск файла'])
         self.runAction.triggered.connect(self.runActionHandler)
 
+        self.stopRunAction = QAction("&Остановить запуск", self)
+        self.stopRunAction.setShortcut(
+            self.settings.hotkeys_settings.get('Остановить запуск', 'Ctrl+f8'))
+        self.stopRunAction.triggered.connect(self.run_dock.stop)
+        self.stopRunAction.setEnabled(False)
+
+        self.restartRunAction = QAction("&Перезапустить", self)
+        self.restartRunAction.setShortcut(
+            self.settings.hotkeys_settings.get('Перезапустить', 'Ctrl+Shift+f8'))
+        self.restartRunAction.triggered.connect(self.run_dock.restart)
+        self.restartRunAction.setEnabled(False)
+
+        self.profileAction = QAction("&Профилировать", self)
+        self.profileAction.setShortcut(
+            self.settings.hotkeys_settings.get('Профилирование', 'Ctrl+f9'))
+        self.profileAction.triggered.connect(self.profileActionHandler)
+
+        self.benchmarkAction = QAction("&Замерить время", self)
+        self.benchmarkAction.setShortcut(
+            self.settings.hotkeys_settings.get('Замер времени', 'Ctrl+Shift+f9'))
+        self.benchmarkAction.triggered.connect(self.benchmarkActionHandler)
+
+        self.traceAction = QAction("&Трассировка задержек", self)
+        self.traceAction.setCheckable(True)
+        self.traceAction.setChecked(tracer.enabled)
+        self.traceAction.setShortcut(
+            self.settings.hotkeys_settings.get('Трассировка задержек', 'Ctrl+Alt+t'))
+        self.traceAction.toggled.connect(tracer.set_enabled)
+
+        self.exportTraceAction = QAction("&Сохранить трассировку...", self)
+        self.exportTraceAction.triggered.connect(self.exportTraceActionHandler)
+
         self.helpContentAction = QAction("&Документация", self)
         self.aboutAction = QAction("&О редакторе", self)
         self.aboutAction.setShortcut(
             self.settings.hotkeys_settings['О редакторе'])
         self.aboutAction.triggered.connect(self.aboutActionHandler)
 
+    def _subscribeSettings(self):
+        """
+        Подписывает окно на изменения настроек, чтобы применять их без перезапуска.
+        """
+        self.settings.subscribe('Горячие клавиши', self.applyHotkeys)
+        self.settings.subscribe('Профили SQLite', registry.configure)
+        self.settings.subscribe('Языки', lexer_registry.configure)
+        self.settings.subscribe('Порог больших файлов (МБ)', self.setLargeFileThreshold)
+        self.settings.subscribe('Память вкладок (МБ)', self.setTabMemoryBudget)
+
+    def applyHotkeys(self, hotkeys):
+        actions = {
+            'Создать новый файл': self.newAction,
+            'Создать новую базу данных': self.newDatabaseAction,
+            'Новое окно': self.newWindowAction,
+            'Открыть файл': self.openAction,
+            'Открыть директорию': self.openDirectoryAction,
+            'Быстрое открытие': self.quickOpenAction,
+            'Поиск в файлах': self.searchAction,
+            'Переход к символу': self.goToSymbolAction,
+            'Сохранить': self.saveAction,
+            'Сохранить все': self.saveAllAction,
+            'Сохранить как': self.saveAsAction,
+            'Закрыть файл': self.closeAction,
+            'Выйти': self.exitAction,
+            'Запуск файла': self.runAction,
+            'Остановить запуск': self.stopRunAction,
+            'Перезапустить': self.restartRunAction,
+            'Профилирование': self.profileAction,
+            'Замер времени': self.benchmarkAction,
+            'О редакторе': self.aboutAction,
+            'Трассировка задержек': self.traceAction,
+        }
+        for name, action in actions.items():
+            if name in (hotkeys or {}):
+                action.setShortcut(hotkeys[name])
+
+    def setLargeFileThreshold(self, threshold):
+        self.tab_manager.large_file_threshold = threshold or 512
+
+    def setTabMemoryBudget(self, budget):
+        self.tab_manager.memory_budget = budget or 512
+        self.tab_manager.enforce_memory_budget()
+
     def _createMenuBar(self):
         """
         _createMenuBar создает меню и добавляет в них действия.
@@ -181,6 +482,7 @@ class CustomMainWindow(QMainWindow):
         fileMenu.addSeparator()
         fileMenu.addAction(self.openAction)
         fileMenu.addAction(self.openDirectoryAction)
+        fileMenu.addAction(self.quickOpenAction)
 
         self.openRecentMenu = fileMenu.addMenu("&Открыть последние")
         self.openRecentMenu.aboutToShow.connect(self.populateOpenRecent)
@@ -188,6 +490,7 @@ class CustomMainWindow(QMainWindow):
         fileMenu.addSeparator()
         fileMenu.addAction(self.saveAction)
         fileMenu.addAction(self.saveAsAction)
+        fileMenu.addAction(self.saveAllAction)
         fileMenu.addAction(self.closeAction)
         fileMenu.addSeparator()
         fileMenu.addAction(self.exitAction)
@@ -196,12 +499,24 @@ class CustomMainWindow(QMainWindow):
         editMenu.addAction(self.copyAction)
         editMenu.addAction(self.pasteAction)
         editMenu.addAction(self.cutAction)
+        editMenu.addSeparator()
+        editMenu.addAction(self.searchAction)
+        editMenu.addAction(self.goToSymbolAction)
+        editMenu.addAction(self.outline_dock.toggleViewAction())
 
         editMenu = menuBar.addMenu("&Запуск")
         editMenu.addAction(self.runAction)
+        editMenu.addAction(self.stopRunAction)
+        editMenu.addAction(self.restartRunAction)
+        editMenu.addSeparator()
+        editMenu.addAction(self.profileAction)
+        editMenu.addAction(self.benchmarkAction)
 
         helpMenu = menuBar.addMenu("&Справка")
         helpMenu.addAction(self.aboutAction)
+        helpMenu.addSeparator()
+        helpMenu.addAction(self.traceAction)
+        helpMenu.addAction(self.exportTraceAction)
 
     def populateOpenRecent(self):
         """
@@ -209,11 +524,11 @@ class CustomMainWindow(QMainWindow):
         """
         self.openRecentMenu.clear()
         actions = []
-        self.settings.refresh()
         paths = self.settings.recent_files
         for path in paths:
             action = QAction(path, self)
-            action.triggered.connect(partial(self.openActionHandler, path))
+            # triggered передает флаг checked, и он не должен попасть в номер строки
+            action.triggered.connect(lambda checked=False, path=path: self.openActionHandler(path))
             actions.append(action)
         self.openRecentMenu.addActions(actions)
 
@@ -222,9 +537,8 @@ class CustomMainWindow(QMainWindow):
         """
         openFromTree открывает файл, который был выбран в дереве файлов.
         """
-        ix = self.file_tree.proxy.mapToSource(index)
-        path = ix.data(QFileSystemModel.Roles.FilePathRole)
-        if not os.path.isdir(path):
+        path = self.file_tree.file_path(index)
+        if path and not os.path.isdir(path):
             self.openActionHandler(path)
 
     def add_recent(self):
@@ -248,12 +562,18 @@ class CustomMainWindow(QMainWindow):
         """
         remove_tab удаляет вкладку с индексом idx.
         """
+        editor = self.tab_manager.widget(idx)
+        if isinstance(editor, DatabaseEditor) and not editor.error_while_reading \
+                and not editor.database.flush():
+            # Вкладка остается открытой, чтобы несохраненные изменения не пропали
+            return
         self.tab_manager.removeTab(idx)
 
         if self.tab_manager.count() == 0:
             self.placeholder.setVisible(True)
             self.tab_manager.setVisible(False)
 
+    @traced
     def newActionHandler(self):
         """
         The newActionHandler function creates a new file in the editor.
@@ -264,12 +584,13 @@ class CustomMainWindow(QMainWindow):
         """
         newDatabaseActionHandler создает новую базу данных.
         """
-        import sqlite3
         path = QFileDialog.getSaveFileName(
             self, "Создать базу данных", "", "База данных (*.db)")[0]
         if path:
-            sqlite3.connect(path)
+            # Подключение держится, пока файл открывается во вкладке, и переиспользуется ей
+            registry.acquire(path)
             self.openActionHandler(path)
+            registry.release(path)
         else:
             QMessageBox.warning(self, "Ошибка", "Не удалось создать базу данных")
 
@@ -279,19 +600,42 @@ class CustomMainWindow(QMainWindow):
         """
         raise NotImplementedError
 
-    def openActionHandler(self, file_path=None):
+    @traced
+    def openActionHandler(self, file_path=None, line=None):
         """
         openActionHandler открывает диалоговое окно выбора файла и открывает его в редакторе, или
         открывает файл, который был передан в качестве аргумента.
+        Если передан номер строки `line` (с нуля), курсор ставится на нее, а уже открытый
+        файл не открывается повторно.
         Так же является обработчиком действия "Открыть файл".
         """
         if not file_path:
             file_path, _ = self.choose_file()
 
-        if file_path:
-            if self.add_tab(path=file_path):
-                self.add_recent()
-                self.tab_manager.currentWidget().file.saved = True
+        if not file_path:
+            return
+        index = self.find_tab(file_path) if line is not None else -1
+        if index != -1:
+            self.tab_manager.setCurrentIndex(index)
+        elif self.add_tab(path=file_path):
+            self.add_recent()
+            self.tab_manager.currentWidget().file.saved = True
+        else:
+            return
+
+        if line is not None:
+            self.goToLine(line)
+
+    def find_tab(self, file_path) -> int:
+        """
+        Возвращает индекс вкладки с файлом `file_path` или -1.
+        """
+        file_path = os.path.normcase(os.path.abspath(file_path))
+        for index in range(self.tab_manager.count()):
+            path = self.tab_manager.widget(index).file.path
+            if path and os.path.normcase(os.path.abspath(path)) == file_path:
+                return index
+        return -1
 
     def choose_directory(self):
         directory = QFileDialog.getExistingDirectory(self, "Выберите папку",
@@ -305,20 +649,103 @@ class CustomMainWindow(QMainWindow):
         """
         directory = self.choose_directory()
         if directory:
-            self.file_tree = FileTree(directory)
-            self.file_tree.doubleClicked.connect(self.openFromTree)
-            self.directory_sidebar.setWidget(self.file_tree)
-            self.directory_sidebar.setVisible(True)
+            self.open_directory(directory)
+
+    @traced
+    def open_directory(self, directory):
+        """
+        Открывает папку в дереве файлов в док панели.
+        """
+        self.project_root = directory
+        self.project_index.open(directory)
+        # Дерево использует те же правила исключения, что и индекс проекта
+        self.file_tree.set_root(directory, self.project_index.rules)
+        self.directory_sidebar.setVisible(True)
+
+    @traced
+    def quickOpenActionHandler(self):
+        """
+        Показывает окно быстрого открытия файла из открытой папки.
+        Так же является обработчиком действия "Быстрое открытие".
+        """
+        if not self.project_root:
+            QMessageBox.information(self, "Быстрое открытие", "Сначала откройте папку проекта")
+            return
+        self.quick_open.popup()
+
+    @traced
+    def searchActionHandler(self):
+        """
+        Показывает панель поиска по файлам открытой папки, подставляя выделенный текст.
+        Так же является обработчиком действия "Поиск в файлах".
+        """
+        if not self.project_root:
+            QMessageBox.information(self, "Поиск в файлах", "Сначала откройте папку проекта")
+            return
+        text = ''
+        editor = self.tab_manager.currentWidget()
+        if isinstance(editor, CustomEditor) and editor.hasSelectedText():
+            text = editor.selectedText().split('\n', 1)[0]
+        self.search_dock.focus_query(text)
+
+    @traced
+    def goToSymbolActionHandler(self):
+        """
+        Показывает окно перехода к классу или функции открытого файла или проекта.
+        Так же является обработчиком действия "Переход к символу".
+        """
+        self._showOutlineOfCurrent()
+        editor = self.tab_manager.currentWidget()
+        self.go_to_symbol.popup(editor.file.path if editor else None)
+
+    def symbolChosenHandler(self, path, line):
+        if path is None:
+            # Символ несохраненного файла, он может быть только открытым
+            self.goToLine(line)
+        else:
+            self.openActionHandler(path, line)
+
+    def goToLine(self, line):
+        """
+        Ставит курсор открытого файла на строку `line` (с нуля).
+        """
+        widget = self.tab_manager.currentWidget()
+        if hasattr(widget, 'restore_view_state'):
+            widget.restore_view_state({'Курсор': [line, 0], 'Первая строка': max(0, line - 5)})
+            widget.setFocus()
+
+    @traced
+    def _showOutlineOfCurrent(self, *args):
+        editor = self.tab_manager.currentWidget()
+        if isinstance(editor, CustomEditor) and editor.file.extention == '.py':
+            self.outline_dock.show_document(self.symbol_index.document(editor))
+        else:
+            self.outline_dock.show_document(None)
+
+    @traced
+    def _checkCurrent(self, *args):
+        editor = self.tab_manager.currentWidget()
+        self.diagnostics.attach(editor if isinstance(editor, CustomEditor) else None)
 
     def openRecentActionHandler(self):
         pass
 
-    def saveFile(self):
+    @traced
+    def saveFile(self, editor=None):
         """
         saveFile сохраняет файл в зависимости от его типа: новый или уже сущестующий.
         Так же является обработчиком действия "Сохранить".
         """
-        editor = self.tab_manager.currentWidget()
+        if not editor:
+            editor = self.tab_manager.currentWidget()
+        if not isinstance(editor, CustomEditor):
+            # Вкладки баз данных сохраняют накопленные изменения сами
+            if hasattr(editor, 'apply'):
+                editor.apply()
+            return
+        if editor.isReadOnly():
+            # Не до конца загруженный текст нельзя записывать поверх файла
+            return
         if editor.file.new:
             self.tab_manager.currentWidget().reload_lexer(
                 editor.file.extention)
@@ -328,32 +755,137 @@ class CustomMainWindow(QMainWindow):
 
         code = editor.text()
         code = code.replace('\r', '')
-        editor.file.save(code)
-
+        self.tab_manager.document_tracker.expect(editor.file.path, code)
+        # Точка сохранения ставится на записываемый снимок текста
+        editor.setModified(False)
+        self.save_service.save(editor.file, code)
+
+    @traced
+    def saveAllActionHandler(self):
+        """
+        Сохраняет все измененные файлы. Уже существующие файлы записываются параллельно,
+        для новых файлов по очереди спрашивается путь.
+        Так же является обработчиком действия "Сохранить все".
+
+        :return: Задачи записи, запущенные параллельно
+        """
+        snapshots = []
+        for editor in self.get_editors():
+            if editor.file.saved:
+                continue
+            if not isinstance(editor, CustomEditor) or editor.file.new:
+                self.saveActionHandler(editor)
+            elif not editor.isReadOnly():
+                code = editor.text().replace('\r', '')
+                self.tab_manager.document_tracker.expect(editor.file.path, code)
+                editor.setModified(False)
+                snapshots.append((editor.file, code))
+        return self.save_service.save_all(snapshots)
+
+    def find_editor(self, file):
+        """
+        Возвращает вкладку, которой принадлежит объект `File`, или None.
+        """
+        for editor in self.get_editors():
+            if editor.file is file:
+                return editor
+        return None
+
+    def savedHandler(self, file):
+        editor = self.find_editor(file)
+        if isinstance(editor, CustomEditor):
+            # Пока файл записывался, текст могли изменить еще раз
+            file.saved = not editor.isModified()
+            self.tab_manager.document_tracker.track(editor)
+
+    def markUnsaved(self, file):
+        """
+        Снова помечает файл несохраненным после неудачной записи. Точка сохранения
+        уже стоит на записываемом снимке, поэтому без этого вкладку можно было бы
+        выгрузить или перечитать с диска, а журнал правок был бы уже удален.
+        """
+        file.saved = False
+        editor = self.find_editor(file)
+        if isinstance(editor, CustomEditor) and not editor.isReadOnly():
+            self.tab_manager.recovery.restart(editor)
+            editor.setModified(True)
+
+    def saveFailedHandler(self, file, message):
+        self.markUnsaved(file)
+        QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить {file.name}: {message}")
+
+    @traced
     def runActionHandler(self):
         """
         Запуск файла в соответствии с его расширением.
         Так же является обработчиком действия "Запустить".
         """
-        if editor := self.tab_manager.currentWidget():
-            file = editor.file
-            command = self.settings.run_settings.get(file.extention[1:], None)
-            if command:
-                self.saveActionHandler()
-                command = command.replace('$file_path', file.path)
-                subprocess.Popen('start /wait ' + command,
-                                 shell=True,
-                                 creationflags=subprocess.CREATE_NEW_CONSOLE)
-            else:
-                msg = QMessageBox()
-                msg.setIcon(QMessageBox.Icon.Warning)
-                msg.setText(
-                    "Нет настроек запуска для данного файла. Их можно установить в файле settings.json в папке редактора."
-                )
-                msg.setWindowTitle("Ошибка")
-                msg.setStandardButtons(QMessageBox.StandardButton.Ok)
-                msg.exec()
+        if prepared := self._prepareRun():
+            command, file = prepared
+            self.run_dock.start(command, file.path)
 
+    @traced
+    def profileActionHandler(self):
+        """
+        Запуск Python файла под cProfile с таблицей самых затратных функций.
+        Так же является обработчиком действия "Профилировать".
+        """
+        editor = self.tab_manager.currentWidget()
+        if editor and editor.file.extention != '.py':
+            QMessageBox.information(self, "Профилирование", "Профилировать можно только файлы Python")
+            return
+        if prepared := self._prepareRun():
+            command, file = prepared
+            self.profile_dock.profile(command, file.path)
+
+    @traced
+    def benchmarkActionHandler(self):
+        """
+        Замер времени нескольких запусков файла.
+        Так же является обработчиком действия "Замерить время".
+        """
+        if prepared := self._prepareRun():
+            command, file = prepared
+            self.profile_dock.benchmark(command, file.path, self.settings.benchmark_repeats)
+
+    def _showProfileOfCurrent(self, index):
+        editor = self.tab_manager.widget(index)
+        if self.profile_dock.isVisible() and editor and editor.file.path:
+            self.profile_dock.show_file(editor.file.path)
+
+    def _prepareRun(self):
+        """
+        Сохраняет открытый файл и возвращает команду его запуска и сам файл,
+        или None, если запускать нечего.
+        """
+        editor = self.tab_manager.currentWidget()
+        if not editor:
+            return None
+        file = editor.file
+        command = self.settings.run_settings.get((file.extention or '')[1:], None)
+        if not command:
+            msg = QMessageBox()
+            msg.setIcon(QMessageBox.Icon.Warning)
+            msg.setText(
+                "Нет настроек запуска для данного файла. Их можно установить в файле settings.json в папке редактора."
+            )
+            msg.setWindowTitle("Ошибка")
+            msg.setStandardButtons(QMessageBox.StandardButton.Ok)
+            msg.exec()
+            return None
+        self.saveActionHandler()
+        # Запускать нужно уже записанный файл
+        self.save_service.wait()
+        if file.new:
+            return None
+        return command, file
+
+    def _updateRunActions(self):
+        view = self.run_dock.current()
+        self.stopRunAction.setEnabled(bool(view and view.run.running))
+        self.restartRunAction.setEnabled(view is not None)
+
+    @traced
     def saveActionHandler(self, editor=None):
         """
         Сохранение файла в запрошенной директории, а так же обработчик действия "Сохранить как"
@@ -365,10 +897,11 @@ class CustomMainWindow(QMainWindow):
             file_path, _ = self.choose_file_save()
             if file_path:
                 editor.file.update_path(file_path)
-                self.saveFile()
+                self.saveFile(editor)
         else:
-            self.saveFile()
+            self.saveFile(editor)
 
+    @traced
     def saveAsActionHandler(self):
         """
         Сохранение файла с выбором пути, а так же обработчик действия "Сохранить как"
@@ -376,9 +909,12 @@ class CustomMainWindow(QMainWindow):
         editor = self.tab_manager.currentWidget()
         file_path, _ = self.choose_file_save()
         if file_path:
+            # За старым файлом больше не следим, за новым начнем после записи
+            self.tab_manager.document_tracker.untrack(editor)
             editor.file.update_path(file_path)
-            self.saveFile(file_path)
+            self.saveFile(editor)
 
+    @traced
     def closeActionHandler(self):
         """
         Метод закрытия файла, а так же обработчик действия "Закрыть"
@@ -403,6 +939,23 @@ class CustomMainWindow(QMainWindow):
         """
         self.tab_manager.currentWidget().cut()
 
+    def exportTraceActionHandler(self):
+        """
+        Сохраняет записанную трассировку в формате Chrome trace event.
+        """
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Сохранить трассировку", "trace.json", "Chrome trace (*.json)")
+        if not path:
+            return
+        try:
+            tracer.export(path)
+        except OSError as e:
+            QMessageBox.warning(self, "Ошибка", f"Не удалось сохранить трассировку: {e}")
+            return
+        self.statusBar().showMessage(
+            f"Трассировка сохранена: событий {len(tracer.events)}, медленных кадров {tracer.slow_frames}, "
+            f"наибольшая задержка {tracer.max_lag_ms:.0f} мс", 10000)
+
     def aboutActionHandler(self):
         """
         The aboutActionHandler function displays a message box containing information about the editor.